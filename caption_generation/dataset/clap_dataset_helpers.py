@@ -1,10 +1,11 @@
 NORMALIZING_INPUT = True  # Flag for normalization
 MAX_TOKENS = 64
 
-import librosa
 import numpy as np
 import pandas as pd
 from torch.utils.data import Dataset
+from profiling import StageTimer
+from resampling import load_audio
 
 def preprocess_audio(audio_path):
     """
@@ -14,18 +15,25 @@ def preprocess_audio(audio_path):
     Returns:
         np.ndarray: Preprocessed audio data.
     """
-    # Load the audio file
-    audio, sr = librosa.load(audio_path, sr=48000)
-
-    # Convert stereo to mono if necessary
-    if audio.ndim == 2:  # Stereo audio
-        audio = audio.mean(axis=1)  # Average the two channels
+    # Load the audio file as mono, resampled to 48 kHz
+    audio, sr = load_audio(audio_path, 48000)
+    return normalize_audio(audio), sr
 
+def normalize_audio(audio):
+    """Apply the input scaling the CLAP models were trained with to a decoded waveform."""
     # Normalize audio to the range [-1, 1] if required
     if NORMALIZING_INPUT:
         audio = audio.astype(np.float32) / np.iinfo(np.int16).max
+    return audio
 
-    return audio, sr
+def prepare_inputs(audio, sample_rate, processor):
+    """
+    Run the CLAP feature extractor on a preprocessed waveform.
+    Returns:
+        dict: The audio entries of a dataset item.
+    """
+    inputs = processor(audios=audio, return_tensors="pt", sampling_rate=sample_rate)
+    return {"inputs": inputs}
 
 # Dataset class
 class AudioCaptionDataset(Dataset):
@@ -33,6 +41,7 @@ class AudioCaptionDataset(Dataset):
         self.data = pd.read_csv(data_path)
         self.processor = processor
         self.tokenizer = tokenizer
+        self.timer = StageTimer()  # Replaced by the training script when profiling
 
     def __len__(self):
         return len(self.data)
@@ -43,17 +52,17 @@ class AudioCaptionDataset(Dataset):
         caption = row["caption"]
 
         # Load and preprocess audio
-        processed_audio, sample_rate = preprocess_audio(audio_path)
+        with self.timer.section("decode"):
+            processed_audio, sample_rate = preprocess_audio(audio_path)
         if sample_rate != 48000:
             raise ValueError(f"Invalid sample rate: {sample_rate}. Expected 48000 Hz.")
         
-        inputs = self.processor(audios=processed_audio, return_tensors="pt", sampling_rate=sample_rate)
+        with self.timer.section("processor"):
+            item = prepare_inputs(processed_audio, sample_rate, self.processor)
 
         # Tokenize caption
         labels = self.tokenizer(caption, return_tensors="pt", padding="max_length", truncation=True, max_length=MAX_TOKENS)
 
-        return {
-            "inputs": inputs,
-            "labels": labels["input_ids"].squeeze(0),
-            "decoder_attention_mask": labels["attention_mask"].squeeze(0)
-        }
\ No newline at end of file
+        item["labels"] = labels["input_ids"].squeeze(0)
+        item["decoder_attention_mask"] = labels["attention_mask"].squeeze(0)
+        return item
\ No newline at end of file
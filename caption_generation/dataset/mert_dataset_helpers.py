@@ -3,8 +3,8 @@ MAX_TOKENS = 64
 
 import pandas as pd
 from torch.utils.data import Dataset
-import torchaudio
-import torchaudio.transforms as T
+from profiling import StageTimer
+from resampling import load_audio
 
 def preprocess_audio(audio_path, processor):
     """
@@ -14,27 +14,19 @@ def preprocess_audio(audio_path, processor):
     Returns:
         np.ndarray: Preprocessed audio data.
     """
-    # Load the audio file
-    waveform, sample_rate = torchaudio.load(audio_path)
+    # Load the audio file as mono, resampled to the processor's rate (already in [-1, 1])
+    waveform, sample_rate = load_audio(audio_path, processor.sampling_rate)
 
-    if sample_rate != processor.sampling_rate:
-        # print(f"resampling from {sample_rate} to {processor.sampling_rate}")
-        resampler = T.Resample(orig_freq=sample_rate, new_freq=processor.sampling_rate)
-        waveform = resampler(waveform)
+    return waveform, sample_rate
 
-    # Convert stereo to mono if necessary
-    if waveform.ndim == 2:  # Stereo audio
-        waveform = waveform.mean(axis=0)  # Average the two channels
-
-    # Normalize audio to the range [-1, 1] if required
-    # if NORMALIZING_INPUT:
-    #     waveform = waveform.astype(np.float32) / np.iinfo(np.int16).max
-
-    waveform = waveform.squeeze().numpy()
-    # print(f"Waveform type: {type(waveform)}, shape: {waveform.shape}")
-
-    # print(f"mert {processor.sampling_rate}")
-    return waveform, processor.sampling_rate
+def prepare_inputs(audio, sample_rate, processor):
+    """
+    Run the MERT feature extractor on a preprocessed waveform.
+    Returns:
+        dict: The audio entries of a dataset item.
+    """
+    input = processor(audio, sampling_rate=sample_rate, return_tensors="pt")
+    return {"inputs": input}
 
 # Dataset class
 class AudioCaptionDataset(Dataset):
@@ -42,6 +34,7 @@ class AudioCaptionDataset(Dataset):
         self.data = pd.read_csv(data_path)
         self.processor = processor
         self.tokenizer = tokenizer
+        self.timer = StageTimer()  # Replaced by the training script when profiling
 
     def __len__(self):
         return len(self.data)
@@ -52,16 +45,16 @@ class AudioCaptionDataset(Dataset):
         caption = row["caption"]
 
         # Load and preprocess audio
-        processed_audio, sample_rate = preprocess_audio(audio_path, self.processor)
+        with self.timer.section("decode"):
+            processed_audio, sample_rate = preprocess_audio(audio_path, self.processor)
         # print(f"processed_audio.shape: {processed_audio.shape}")
 
-        input = self.processor(processed_audio, sampling_rate=sample_rate, return_tensors="pt")
+        with self.timer.section("processor"):
+            item = prepare_inputs(processed_audio, sample_rate, self.processor)
 
         # Tokenize caption
         labels = self.tokenizer(caption, return_tensors="pt", padding="max_length", truncation=True, max_length=MAX_TOKENS)
 
-        return {
-            "inputs": input,
-            "labels": labels["input_ids"].squeeze(0),
-            "decoder_attention_mask": labels["attention_mask"].squeeze(0)
-        }
\ No newline at end of file
+        item["labels"] = labels["input_ids"].squeeze(0)
+        item["decoder_attention_mask"] = labels["attention_mask"].squeeze(0)
+        return item
\ No newline at end of file
@@ -6,12 +6,15 @@ import numpy as np
 import pandas as pd
 import torch
 from torch.utils.data import Dataset
+from profiling import StageTimer
+from resampling import resample
 
-def preprocess_audio(audio_path):
+def preprocess_audio(audio_path, target_sample_rate=16000):
     """
-    Preprocess audio file to ensure it is mono and normalized.
+    Preprocess audio file to ensure it is mono, normalized and at the target sample rate.
     Args:
         audio_path (str): Path to the audio file.
+        target_sample_rate (int): Rate Wav2Vec2 was trained on.
     Returns:
         np.ndarray: Preprocessed audio data.
     """
@@ -26,7 +29,27 @@ def preprocess_audio(audio_path):
     if NORMALIZING_INPUT:
         audio = audio.astype(np.float32) / np.iinfo(np.int16).max
 
-    return audio, sample_rate
+    # Resample instead of rejecting clips that were not written at 16 kHz
+    audio = resample(audio, sample_rate, target_sample_rate)
+
+    return audio, target_sample_rate
+
+def prepare_inputs(audio, sample_rate, processor):
+    """
+    Run the Wav2Vec2 processor on a preprocessed waveform.
+    Returns:
+        dict: The audio entries of a dataset item.
+    """
+    inputs = processor(audio, sampling_rate=sample_rate, return_tensors="pt")
+
+    # Check if attention_mask is present
+    input_values = inputs["input_values"].squeeze(0)
+    attention_mask = inputs.get("attention_mask", torch.ones_like(input_values))  # Default to ones if missing
+
+    return {
+        "input_values": input_values,
+        "attention_mask": attention_mask,
+    }
 
 # Dataset class
 class AudioCaptionDataset(Dataset):
@@ -34,6 +57,7 @@ class AudioCaptionDataset(Dataset):
         self.data = pd.read_csv(data_path)
         self.processor = processor
         self.tokenizer = tokenizer
+        self.timer = StageTimer()  # Replaced by the training script when profiling
 
     def __len__(self):
         return len(self.data)
@@ -44,22 +68,15 @@ class AudioCaptionDataset(Dataset):
         caption = row["caption"]
 
         # Load and preprocess audio
-        processed_audio, sample_rate = preprocess_audio(audio_path)
-        if sample_rate != 16000:
-            raise ValueError(f"Invalid sample rate: {sample_rate}. Expected 16000 Hz.")
+        with self.timer.section("decode"):
+            processed_audio, sample_rate = preprocess_audio(audio_path)
         
-        inputs = self.processor(processed_audio, sampling_rate=sample_rate, return_tensors="pt")
+        with self.timer.section("processor"):
+            item = prepare_inputs(processed_audio, sample_rate, self.processor)
 
         # Tokenize caption
         labels = self.tokenizer(caption, return_tensors="pt", padding="max_length", truncation=True, max_length=MAX_TOKENS)
 
-        # Check if attention_mask is present
-        input_values = inputs["input_values"].squeeze(0)
-        attention_mask = inputs.get("attention_mask", torch.ones_like(input_values))  # Default to ones if missing
-
-        return {
-            "input_values": input_values,
-            "attention_mask": attention_mask,
-            "labels": labels["input_ids"].squeeze(0),
-            "decoder_attention_mask": labels["attention_mask"].squeeze(0)
-        }
\ No newline at end of file
+        item["labels"] = labels["input_ids"].squeeze(0)
+        item["decoder_attention_mask"] = labels["attention_mask"].squeeze(0)
+        return item
\ No newline at end of file
@@ -0,0 +1,77 @@
+import os
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+
+def launch(main_fn, world_size, args):
+    """
+    Run `main_fn(rank, world_size, args)` in `world_size` processes, or inline
+    when world_size is 1 so single-process training is unchanged.
+    """
+    if world_size == 1:
+        main_fn(0, 1, args)
+    else:
+        mp.spawn(main_fn, args=(world_size, args), nprocs=world_size, join=True)
+
+def setup(rank, world_size, master_port=29500):
+    """Join the gloo process group; a no-op for single-process runs."""
+    if world_size == 1:
+        return
+    os.environ.setdefault("MASTER_ADDR", "127.0.0.1")
+    os.environ.setdefault("MASTER_PORT", str(master_port))
+    dist.init_process_group("gloo", rank=rank, world_size=world_size)
+
+def cleanup(world_size):
+    if world_size > 1:
+        dist.destroy_process_group()
+
+def pin_threads(rank, world_size, threads_per_rank=None):
+    """
+    Give each rank a disjoint slice of the CPUs this process may run on and
+    size its intra-op thread pool to match, so ranks do not oversubscribe cores.
+    Returns:
+        list: The CPUs this rank is pinned to.
+    """
+    cpus = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count()))
+    threads_per_rank = threads_per_rank or max(1, len(cpus) // world_size)
+    start = (rank * threads_per_rank) % len(cpus)
+    rank_cpus = [cpus[(start + i) % len(cpus)] for i in range(min(threads_per_rank, len(cpus)))]
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, rank_cpus)
+    torch.set_num_threads(len(rank_cpus))
+    return rank_cpus
+
+def is_main_process(rank):
+    return rank == 0
+
+def barrier(world_size):
+    if world_size > 1:
+        dist.barrier()
+
+def all_reduce_sum(values, world_size):
+    """
+    Sum a list of floats across ranks.
+    Returns:
+        list: The summed values (unchanged for single-process runs).
+    """
+    if world_size == 1:
+        return list(values)
+    tensor = torch.tensor(values, dtype=torch.float64)
+    dist.all_reduce(tensor, op=dist.ReduceOp.SUM)
+    return tensor.tolist()
+
+def all_gather_objects(obj, world_size):
+    """
+    Gather one picklable object from every rank.
+    Returns:
+        list: Objects indexed by rank.
+    """
+    if world_size == 1:
+        return [obj]
+    gathered = [None] * world_size
+    dist.all_gather_object(gathered, obj)
+    return gathered
+
+def unwrap(model):
+    """Return the underlying module of a DistributedDataParallel wrapper."""
+    return model.module if isinstance(model, torch.nn.parallel.DistributedDataParallel) else model
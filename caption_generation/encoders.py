@@ -0,0 +1,29 @@
+import numpy as np
+from transformers import AutoProcessor, Wav2Vec2FeatureExtractor, Wav2Vec2Processor
+from models import ClapT5Model, MertT5Model, Wav2Vec2T5Model
+from dataset import clap_dataset_helpers, mert_dataset_helpers, wav2vec2_dataset_helpers
+
+# Encoders shared by the multi-encoder scripts (scripts/compare.py, scripts/benchmark.py)
+ENCODERS = ["clap", "mert", "wav2vec2"]
+SAMPLE_RATES = {"clap": 48000, "mert": 24000, "wav2vec2": 16000}
+DATASET_HELPERS = {"clap": clap_dataset_helpers, "mert": mert_dataset_helpers, "wav2vec2": wav2vec2_dataset_helpers}
+CLIP_SECONDS = 10
+
+def build_model(encoder_name, device="cpu", frozen=False, num_layers=None):
+    """
+    Same components as scripts/train.py and scripts/test.py.
+    Returns:
+        tuple: (model, processor)
+    """
+    if encoder_name == "clap":
+        return ClapT5Model(device, frozen=frozen), AutoProcessor.from_pretrained("laion/larger_clap_music")
+    elif encoder_name == "mert":
+        return MertT5Model(device, frozen=frozen, num_layers=num_layers), Wav2Vec2FeatureExtractor.from_pretrained("m-a-p/MERT-v1-95M")
+    elif encoder_name == "wav2vec2":
+        return Wav2Vec2T5Model(device, frozen=frozen, num_layers=num_layers), Wav2Vec2Processor.from_pretrained("facebook/wav2vec2-base-960h")
+    raise ValueError("Invalid embedding model specified.")
+
+def fit_length(audio, num_samples):
+    """Crop or zero-pad a waveform so every clip in a batch has the same length."""
+    audio = np.asarray(audio, dtype=np.float32)[:num_samples]
+    return np.pad(audio, (0, num_samples - len(audio)))
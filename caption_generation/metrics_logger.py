@@ -0,0 +1,89 @@
+import json
+import os
+import platform
+import resource
+import time
+import torch
+
+class MetricsLogger:
+    """
+    Buffered JSONL log of per-step and per-epoch scalars. log_step/log_epoch only
+    append a dict to an in-memory buffer; records are serialized and written in
+    one append every `flush_every` records or `flush_interval_s` seconds, and on
+    close(). Plot with `python -m scripts.plot`.
+
+    Each line is {"kind": "step" | "epoch", "run": ..., "time": ..., <scalars>}.
+    """
+
+    def __init__(self, path, run_name=None, flush_every=200, flush_interval_s=30.0, enabled=True):
+        self.path = path
+        self.run_name = run_name or os.path.basename(os.path.dirname(os.path.abspath(path)))
+        self.flush_every = flush_every
+        self.flush_interval_s = flush_interval_s
+        self.enabled = enabled
+        self._buffer = []
+        self._last_flush = time.monotonic()
+        if enabled:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def _append(self, kind, scalars):
+        if not self.enabled:
+            return
+        self._buffer.append({"kind": kind, "run": self.run_name, "time": time.time(), **scalars})
+        if len(self._buffer) >= self.flush_every or time.monotonic() - self._last_flush >= self.flush_interval_s:
+            self.flush()
+
+    def log_step(self, step, **scalars):
+        self._append("step", {"step": step, **scalars})
+
+    def log_epoch(self, epoch, **scalars):
+        self._append("epoch", {"epoch": epoch, **scalars})
+        self.flush()  # Epoch records are rare and the most valuable after a crash
+
+    def flush(self):
+        if self._buffer:
+            with open(self.path, "a") as f:
+                f.write("".join(json.dumps(record) + "\n" for record in self._buffer))
+            self._buffer = []
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def system_metrics(optimizer=None):
+    """Learning rate, peak RSS and (on CUDA) peak allocated memory, for epoch records."""
+    metrics = {}
+    if optimizer is not None:
+        metrics["lr"] = optimizer.param_groups[0]["lr"]
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    metrics["peak_rss_mb"] = rss / 2 ** 20 if platform.system() == "Darwin" else rss / 2 ** 10
+    if torch.cuda.is_available():
+        metrics["cuda_peak_mb"] = torch.cuda.max_memory_allocated() / 2 ** 20
+    return metrics
+
+def read_metrics(path):
+    """
+    Load a metrics log. Later epoch records replace earlier ones for the same
+    epoch, so a resumed run plots its latest values.
+    Returns:
+        tuple: (step records, epoch records sorted by epoch)
+    """
+    steps, epochs = [], {}
+    with open(path, "r") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # Blank or partially written line
+            if record["kind"] == "step":
+                steps.append(record)
+            else:
+                epochs[record["epoch"]] = record
+    return steps, [epochs[epoch] for epoch in sorted(epochs)]
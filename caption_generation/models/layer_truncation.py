@@ -0,0 +1,17 @@
+import torch.nn as nn
+
+def truncate_encoder_layers(encoder_model, num_layers):
+    """
+    Keep only the first `num_layers` transformer layers of a wav2vec2-style
+    encoder (Wav2Vec2, HuBERT, MERT), deleting the rest so they are neither run
+    nor held in memory. The config is updated to match, so hidden_states has
+    num_layers + 1 entries. Returns the number of layers kept.
+    """
+    total_layers = encoder_model.config.num_hidden_layers
+    if num_layers is None or num_layers == total_layers:
+        return total_layers
+    if not 1 <= num_layers <= total_layers:
+        raise ValueError(f"num_layers must be between 1 and {total_layers}, got {num_layers}")
+    encoder_model.encoder.layers = nn.ModuleList(list(encoder_model.encoder.layers)[:num_layers])
+    encoder_model.config.num_hidden_layers = num_layers
+    return num_layers
@@ -1,87 +1,82 @@
 import torch.nn as nn
 import torch
 from transformers import T5ForConditionalGeneration, AutoModel
+from profiling import StageTimer
+from .layer_truncation import truncate_encoder_layers
 
 class MertT5Model(nn.Module):
-    def __init__(self, device="cpu", mert_model=None, t5_model=None, frozen=False):
+    def __init__(self, device="cpu", mert_model=None, t5_model=None, frozen=False, num_layers=None):
         super(MertT5Model, self).__init__()
         self.device = device
         self.frozen = frozen
+        self.timer = StageTimer()  # Replaced by the training script when profiling
 
         self.mert_model = mert_model or AutoModel.from_pretrained("m-a-p/MERT-v1-95M", trust_remote_code=True).to(self.device)
         self.t5_model = t5_model or T5ForConditionalGeneration.from_pretrained("t5-small").to(self.device)
 
-        self.aggregator = nn.Conv1d(in_channels=13, out_channels=1, kernel_size=1).to(self.device)
-        self.reduction_layer = nn.Linear(768, self.t5_model.config.d_model).to(self.device)
-        
+        # Optionally run only the first K transformer layers; the rest are dropped here
+        full_depth = self.mert_model.config.num_hidden_layers
+        self.num_layers = truncate_encoder_layers(self.mert_model, num_layers)
+        self.layers_truncated = self.num_layers < full_depth
+
+        # One aggregator input per hidden state: the feature projection plus every kept transformer layer
+        num_hidden_states = self.mert_model.config.num_hidden_layers + 1
+        hidden_size = self.mert_model.config.hidden_size
+        self.aggregator = nn.Conv1d(in_channels=num_hidden_states, out_channels=1, kernel_size=1).to(self.device)
+        self.reduction_layer = nn.Linear(hidden_size, self.t5_model.config.d_model).to(self.device)
+
         if self.frozen:
             for param in self.mert_model.parameters():
                 param.requires_grad = False
 
-    def forward(self, batch):
-        # Extract inputs
+    def encode(self, batch):
+        """Run MERT on the batch audio and return embeddings shaped as T5 `inputs_embeds`."""
         inputs = batch["inputs"].to(self.device)
-        inputs["input_values"] = inputs["input_values"].squeeze(1)
-        labels = batch["labels"].to(self.device)
-        decoder_attention_mask = batch["decoder_attention_mask"].to(self.device)
+        input_values = inputs["input_values"].squeeze(1)
 
         # Extract embeddings from MERT
         if self.frozen:
             with torch.no_grad():
-                mert_outputs = self.mert_model(inputs["input_values"], output_hidden_states=True)
+                mert_outputs = self.mert_model(input_values, output_hidden_states=True)
         else:
-            mert_outputs = self.mert_model(inputs["input_values"], output_hidden_states=True)
-        
-        all_layer_hidden_states = torch.stack(mert_outputs.hidden_states).squeeze()
+            mert_outputs = self.mert_model(input_values, output_hidden_states=True)
 
-        if all_layer_hidden_states.dim() == 3: 
-            current_batch_size = 1
-        else:
-            current_batch_size = all_layer_hidden_states.size(1)  # Dynamically fetch batch size
-        
-        combined_dim = all_layer_hidden_states.view(current_batch_size, 13, -1) # [batch_size, layers, time_steps * features]
+        all_layer_hidden_states = torch.stack(mert_outputs.hidden_states)  # [layers, batch_size, time_steps, features]
+        num_layers, current_batch_size, time_steps, features = all_layer_hidden_states.shape
+
+        combined_dim = all_layer_hidden_states.view(current_batch_size, num_layers, -1) # [batch_size, layers, time_steps * features]
 
         # Apply Conv1d for learnable aggregation
         aggregated_embedding = self.aggregator(combined_dim)  # [batch_size, 1, time_steps * features]
 
         # Uncombine the last dimension back into time_steps and features
-        aggregated_embedding = aggregated_embedding.view(current_batch_size, 749, 768)  # [batch_size, time_steps, features]
+        aggregated_embedding = aggregated_embedding.view(current_batch_size, time_steps, features)  # [batch_size, time_steps, features]
 
         # Reduce embeddings
-        reduced_embeddings = self.reduction_layer(aggregated_embedding)
+        return self.reduction_layer(aggregated_embedding)
+
+    def forward(self, batch):
+        # Extract inputs
+        labels = batch["labels"].to(self.device)
+        decoder_attention_mask = batch["decoder_attention_mask"].to(self.device)
+
+        with self.timer.section("encoder"):
+            reduced_embeddings = self.encode(batch)
 
         # Pass embeddings to T5
-        outputs = self.t5_model(
-            inputs_embeds=reduced_embeddings,
-            labels=labels,
-            decoder_attention_mask=decoder_attention_mask,
-        )
+        with self.timer.section("decoder"):
+            outputs = self.t5_model(
+                inputs_embeds=reduced_embeddings,
+                labels=labels,
+                decoder_attention_mask=decoder_attention_mask,
+            )
         return outputs
-    
+
     def inference(self, batch, tokenizer, max_length=50):
         """Run inference to generate captions."""
         with torch.no_grad():
-            # Extract inputs
-            inputs = batch["inputs"].to(self.device)
-            inputs["input_values"] = inputs["input_values"].squeeze(1)
-
-            # Extract embeddings from MERT
-            mert_outputs = self.mert_model(inputs["input_values"], output_hidden_states=True)
-
-            all_layer_hidden_states = torch.stack(mert_outputs.hidden_states).squeeze()
-            if all_layer_hidden_states.dim() == 3: 
-                current_batch_size = 1
-            else:
-                current_batch_size = all_layer_hidden_states.size(1)  # Dynamically fetch batch size
-
-            combined_dim = all_layer_hidden_states.view(current_batch_size, 13, -1)
-
-            # Aggregate embeddings
-            aggregated_embedding = self.aggregator(combined_dim)
-            aggregated_embedding = aggregated_embedding.view(current_batch_size, 749, 768)
-
-            # Reduce embeddings
-            reduced_embeddings = self.reduction_layer(aggregated_embedding)
+            # Extract and aggregate embeddings from MERT
+            reduced_embeddings = self.encode(batch)
 
             # Generate predictions
             outputs = self.t5_model.generate(
@@ -93,5 +88,5 @@ class MertT5Model(nn.Module):
 
             # Decode predictions
             predictions = [tokenizer.decode(output, skip_special_tokens=True) for output in outputs]
-        
-            return predictions
\ No newline at end of file
+
+            return predictions
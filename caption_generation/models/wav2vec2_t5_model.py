@@ -1,28 +1,34 @@
 import torch.nn as nn
 import torch
 from transformers import T5ForConditionalGeneration, Wav2Vec2Model
+from profiling import StageTimer
+from .layer_truncation import truncate_encoder_layers
 
 class Wav2Vec2T5Model(nn.Module):
-    def __init__(self, device="cpu", wav2vec2_model=None, t5_model=None, frozen=False):
+    def __init__(self, device="cpu", wav2vec2_model=None, t5_model=None, frozen=False, num_layers=None):
         super(Wav2Vec2T5Model, self).__init__()
         self.device = device
         self.frozen = frozen
+        self.timer = StageTimer()  # Replaced by the training script when profiling
 
         self.wav2vec2_model = wav2vec2_model or Wav2Vec2Model.from_pretrained("facebook/wav2vec2-base-960h").to(self.device)
         self.t5_model = t5_model or T5ForConditionalGeneration.from_pretrained("t5-small").to(self.device)
 
+        # Optionally run only the first K transformer layers; last_hidden_state is then layer K's output
+        full_depth = self.wav2vec2_model.config.num_hidden_layers
+        self.num_layers = truncate_encoder_layers(self.wav2vec2_model, num_layers)
+        self.layers_truncated = self.num_layers < full_depth
+
         self.reduction_layer = nn.Linear(self.wav2vec2_model.config.hidden_size, self.t5_model.config.d_model).to(self.device)
         
         if self.frozen:
             for param in self.wav2vec2_model.parameters():
                 param.requires_grad = False
 
-    def forward(self, batch):
-        # Extract inputs
+    def encode(self, batch):
+        """Run Wav2Vec2 on the batch audio and return embeddings shaped as T5 `inputs_embeds`."""
         input_values = batch["input_values"].to(self.device)
         attention_mask = batch["attention_mask"].to(self.device)
-        labels = batch["labels"].to(self.device)
-        decoder_attention_mask = batch["decoder_attention_mask"].to(self.device)
 
         # Extract embeddings from Wav2Vec2
         if self.frozen:
@@ -31,31 +37,33 @@ class Wav2Vec2T5Model(nn.Module):
         else:
             wav2vec_outputs = self.wav2vec2_model(input_values, attention_mask=attention_mask)
         
+        # Reduce dimensions to match T5 input
         audio_embeddings = wav2vec_outputs.last_hidden_state
-        reduced_embeddings = self.reduction_layer(audio_embeddings)
+        return self.reduction_layer(audio_embeddings)
+
+    def forward(self, batch):
+        # Extract inputs
+        labels = batch["labels"].to(self.device)
+        decoder_attention_mask = batch["decoder_attention_mask"].to(self.device)
+
+        with self.timer.section("encoder"):
+            reduced_embeddings = self.encode(batch)
 
         # Pass embeddings to T5
-        outputs = self.t5_model(
-            inputs_embeds=reduced_embeddings,
-            labels=labels,
-            decoder_attention_mask=decoder_attention_mask,
-        )
+        with self.timer.section("decoder"):
+            outputs = self.t5_model(
+                inputs_embeds=reduced_embeddings,
+                labels=labels,
+                decoder_attention_mask=decoder_attention_mask,
+            )
         return outputs
     
     def inference(self, batch, tokenizer, max_length=50):
         """Inference method to generate captions from input audio."""
         # Ensure inference has no gradients
         with torch.no_grad():
-            # Extract inputs
-            input_values = batch["input_values"].to(self.device)
-            attention_mask = batch["attention_mask"].to(self.device)
-
             # Process inputs through Wav2Vec2
-            wav2vec_outputs = self.wav2vec2_model(input_values, attention_mask=attention_mask)
-
-            # Reduce dimensions to match T5 input
-            audio_embeddings = wav2vec_outputs.last_hidden_state
-            reduced_embeddings = self.reduction_layer(audio_embeddings)
+            reduced_embeddings = self.encode(batch)
 
             # Generate predictions using T5
             outputs = self.t5_model.generate(
@@ -0,0 +1,127 @@
+import json
+import time
+from collections import defaultdict
+import torch
+
+class _NullSection:
+    """Context manager that does nothing; shared by every disabled timer."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_SECTION = _NullSection()
+
+class _Section:
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        if self.timer.synchronize:
+            torch.cuda.synchronize()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if self.timer.synchronize:
+            torch.cuda.synchronize()
+        self.timer.add(self.name, time.perf_counter() - self.start)
+        return False
+
+class StageTimer:
+    """
+    Accumulates wall time per named stage (e.g. "data", "encoder", "backward").
+
+    A disabled timer hands out one shared no-op context manager, so leaving
+    `with timer.section(...)` blocks in the hot path costs a method call and
+    an attribute check per step.
+    """
+
+    # Stages that run inside another one: the dataset's decode and processor
+    # sections execute during the "data" wait (with num_workers=0), so their
+    # time is already part of "data" and must not be added to it again.
+    NESTED = {"decode": "data", "processor": "data"}
+
+    def __init__(self, enabled=False, synchronize=False):
+        self.enabled = enabled
+        # CUDA kernels run asynchronously; synchronize so time lands in the right stage
+        self.synchronize = enabled and synchronize and torch.cuda.is_available()
+        self.reset()
+
+    def reset(self):
+        self.totals = defaultdict(float)
+        self.counts = defaultdict(int)
+
+    def section(self, name):
+        if not self.enabled:
+            return _NULL_SECTION
+        return _Section(self, name)
+
+    def add(self, name, seconds):
+        self.totals[name] += seconds
+        self.counts[name] += 1
+
+    def iterate(self, iterable, name="data"):
+        """Yield from `iterable`, timing how long each item takes to arrive."""
+        if not self.enabled:
+            yield from iterable
+            return
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            self.add(name, time.perf_counter() - start)
+            yield item
+
+    def summary(self):
+        """
+        Returns:
+            dict: {stage: {"total_s", "mean_ms", "count"}} for every stage seen since the last reset.
+            Nested stages (see NESTED) also carry "parent"; only top-level stages sum to the wall time.
+        """
+        summary = {}
+        for name, total in self.totals.items():
+            summary[name] = {
+                "total_s": total,
+                "mean_ms": 1000 * total / self.counts[name],
+                "count": self.counts[name],
+            }
+            if name in self.NESTED:
+                summary[name]["parent"] = self.NESTED[name]
+        return summary
+
+def format_breakdown(stages, wall_time):
+    """One line of stage shares of `wall_time`, with nested stages in parentheses after their parent."""
+    parts = []
+    for name, stage in stages.items():
+        if "parent" in stage:
+            continue
+        part = f"{name} {100 * stage['total_s'] / wall_time:.1f}%"
+        children = [f"{child} {100 * sub['total_s'] / wall_time:.1f}%" for child, sub in stages.items() if sub.get("parent") == name]
+        parts.append(part + (f" (of which {', '.join(children)})" if children else ""))
+    return ", ".join(parts)
+
+def write_jsonl(path, record):
+    """Append one JSON record per line."""
+    with open(path, "a") as f:
+        f.write(json.dumps(record) + "\n")
+
+def make_torch_profiler(start_step, num_steps, trace_dir):
+    """
+    Build a torch.profiler that records `num_steps` steps after skipping `start_step`
+    steps (one of which is used for warmup). Call `.step()` once per training step.
+    """
+    return torch.profiler.profile(
+        activities=[torch.profiler.ProfilerActivity.CPU]
+        + ([torch.profiler.ProfilerActivity.CUDA] if torch.cuda.is_available() else []),
+        schedule=torch.profiler.schedule(wait=max(start_step - 1, 0), warmup=1 if start_step > 0 else 0, active=num_steps, repeat=1),
+        on_trace_ready=torch.profiler.tensorboard_trace_handler(trace_dir),
+        record_shapes=True,
+        with_stack=False,
+    )
@@ -0,0 +1,94 @@
+from functools import lru_cache
+from math import gcd
+import numpy as np
+from scipy.io import wavfile
+from scipy.signal import firwin, resample_poly
+
+# Kaiser-windowed sinc filters. half_width is in taps per polyphase branch on each
+# side of the centre; rolloff is the passband edge relative to the lower Nyquist.
+QUALITY_PRESETS = {
+    "fast": {"half_width": 8, "beta": 5.0, "rolloff": 0.85},
+    "default": {"half_width": 16, "beta": 8.6, "rolloff": 0.92},
+    "best": {"half_width": 48, "beta": 12.0, "rolloff": 0.96},
+}
+
+@lru_cache(maxsize=64)
+def design_filter(orig_sr, new_sr, quality="default"):
+    """
+    Design (once per rate pair and preset) the anti-aliasing filter for resample_poly.
+    Returns:
+        tuple: (up, down, fir) with fir a read-only float64 array.
+    """
+    if quality not in QUALITY_PRESETS:
+        raise ValueError(f"Invalid quality preset: {quality}. Expected one of {list(QUALITY_PRESETS)}.")
+    preset = QUALITY_PRESETS[quality]
+    divisor = gcd(int(orig_sr), int(new_sr))
+    up, down = int(new_sr) // divisor, int(orig_sr) // divisor
+    max_rate = max(up, down)
+    fir = firwin(2 * preset["half_width"] * max_rate + 1, preset["rolloff"] / max_rate, window=("kaiser", preset["beta"]))
+    fir.setflags(write=False)  # Shared across calls; resample_poly copies before scaling
+    return up, down, fir
+
+def resample(audio, orig_sr, new_sr, quality="default", axis=-1):
+    """
+    Polyphase resampling with a cached filter.
+    Args:
+        audio (np.ndarray): Waveform(s); time runs along `axis`.
+        quality (str): One of QUALITY_PRESETS.
+    Returns:
+        np.ndarray: float32 resampled audio (the input itself when rates match).
+    """
+    if orig_sr == new_sr:
+        return audio
+    up, down, fir = design_filter(orig_sr, new_sr, quality)
+    return resample_poly(audio, up, down, axis=axis, window=fir).astype(np.float32)
+
+def resample_batch(clips, orig_sr, new_sr, quality="default"):
+    """
+    Resample several 1-D clips in one filtering call. Clips of different lengths
+    are zero-padded to a common length and trimmed back afterwards.
+    Returns:
+        list: One float32 array per clip.
+    """
+    if orig_sr == new_sr:
+        return list(clips)
+    up, down, _ = design_filter(orig_sr, new_sr, quality)
+    lengths = [len(clip) for clip in clips]
+    batch = np.zeros((len(clips), max(lengths)), dtype=np.float32)
+    for i, clip in enumerate(clips):
+        batch[i, :len(clip)] = clip
+    resampled = resample(batch, orig_sr, new_sr, quality, axis=-1)
+    return [resampled[i, :-(-length * up // down)] for i, length in enumerate(lengths)]
+
+def pcm_to_float(audio):
+    """Scale integer PCM to float32 in [-1, 1] the way soundfile/torchaudio do."""
+    if audio.dtype == np.uint8:
+        return (audio.astype(np.float32) - 128) / 128
+    if np.issubdtype(audio.dtype, np.integer):
+        return audio.astype(np.float32) / -np.iinfo(audio.dtype).min
+    return audio.astype(np.float32)
+
+def load_audio(audio_path, sample_rate=None, quality="default", mono=True):
+    """
+    Load an audio file as float32 in [-1, 1], resampled to `sample_rate`.
+    WAV files are read directly with scipy; other formats fall back to librosa.
+    With mono=False multichannel audio is kept as [samples, channels] and each
+    channel is resampled.
+    Returns:
+        tuple: (audio, sample_rate)
+    """
+    if audio_path.endswith(".wav"):
+        orig_sr, audio = wavfile.read(audio_path)
+        audio = pcm_to_float(audio)
+    else:
+        import librosa
+        audio, orig_sr = librosa.load(audio_path, sr=None, mono=False)
+        audio = audio.T
+
+    # Convert stereo to mono before resampling so only one channel is filtered
+    if mono and audio.ndim == 2:
+        audio = audio.mean(axis=1)
+
+    if sample_rate is None:
+        return audio, orig_sr
+    return resample(audio, orig_sr, sample_rate, quality, axis=0), sample_rate
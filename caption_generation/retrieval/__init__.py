@@ -0,0 +1,3 @@
+# __init__.py
+from .ann_index import IVFIndex, brute_force_search, evaluate_index
+from .clap_embedder import ClapEmbedder
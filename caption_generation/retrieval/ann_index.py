@@ -0,0 +1,254 @@
+import time
+import numpy as np
+
+def normalize(vectors):
+    """
+    L2-normalize rows so that inner product equals cosine similarity.
+    Args:
+        vectors (np.ndarray): Array of shape [n, dim].
+    Returns:
+        np.ndarray: float32 array of unit-norm rows.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+def kmeans(data, num_clusters, num_iters=20, seed=0):
+    """
+    Plain Lloyd's k-means on the rows of `data` (squared L2 distance).
+    Returns:
+        np.ndarray: Centroids of shape [num_clusters, dim].
+    """
+    rng = np.random.default_rng(seed)
+    num_clusters = min(num_clusters, len(data))
+    centroids = data[rng.choice(len(data), num_clusters, replace=False)].copy()
+    data_sq = (data ** 2).sum(axis=1, keepdims=True)
+
+    for _ in range(num_iters):
+        # ||x - c||^2 = ||x||^2 - 2 x.c + ||c||^2
+        distances = data_sq - 2 * data @ centroids.T + (centroids ** 2).sum(axis=1)
+        assignments = distances.argmin(axis=1)
+
+        counts = np.bincount(assignments, minlength=num_clusters)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, data)
+
+        # Re-seed empty clusters from random points instead of leaving them dead
+        empty = counts == 0
+        if empty.any():
+            sums[empty] = data[rng.choice(len(data), empty.sum(), replace=False)]
+            counts[empty] = 1
+        centroids = sums / counts[:, None]
+
+    return centroids.astype(np.float32)
+
+def brute_force_search(database, queries, k):
+    """
+    Exact top-k cosine search, used as ground truth for recall.
+    Returns:
+        tuple: (ids [num_queries, k], scores [num_queries, k]) sorted by descending score.
+    """
+    scores = normalize(queries) @ normalize(database).T
+    k = min(k, scores.shape[1])
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-top_scores, axis=1)
+    return np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+class IVFIndex:
+    """
+    Inverted-file ANN index over unit-normalized embeddings.
+
+    Vectors are bucketed by their nearest coarse centroid. A query only scores
+    the vectors in its `nprobe` closest buckets. With `pq_subspaces` set, each
+    vector is stored as the product-quantized residual from its centroid
+    (one uint8 code per subspace) instead of the raw float32 vector.
+    """
+
+    def __init__(self, nlist=1024, nprobe=16, pq_subspaces=None, pq_bits=8, train_size=100000, seed=0):
+        if pq_subspaces is not None and pq_bits != 8:
+            raise ValueError("Only 8-bit product quantization codes are supported.")
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.pq_subspaces = pq_subspaces
+        self.train_size = train_size
+        self.seed = seed
+
+        self.centroids = None   # [nlist, dim]
+        self.codebooks = None   # [pq_subspaces, 256, dim / pq_subspaces]
+        self.list_offsets = None  # [nlist + 1], CSR offsets into the arrays below
+        self.ids = None         # [n] original row ids, grouped by list
+        self.vectors = None     # [n, dim] float32, or [n, pq_subspaces] uint8 codes
+
+    def __len__(self):
+        return 0 if self.ids is None else len(self.ids)
+
+    def train(self, embeddings):
+        """Fit the coarse quantizer (and PQ codebooks) on a sample of the corpus."""
+        embeddings = normalize(embeddings)
+        rng = np.random.default_rng(self.seed)
+        if len(embeddings) > self.train_size:
+            embeddings = embeddings[rng.choice(len(embeddings), self.train_size, replace=False)]
+
+        self.centroids = kmeans(embeddings, self.nlist, seed=self.seed)
+        self.nlist = len(self.centroids)
+
+        if self.pq_subspaces is not None:
+            dim = embeddings.shape[1]
+            if dim % self.pq_subspaces != 0:
+                raise ValueError(f"Embedding dim {dim} is not divisible by pq_subspaces={self.pq_subspaces}.")
+            residuals = embeddings - self.centroids[self._assign(embeddings)]
+            sub_dim = dim // self.pq_subspaces
+            self.codebooks = np.stack([
+                kmeans(residuals[:, m * sub_dim:(m + 1) * sub_dim], 256, seed=self.seed + m)
+                for m in range(self.pq_subspaces)
+            ])
+        return self
+
+    def add(self, embeddings, ids=None):
+        """
+        Add vectors to the index. Lists are rebuilt so each one stays contiguous in memory.
+        Args:
+            embeddings (np.ndarray): Array of shape [n, dim].
+            ids (np.ndarray): Optional int64 ids; defaults to running row numbers.
+        """
+        if self.centroids is None:
+            raise ValueError("Index must be trained before adding vectors.")
+        embeddings = normalize(embeddings)
+        if ids is None:
+            ids = np.arange(len(self), len(self) + len(embeddings))
+        ids = np.asarray(ids, dtype=np.int64)
+
+        assignments = self._assign(embeddings)
+        if self.pq_subspaces is not None:
+            encoded = self._encode(embeddings - self.centroids[assignments])
+        else:
+            encoded = embeddings
+
+        if self.ids is not None:
+            old_assignments = np.repeat(np.arange(self.nlist), np.diff(self.list_offsets))
+            assignments = np.concatenate([old_assignments, assignments])
+            encoded = np.concatenate([self.vectors, encoded])
+            ids = np.concatenate([self.ids, ids])
+
+        order = np.argsort(assignments, kind="stable")
+        self.ids = ids[order]
+        self.vectors = np.ascontiguousarray(encoded[order])
+        self.list_offsets = np.concatenate([[0], np.cumsum(np.bincount(assignments, minlength=self.nlist))])
+        return self
+
+    def search(self, queries, k=10, nprobe=None):
+        """
+        Approximate top-k inner-product search.
+        Returns:
+            tuple: (ids [num_queries, k], scores [num_queries, k]); missing slots are -1 / -inf.
+        """
+        queries = normalize(np.atleast_2d(queries))
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        coarse_scores = queries @ self.centroids.T
+        probes = np.argpartition(-coarse_scores, nprobe - 1, axis=1)[:, :nprobe]
+
+        all_ids = np.full((len(queries), k), -1, dtype=np.int64)
+        all_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        for i, query in enumerate(queries):
+            candidate_rows = np.concatenate([
+                np.arange(self.list_offsets[c], self.list_offsets[c + 1]) for c in probes[i]
+            ])
+            if len(candidate_rows) == 0:
+                continue
+
+            if self.pq_subspaces is not None:
+                # Asymmetric distance: q.(c + r) = q.c + sum_m q_m . codebook_m[code_m]
+                lookup = self._lookup_table(query)
+                codes = self.vectors[candidate_rows]
+                scores = lookup[np.arange(self.pq_subspaces), codes].sum(axis=1)
+                list_of_row = np.repeat(probes[i], np.diff(self.list_offsets)[probes[i]])
+                scores += coarse_scores[i, list_of_row]
+            else:
+                scores = self.vectors[candidate_rows] @ query
+
+            top_k = min(k, len(scores))
+            top = np.argpartition(-scores, top_k - 1)[:top_k]
+            top = top[np.argsort(-scores[top])]
+            all_ids[i, :top_k] = self.ids[candidate_rows[top]]
+            all_scores[i, :top_k] = scores[top]
+        return all_ids, all_scores
+
+    def memory_bytes(self):
+        """Bytes held by the stored vectors/codes, ids and quantizers."""
+        total = self.centroids.nbytes + self.vectors.nbytes + self.ids.nbytes + self.list_offsets.nbytes
+        if self.codebooks is not None:
+            total += self.codebooks.nbytes
+        return total
+
+    def save(self, path):
+        np.savez(
+            path,
+            nlist=self.nlist,
+            nprobe=self.nprobe,
+            pq_subspaces=-1 if self.pq_subspaces is None else self.pq_subspaces,
+            centroids=self.centroids,
+            codebooks=np.zeros(0) if self.codebooks is None else self.codebooks,
+            list_offsets=self.list_offsets,
+            ids=self.ids,
+            vectors=self.vectors,
+        )
+        print(f"Index saved at {path}")
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        pq_subspaces = int(data["pq_subspaces"])
+        index = cls(nlist=int(data["nlist"]), nprobe=int(data["nprobe"]),
+                    pq_subspaces=None if pq_subspaces < 0 else pq_subspaces)
+        index.centroids = data["centroids"]
+        index.codebooks = data["codebooks"] if index.pq_subspaces is not None else None
+        index.list_offsets = data["list_offsets"]
+        index.ids = data["ids"]
+        index.vectors = data["vectors"]
+        print(f"Index loaded from {path}")
+        return index
+
+    def _assign(self, embeddings):
+        return (embeddings @ self.centroids.T).argmax(axis=1)
+
+    def _encode(self, residuals):
+        sub_dim = residuals.shape[1] // self.pq_subspaces
+        codes = np.empty((len(residuals), self.pq_subspaces), dtype=np.uint8)
+        for m in range(self.pq_subspaces):
+            sub = residuals[:, m * sub_dim:(m + 1) * sub_dim]
+            codebook = self.codebooks[m]
+            distances = (sub ** 2).sum(axis=1, keepdims=True) - 2 * sub @ codebook.T + (codebook ** 2).sum(axis=1)
+            codes[:, m] = distances.argmin(axis=1)
+        return codes
+
+    def _lookup_table(self, query):
+        # [pq_subspaces, 256]: inner product of each query chunk with every sub-centroid
+        sub_queries = query.reshape(self.pq_subspaces, -1)
+        return np.einsum("md,mkd->mk", sub_queries, self.codebooks)
+
+def evaluate_index(index, database, queries, k=10, nprobe=None):
+    """
+    Compare the index against exact cosine search.
+    Args:
+        index (IVFIndex): A trained and populated index.
+        database (np.ndarray): The raw embeddings that were added, in id order.
+        queries (np.ndarray): Query embeddings.
+    Returns:
+        dict: recall@k, queries/sec and mean per-query latency in ms.
+    """
+    exact_ids, _ = brute_force_search(database, queries, k)
+
+    start = time.perf_counter()
+    for query in queries:
+        index.search(query, k=k, nprobe=nprobe)
+    elapsed = time.perf_counter() - start
+    approx_ids, _ = index.search(queries, k=k, nprobe=nprobe)
+
+    hits = sum(len(np.intersect1d(a, e)) for a, e in zip(approx_ids, exact_ids))
+    return {
+        f"recall@{k}": hits / exact_ids.size,
+        "queries_per_sec": len(queries) / elapsed,
+        "latency_ms": 1000 * elapsed / len(queries),
+        "index_mb": index.memory_bytes() / 2 ** 20,
+    }
@@ -0,0 +1,43 @@
+import numpy as np
+import torch
+from transformers import ClapModel, ClapProcessor
+from resampling import load_audio
+
+CLAP_MODEL_NAME = "laion/larger_clap_music"
+CLAP_SAMPLE_RATE = 48000
+
+class ClapEmbedder:
+    """Encodes audio and text into CLAP's joint embedding space."""
+
+    def __init__(self, device="cpu", clap_model=None, processor=None):
+        self.device = device
+        self.clap_model = clap_model or ClapModel.from_pretrained(CLAP_MODEL_NAME).to(device)
+        self.processor = processor or ClapProcessor.from_pretrained(CLAP_MODEL_NAME)
+        self.clap_model.eval()
+
+    def embed_audio(self, audio_paths, batch_size=8):
+        """
+        Embed audio files with the CLAP audio tower.
+        Returns:
+            np.ndarray: float32 array of shape [len(audio_paths), dim].
+        """
+        embeddings = []
+        for start in range(0, len(audio_paths), batch_size):
+            audios = [load_audio(path, CLAP_SAMPLE_RATE)[0] for path in audio_paths[start:start + batch_size]]
+            inputs = self.processor(audios=audios, sampling_rate=CLAP_SAMPLE_RATE, return_tensors="pt").to(self.device)
+            with torch.no_grad():
+                embeddings.append(self.clap_model.get_audio_features(**inputs).cpu().numpy())
+        return np.concatenate(embeddings).astype(np.float32)
+
+    def embed_text(self, texts, batch_size=64):
+        """
+        Embed text queries with the CLAP text tower.
+        Returns:
+            np.ndarray: float32 array of shape [len(texts), dim].
+        """
+        embeddings = []
+        for start in range(0, len(texts), batch_size):
+            inputs = self.processor(text=list(texts[start:start + batch_size]), padding=True, return_tensors="pt").to(self.device)
+            with torch.no_grad():
+                embeddings.append(self.clap_model.get_text_features(**inputs).cpu().numpy())
+        return np.concatenate(embeddings).astype(np.float32)
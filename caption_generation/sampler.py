@@ -0,0 +1,60 @@
+import torch
+from torch.utils.data import Sampler
+
+class ResumableSampler(Sampler):
+    """
+    Shuffling sampler whose position can be checkpointed.
+
+    Each epoch's order is a permutation seeded by (seed, epoch), so it can be
+    regenerated after a restart; `start_index` skips the samples this rank has
+    already consumed. With num_replicas > 1 it shards like DistributedSampler
+    (drop_last=True), giving every rank a disjoint slice of the same permutation.
+    """
+
+    def __init__(self, dataset, num_replicas=1, rank=0, seed=0):
+        self.dataset = dataset
+        self.num_replicas = num_replicas
+        self.rank = rank
+        self.seed = seed
+        self.epoch = 0
+        self.start_index = 0
+        self.num_samples = len(dataset) // num_replicas
+
+    def set_epoch(self, epoch, start_index=0):
+        """Select the epoch's permutation and skip its first `start_index` samples on this rank."""
+        self.epoch = epoch
+        self.start_index = start_index
+
+    def __iter__(self):
+        generator = torch.Generator()
+        generator.manual_seed(self.seed + self.epoch)
+        indices = torch.randperm(len(self.dataset), generator=generator).tolist()
+        indices = indices[:self.num_samples * self.num_replicas]
+        indices = indices[self.rank::self.num_replicas]
+        return iter(indices[self.start_index:])
+
+    def __len__(self):
+        return max(self.num_samples - self.start_index, 0)
+
+    def state_dict(self, consumed_samples):
+        return {"epoch": self.epoch, "seed": self.seed, "start_index": consumed_samples}
+
+    def load_state_dict(self, state):
+        self.seed = state["seed"]
+        self.set_epoch(state["epoch"], state["start_index"])
+
+class ShardSampler(Sampler):
+    """
+    Unshuffled, unpadded shard for evaluation: rank r gets indices r, r + R, ...
+    Unlike DistributedSampler no sample is duplicated to even out the shards,
+    so summing per-example losses and counts over ranks covers each example once.
+    """
+
+    def __init__(self, dataset, num_replicas=1, rank=0):
+        self.indices = range(rank, len(dataset), num_replicas)
+
+    def __iter__(self):
+        return iter(self.indices)
+
+    def __len__(self):
+        return len(self.indices)
@@ -0,0 +1,222 @@
+# Run from caption_generation directory with:
+# python -m scripts.benchmark --offline --output ../bench_results.json
+#
+# Measures clips/sec, p50/p95 latency, peak RSS and the time split between
+# decode, feature extraction, encoder and T5 generate for every *T5Model.
+# Each encoder runs in its own spawned process so peak RSS is per encoder.
+
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import time
+import numpy as np
+import torch
+import transformers
+from torch.utils.data import default_collate
+from transformers import (ClapConfig, ClapFeatureExtractor, ClapModel, HubertConfig, HubertModel,
+                          T5Config, T5ForConditionalGeneration, T5Tokenizer, Wav2Vec2Config,
+                          Wav2Vec2FeatureExtractor, Wav2Vec2Model)
+from models import ClapT5Model, MertT5Model, Wav2Vec2T5Model
+from encoders import ENCODERS, SAMPLE_RATES, DATASET_HELPERS, CLIP_SECONDS, build_model, fit_length
+OFFLINE_D_MODEL = 64
+
+def parse_benchmark_args():
+    parser = argparse.ArgumentParser(description="Inference throughput and memory benchmark for the caption models.")
+    parser.add_argument('--encoders', type=str, default=",".join(ENCODERS), help="Comma-separated encoders to benchmark.")
+    parser.add_argument('--batch_sizes', type=str, default="1,4,8", help="Comma-separated batch sizes.")
+    parser.add_argument('--threads', type=str, default=str(torch.get_num_threads()), help="Comma-separated torch thread counts.")
+    parser.add_argument('--sources', type=str, default="synthetic,music_samples", help="Audio sources: synthetic and/or music_samples.")
+    parser.add_argument('--repeats', type=int, default=5, help="Timed batches per configuration (after one warmup batch).")
+    parser.add_argument('--max_length', type=int, default=50, help="Maximum caption length passed to inference().")
+    parser.add_argument('--offline', action='store_true', help="Use small randomly initialized configs instead of pretrained weights.")
+    parser.add_argument('--samples_dir', type=str, default="../music_samples", help="Directory of .wav files for the music_samples source.")
+    parser.add_argument('--output', type=str, default="benchmark_results.json", help="Where to write the JSON results.")
+    return parser.parse_args()
+
+class OfflineTokenizer:
+    """Stands in for T5Tokenizer when weights are not downloaded; decodes ids as text."""
+
+    def decode(self, ids, skip_special_tokens=True):
+        return " ".join(str(i) for i in ids.tolist() if not (skip_special_tokens and i < 2))
+
+def offline_clap_processor(feature_extractor):
+    # ClapProcessor takes `audios=`; the bare feature extractor takes the waveform positionally
+    def processor(audios, **kwargs):
+        return feature_extractor(audios, **kwargs)
+    return processor
+
+def build_offline_model(encoder_name):
+    """
+    Small randomly initialized models with the same architectures as the pretrained ones.
+    MERT is built as a HuBERT model, which is the architecture MERT's remote code extends.
+    Returns:
+        tuple: (model, processor, tokenizer)
+    """
+    t5_model = T5ForConditionalGeneration(T5Config(
+        vocab_size=512, d_model=OFFLINE_D_MODEL, d_kv=32, d_ff=128, num_layers=2, num_decoder_layers=2,
+        num_heads=2, pad_token_id=0, eos_token_id=1, decoder_start_token_id=0,
+    ))
+    speech_config = dict(hidden_size=128, num_hidden_layers=4, num_attention_heads=2, intermediate_size=256,
+                         conv_dim=(64,) * 7)
+    if encoder_name == "clap":
+        clap_config = ClapConfig(
+            text_config={"vocab_size": 1000, "hidden_size": 64, "num_hidden_layers": 1, "num_attention_heads": 2,
+                         "intermediate_size": 128},
+            audio_config={"patch_embeds_hidden_size": 32, "hidden_size": 256, "depths": [1, 1, 1, 1],
+                          "num_attention_heads": [1, 2, 4, 8]},
+            projection_dim=OFFLINE_D_MODEL,
+        )
+        model = ClapT5Model(clap_model=ClapModel(clap_config), t5_model=t5_model)
+        processor = offline_clap_processor(ClapFeatureExtractor(truncation="rand_trunc"))
+    elif encoder_name == "mert":
+        model = MertT5Model(mert_model=HubertModel(HubertConfig(**speech_config)), t5_model=t5_model)
+        processor = Wav2Vec2FeatureExtractor(sampling_rate=SAMPLE_RATES["mert"], return_attention_mask=True)
+    elif encoder_name == "wav2vec2":
+        model = Wav2Vec2T5Model(wav2vec2_model=Wav2Vec2Model(Wav2Vec2Config(**speech_config)), t5_model=t5_model)
+        processor = Wav2Vec2FeatureExtractor(sampling_rate=SAMPLE_RATES["wav2vec2"], return_attention_mask=True)
+    else:
+        raise ValueError("Invalid embedding model specified.")
+    return model, processor, OfflineTokenizer()
+
+def build_pretrained_model(encoder_name):
+    """Same components as scripts/train.py and scripts/test.py (see encoders.build_model)."""
+    model, processor = build_model(encoder_name)
+    return model, processor, T5Tokenizer.from_pretrained("t5-small")
+
+def decode_clip(encoder_name, path, processor):
+    """Decode a file exactly the way the encoder's dataset helper does."""
+    helpers = DATASET_HELPERS[encoder_name]
+    if encoder_name == "mert":
+        audio, _ = helpers.preprocess_audio(path, processor)
+    else:
+        audio, _ = helpers.preprocess_audio(path)
+    return fit_length(audio, CLIP_SECONDS * SAMPLE_RATES[encoder_name])
+
+def synthetic_clip(sample_rate, rng):
+    """A few random partials plus noise, roughly the level of normalized music."""
+    t = np.arange(CLIP_SECONDS * sample_rate) / sample_rate
+    frequencies = rng.uniform(55, 2000, size=4)
+    audio = sum(np.sin(2 * np.pi * f * t + rng.uniform(0, 2 * np.pi)) for f in frequencies)
+    audio = 0.1 * audio + 0.01 * rng.standard_normal(len(t))
+    return audio.astype(np.float32)
+
+def timed(fn, totals, key):
+    # Wraps a bound method so calls made from inside inference() are attributed to a stage
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        result = fn(*args, **kwargs)
+        totals[key] += time.perf_counter() - start
+        return result
+    return wrapper
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 2 ** 20 if platform.system() == "Darwin" else rss / 2 ** 10
+
+def benchmark_encoder(encoder_name, args):
+    """
+    Benchmark one encoder over every (source, batch size, thread count) combination.
+    Returns:
+        list: One result dict per configuration.
+    """
+    load_start = time.perf_counter()
+    model, processor, tokenizer = build_offline_model(encoder_name) if args.offline else build_pretrained_model(encoder_name)
+    model.eval()
+    load_s = time.perf_counter() - load_start
+    prepare_inputs = DATASET_HELPERS[encoder_name].prepare_inputs
+    sample_rate = SAMPLE_RATES[encoder_name]
+    sample_paths = sorted(glob.glob(os.path.join(args.samples_dir, "*.wav")))
+    rng = np.random.default_rng(0)
+
+    # Attribute the encoder and T5 generate calls made by inference() to their own stages
+    stage_totals = {"encoder": 0.0, "generate": 0.0}
+    model.encode = timed(model.encode, stage_totals, "encoder")
+    model.t5_model.generate = timed(model.t5_model.generate, stage_totals, "generate")
+
+    results = []
+    for source in args.sources.split(","):
+        if source == "music_samples" and not sample_paths:
+            print(f"No .wav files in {args.samples_dir}; skipping music_samples")
+            continue
+        for num_threads in [int(n) for n in args.threads.split(",")]:
+            torch.set_num_threads(num_threads)
+            for batch_size in [int(b) for b in args.batch_sizes.split(",")]:
+                latencies = []
+                stage_sums = {"decode": 0.0, "feature_extraction": 0.0, "encoder": 0.0, "generate": 0.0}
+                for repeat in range(args.repeats + 1):
+                    stage_totals["encoder"] = stage_totals["generate"] = 0.0
+                    start = time.perf_counter()
+
+                    if source == "synthetic":
+                        clips = [synthetic_clip(sample_rate, rng) for _ in range(batch_size)]
+                    else:
+                        clips = [decode_clip(encoder_name, sample_paths[i % len(sample_paths)], processor)
+                                 for i in range(batch_size)]
+                    decoded = time.perf_counter()
+
+                    batch = default_collate([prepare_inputs(clip, sample_rate, processor) for clip in clips])
+                    featurized = time.perf_counter()
+
+                    model.inference(batch, tokenizer, max_length=args.max_length)
+                    end = time.perf_counter()
+
+                    if repeat == 0:
+                        continue  # Warmup
+                    latencies.append(end - start)
+                    stage_sums["decode"] += decoded - start
+                    stage_sums["feature_extraction"] += featurized - decoded
+                    stage_sums["encoder"] += stage_totals["encoder"]
+                    stage_sums["generate"] += stage_totals["generate"]
+
+                latencies_ms = 1000 * np.array(latencies)
+                result = {
+                    "encoder": encoder_name,
+                    "source": source,
+                    "batch_size": batch_size,
+                    "threads": num_threads,
+                    "clips_per_sec": batch_size * len(latencies) / sum(latencies),
+                    "latency_p50_ms": float(np.percentile(latencies_ms, 50)),
+                    "latency_p95_ms": float(np.percentile(latencies_ms, 95)),
+                    "stage_ms": {stage: 1000 * total / len(latencies) for stage, total in stage_sums.items()},
+                    "peak_rss_mb": peak_rss_mb(),
+                    "model_load_s": load_s,
+                }
+                print(f"{encoder_name:<9} {source:<14} bs={batch_size:<3} threads={num_threads:<3} "
+                      f"{result['clips_per_sec']:8.2f} clips/s  p50={result['latency_p50_ms']:.1f}ms  "
+                      f"p95={result['latency_p95_ms']:.1f}ms  rss={result['peak_rss_mb']:.0f}MB")
+                results.append(result)
+    return results
+
+if __name__ == "__main__":
+    args = parse_benchmark_args()
+
+    results = []
+    context = multiprocessing.get_context("spawn")
+    for encoder_name in args.encoders.split(","):
+        if encoder_name not in ENCODERS:
+            raise ValueError("Invalid embedding model specified.")
+        with context.Pool(1) as pool:
+            results.extend(pool.apply(benchmark_encoder, (encoder_name, args)))
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "offline": args.offline,
+            "repeats": args.repeats,
+            "max_length": args.max_length,
+            "torch": torch.__version__,
+            "transformers": transformers.__version__,
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+            "machine": platform.machine(),
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Benchmark results saved to {args.output}")
@@ -0,0 +1,147 @@
+# Run from caption_generation directory with:
+# python -m scripts.benchmark_resampling --output ../resampling_results.json
+#
+# Compares the shared polyphase resampler (every quality preset) with librosa on
+# the rate pairs the datasets and the DPO converter use. Reports per-clip time,
+# batched time and two error measures against an analytically generated reference:
+#   snr_db   - energy of the in-band reference over the energy of the error
+#   alias_db - level of an out-of-band tone folded back into the output, relative
+#              to an in-band tone (only when downsampling)
+
+import argparse
+import json
+import platform
+import time
+import numpy as np
+import scipy
+from resampling import QUALITY_PRESETS, design_filter, resample, resample_batch
+
+RATE_PAIRS = [(44100, 48000), (48000, 24000), (48000, 16000), (44100, 16000), (32000, 44100)]
+CLIP_SECONDS = 10
+
+def parse_benchmark_args():
+    parser = argparse.ArgumentParser(description="Speed and accuracy of the shared resampler against librosa.")
+    parser.add_argument('--librosa_res_types', type=str, default="soxr_hq,kaiser_best", help="Comma-separated librosa res_type values; unavailable ones are skipped.")
+    parser.add_argument('--batch_size', type=int, default=8, help="Clips per batched resampling call.")
+    parser.add_argument('--repeats', type=int, default=5, help="Timed calls per configuration.")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', type=str, default="resampling_results.json", help="Where to write the JSON results.")
+    return parser.parse_args()
+
+def tones(frequencies, phases, sample_rate, num_seconds=CLIP_SECONDS):
+    t = np.arange(int(num_seconds * sample_rate)) / sample_rate
+    return sum(np.sin(2 * np.pi * f * t + p) for f, p in zip(frequencies, phases))
+
+def make_signal(orig_sr, new_sr, rng):
+    """
+    A test clip at orig_sr, the ideal output at new_sr and the frequency that an
+    out-of-band tone aliases to if the anti-aliasing filter lets it through.
+    """
+    passband = 0.8 * min(orig_sr, new_sr) / 2
+    in_band = rng.uniform(50, passband, size=6)
+    in_phases = rng.uniform(0, 2 * np.pi, size=6)
+    source = 0.1 * tones(in_band, in_phases, orig_sr)
+    reference = 0.1 * tones(in_band, in_phases, new_sr)
+    alias_frequency = None
+    if new_sr < orig_sr:
+        # Halfway between the new and old Nyquist frequencies
+        out_of_band = 0.5 * (new_sr / 2 + orig_sr / 2)
+        source = source + 0.1 * tones([out_of_band], [0.0], orig_sr)
+        alias_frequency = abs(out_of_band - new_sr * round(out_of_band / new_sr))
+    return source.astype(np.float32), reference.astype(np.float32), alias_frequency
+
+def tone_level(audio, frequency, sample_rate):
+    """Amplitude of one sinusoid, by projection onto sin/cos."""
+    t = np.arange(len(audio)) / sample_rate
+    return 2 * np.abs(np.mean(audio * np.exp(-2j * np.pi * frequency * t)))
+
+def measure_error(output, reference, alias_frequency, sample_rate):
+    # Ignore the filter's edge transients
+    trim = sample_rate // 10
+    n = min(len(output), len(reference))
+    output, reference = output[trim:n - trim], reference[trim:n - trim]
+    error = output - reference
+    report = {"snr_db": float(10 * np.log10(np.sum(reference ** 2) / max(np.sum(error ** 2), 1e-20)))}
+    if alias_frequency is not None:
+        alias = tone_level(output, alias_frequency, sample_rate)
+        report["alias_db"] = float(20 * np.log10(max(alias, 1e-12) / 0.1))
+    return report
+
+def time_call(fn, repeats):
+    fn()  # Warmup: designs and caches the filter
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return float(np.median(times))
+
+def main():
+    args = parse_benchmark_args()
+    rng = np.random.default_rng(args.seed)
+    try:
+        import librosa
+        librosa_version = librosa.__version__
+    except ImportError:
+        librosa, librosa_version = None, None
+        print("librosa is not installed; only the shared resampler is benchmarked")
+
+    methods = {}
+    for quality in QUALITY_PRESETS:
+        methods[f"polyphase_{quality}"] = (lambda y, o, n, q=quality: resample(y, o, n, q),
+                                           lambda ys, o, n, q=quality: resample_batch(ys, o, n, q))
+    if librosa is not None:
+        for res_type in args.librosa_res_types.split(","):
+            methods[f"librosa_{res_type}"] = (lambda y, o, n, r=res_type: librosa.resample(y, orig_sr=o, target_sr=n, res_type=r),
+                                              lambda ys, o, n, r=res_type: librosa.resample(np.stack(ys), orig_sr=o, target_sr=n, res_type=r, axis=-1))
+
+    results = []
+    for orig_sr, new_sr in RATE_PAIRS:
+        source, reference, alias_frequency = make_signal(orig_sr, new_sr, rng)
+        batch = [source] * args.batch_size
+        for name, (single, batched) in methods.items():
+            if name.startswith("polyphase"):
+                design_filter.cache_clear()
+                start = time.perf_counter()
+                single(source, orig_sr, new_sr)
+                first_call_ms = 1000 * (time.perf_counter() - start)
+            else:
+                first_call_ms = None
+            try:
+                output = single(source, orig_sr, new_sr)
+            except Exception as e:
+                print(f"Skipping {name}: {e}")
+                continue
+            result = {
+                "method": name,
+                "orig_sr": orig_sr,
+                "new_sr": new_sr,
+                "first_call_ms": first_call_ms,
+                "clip_ms": 1000 * time_call(lambda: single(source, orig_sr, new_sr), args.repeats),
+                "batch_clip_ms": 1000 * time_call(lambda: batched(batch, orig_sr, new_sr), args.repeats) / args.batch_size,
+                **measure_error(np.asarray(output), reference, alias_frequency, new_sr),
+            }
+            results.append(result)
+            alias = f", alias {result['alias_db']:.1f} dB" if "alias_db" in result else ""
+            print(f"{orig_sr}->{new_sr} {name}: {result['clip_ms']:.2f} ms/clip, "
+                  f"{result['batch_clip_ms']:.2f} ms/clip batched, SNR {result['snr_db']:.1f} dB{alias}")
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "clip_seconds": CLIP_SECONDS,
+            "batch_size": args.batch_size,
+            "repeats": args.repeats,
+            "scipy": scipy.__version__,
+            "librosa": librosa_version,
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Benchmark results saved to {args.output}")
+
+if __name__ == "__main__":
+    main()
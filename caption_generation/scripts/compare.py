@@ -0,0 +1,127 @@
+# Run from caption_generation directory with:
+# python -m scripts.compare --last_epoch 10 --output ../compare_test.csv
+#
+# Captions every clip with CLAP, MERT and wav2vec2 in one pass. Each clip is
+# decoded once at its native rate and resampled in-process to 48, 24 and 16 kHz;
+# a decode thread feeds one bounded queue per encoder and every encoder runs
+# feature extraction, the audio model and T5 generate on its own thread, so the
+# encoders overlap with each other and with decoding of the next batch.
+
+import argparse
+import queue
+import threading
+import time
+import pandas as pd
+import torch
+from torch.utils.data import default_collate
+from transformers import T5Tokenizer
+from encoders import ENCODERS, SAMPLE_RATES, DATASET_HELPERS, CLIP_SECONDS, build_model, fit_length
+from resampling import load_audio, resample_batch
+from utils import load_checkpoint, layer_suffix
+
+def parse_compare_args():
+    parser = argparse.ArgumentParser(description="Side-by-side captions from every encoder with a single decode pass.")
+    parser.add_argument('--data_path', type=str, default="../data/splits/test.csv", help="CSV with file_path, ytid and caption columns.")
+    parser.add_argument('--encoders', type=str, default=",".join(ENCODERS), help="Comma-separated encoders to compare.")
+    parser.add_argument('--frozen', action='store_true', help="Compare the frozen-encoder checkpoints.")
+    parser.add_argument('--num_layers', type=int, default=None, help="Encoder layers kept by the mert and wav2vec2 checkpoints (default: all).")
+    parser.add_argument('--last_epoch', type=int, default=0, help="Checkpoint epoch to load for every encoder (0 = untrained).")
+    parser.add_argument('--batch_size', type=int, default=8, help="Clips per decode batch.")
+    parser.add_argument('--max_length', type=int, default=50, help="Maximum caption length passed to inference().")
+    parser.add_argument('--queue_size', type=int, default=2, help="Decoded batches buffered per encoder.")
+    parser.add_argument('--max_clips', type=int, default=None, help="Only caption the first N clips.")
+    parser.add_argument('--output', type=str, default="compare.csv", help="Where to write the side-by-side captions.")
+    return parser.parse_args()
+
+def decode_batch(paths, encoder_names):
+    """
+    Decode each file once and resample it to every encoder's rate.
+    Returns:
+        dict: Per encoder, a list of fixed-length waveforms.
+    """
+    clips = [load_audio(path) for path in paths]
+    by_rate = {}
+    for orig_sr in sorted({sr for _, sr in clips}):
+        indices = [i for i, (_, sr) in enumerate(clips) if sr == orig_sr]
+        for new_sr in {SAMPLE_RATES[name] for name in encoder_names}:
+            resampled = resample_batch([clips[i][0] for i in indices], orig_sr, new_sr)
+            for i, audio in zip(indices, resampled):
+                by_rate.setdefault(new_sr, [None] * len(clips))[i] = audio
+
+    decoded = {}
+    for name in encoder_names:
+        sample_rate = SAMPLE_RATES[name]
+        waveforms = [fit_length(audio, CLIP_SECONDS * sample_rate) for audio in by_rate[sample_rate]]
+        if name == "clap":
+            waveforms = [DATASET_HELPERS["clap"].normalize_audio(audio) for audio in waveforms]
+        decoded[name] = waveforms
+    return decoded
+
+def encoder_worker(encoder_name, model, processor, tokenizer, inbox, predictions, timings, max_length):
+    prepare_inputs = DATASET_HELPERS[encoder_name].prepare_inputs
+    sample_rate = SAMPLE_RATES[encoder_name]
+    while True:
+        job = inbox.get()
+        if job is None:
+            return
+        start, waveforms = job
+        began = time.perf_counter()
+        try:
+            batch = default_collate([prepare_inputs(audio, sample_rate, processor) for audio in waveforms])
+            predictions[start:start + len(waveforms)] = model.inference(batch, tokenizer, max_length=max_length)
+        except Exception as e:
+            # Keep draining the queue so the decode thread never blocks on a dead encoder
+            print(f"Error captioning clips {start}-{start + len(waveforms)} with {encoder_name}: {e}")
+        timings[encoder_name] += time.perf_counter() - began
+
+if __name__ == "__main__":
+    args = parse_compare_args()
+    DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+    encoder_names = args.encoders.split(",")
+    data = pd.read_csv(args.data_path)
+    if args.max_clips is not None:
+        data = data.iloc[:args.max_clips]
+    paths = list(data["file_path"])
+
+    t5_tokenizer = T5Tokenizer.from_pretrained("t5-small")
+    predictions = {name: [None] * len(paths) for name in encoder_names}
+    timings = {name: 0.0 for name in encoder_names}
+    inboxes, workers = {}, []
+    for name in encoder_names:
+        num_layers = None if name == "clap" else args.num_layers
+        model, processor = build_model(name, DEVICE, args.frozen, num_layers)
+        if args.last_epoch != 0:
+            model_save_path = f"checkpoints/{name}_t5_" + ("frozen" if args.frozen else "unfrozen")
+            model_save_path += layer_suffix(model)
+            model, _, _, _ = load_checkpoint(model, None, model_save_path + f"/checkpoint{args.last_epoch}.pth")
+        model.eval()
+        inboxes[name] = queue.Queue(maxsize=args.queue_size)
+        worker = threading.Thread(target=encoder_worker, daemon=True,
+                                  args=(name, model, processor, t5_tokenizer, inboxes[name], predictions[name], timings, args.max_length))
+        worker.start()
+        workers.append(worker)
+
+    # Decode on the main thread; put() blocks when an encoder falls queue_size batches behind
+    total_start = time.perf_counter()
+    decode_s = 0.0
+    for start in range(0, len(paths), args.batch_size):
+        began = time.perf_counter()
+        decoded = decode_batch(paths[start:start + args.batch_size], encoder_names)
+        decode_s += time.perf_counter() - began
+        for name in encoder_names:
+            inboxes[name].put((start, decoded[name]))
+        print(f"Decoded {min(start + args.batch_size, len(paths))}/{len(paths)} clips")
+    for name in encoder_names:
+        inboxes[name].put(None)
+    for worker in workers:
+        worker.join()
+    total_s = time.perf_counter() - total_start
+
+    # One row per clip with every encoder's caption side by side
+    output = pd.DataFrame({"ytid": data["ytid"], "caption": data["caption"]})
+    for name in encoder_names:
+        output[f"{name}_prediction"] = predictions[name]
+    output.to_csv(args.output, index=False)
+    print(f"Side-by-side captions saved to {args.output}")
+
+    print(f"Wall time {total_s:.1f}s, decode {decode_s:.1f}s, " + ", ".join(f"{name} {timings[name]:.1f}s" for name in encoder_names))
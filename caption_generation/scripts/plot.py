@@ -0,0 +1,77 @@
+# Run from caption_generation directory with:
+# python -m scripts.plot
+# python -m scripts.plot --logs checkpoints/clap_t5_frozen/metrics.jsonl ../models/checkpoints_norm/metrics.jsonl
+#
+# Renders plots/fine_tuned_<run>_loss_plot.png (train and validation loss per epoch)
+# from the metrics logs written during training, plus a _wer_plot.png when the log
+# has WER and a _step_loss_plot.png of the per-step loss. Never runs inside training.
+
+import argparse
+import glob
+import os
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+import numpy as np
+from metrics_logger import read_metrics
+
+def parse_plot_args():
+    parser = argparse.ArgumentParser(description="Plot training curves from metrics logs.")
+    parser.add_argument('--logs', type=str, nargs="*", default=None, help="Metrics files (default: checkpoints/*/metrics.jsonl).")
+    parser.add_argument('--output_dir', type=str, default="../plots")
+    parser.add_argument('--smooth', type=int, default=50, help="Moving-average window for the per-step loss.")
+    return parser.parse_args()
+
+def plot_epoch_metric(epochs, metric, label, output_path):
+    """Train vs validation curve of `metric` per epoch; returns False if the log has neither."""
+    train = [(r["epoch"], r[f"train_{metric}"]) for r in epochs if r.get(f"train_{metric}") is not None]
+    val = [(r["epoch"], r[f"val_{metric}"]) for r in epochs if r.get(f"val_{metric}") is not None]
+    if not train and not val:
+        return False
+    plt.figure(figsize=(10, 6))
+    for points, name in ((train, "Train"), (val, "Validation")):
+        if points:
+            plt.plot(*zip(*points), marker='o', label=f"{name} {label}")
+    plt.xlabel("Epoch")
+    plt.ylabel(label)
+    plt.title(f"Train and Validation {label} Over Epochs")
+    plt.legend()
+    plt.grid(True)
+    plt.savefig(output_path)
+    plt.close()
+    return True
+
+def plot_step_loss(steps, window, output_path):
+    losses = np.array([r["loss"] for r in steps if "loss" in r])
+    if len(losses) == 0:
+        return False
+    plt.figure(figsize=(10, 6))
+    plt.plot(losses, alpha=0.3, label="Loss")
+    if len(losses) >= window > 1:
+        plt.plot(np.arange(window - 1, len(losses)), np.convolve(losses, np.ones(window) / window, mode="valid"), label=f"{window}-step mean")
+    plt.xlabel("Step")
+    plt.ylabel("Loss")
+    plt.title("Training Loss per Step")
+    plt.legend()
+    plt.grid(True)
+    plt.savefig(output_path)
+    plt.close()
+    return True
+
+if __name__ == "__main__":
+    args = parse_plot_args()
+    log_paths = args.logs if args.logs else sorted(glob.glob("checkpoints/*/metrics.jsonl"))
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    for log_path in log_paths:
+        steps, epochs = read_metrics(log_path)
+        run = (epochs or steps)[0]["run"] if (epochs or steps) else os.path.basename(os.path.dirname(log_path))
+        prefix = os.path.join(args.output_dir, f"fine_tuned_{run}")
+        written = []
+        if plot_epoch_metric(epochs, "loss", "Loss", f"{prefix}_loss_plot.png"):
+            written.append(f"{prefix}_loss_plot.png")
+        if plot_epoch_metric(epochs, "wer", "WER", f"{prefix}_wer_plot.png"):
+            written.append(f"{prefix}_wer_plot.png")
+        if plot_step_loss(steps, args.smooth, f"{prefix}_step_loss_plot.png"):
+            written.append(f"{prefix}_step_loss_plot.png")
+        print(f"{log_path}: " + (", ".join(written) if written else "no metrics to plot"))
@@ -0,0 +1,62 @@
+# Run from caption_generation directory with:
+# python -m scripts.retrieval build --data_path ../data/splits/train.csv
+# python -m scripts.retrieval evaluate
+# python -m scripts.retrieval search --query "upbeat punk rock with distorted guitars"
+
+import argparse
+import os
+import numpy as np
+import pandas as pd
+from retrieval import IVFIndex, ClapEmbedder, evaluate_index
+
+def parse_retrieval_args():
+    parser = argparse.ArgumentParser(description="Text-to-music retrieval over CLAP audio embeddings.")
+    parser.add_argument('command', choices=["build", "evaluate", "search"])
+    parser.add_argument('--data_path', type=str, default="../data/splits/train.csv", help="CSV with file_path, ytid and caption columns.")
+    parser.add_argument('--index_dir', type=str, default="checkpoints/clap_index", help="Where embeddings and the index are stored.")
+    parser.add_argument('--nlist', type=int, default=1024, help="Number of inverted lists (coarse centroids).")
+    parser.add_argument('--nprobe', type=int, default=16, help="Number of lists scanned per query.")
+    parser.add_argument('--pq_subspaces', type=int, default=None, help="Enable product quantization with this many subspaces.")
+    parser.add_argument('--k', type=int, default=10, help="Number of results per query.")
+    parser.add_argument('--query', type=str, default=None, help="Text query for the search command.")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_retrieval_args()
+    embeddings_path = os.path.join(args.index_dir, "audio_embeddings.npy")
+    index_path = os.path.join(args.index_dir, "index.npz")
+    data = pd.read_csv(args.data_path)
+
+    if args.command == "build":
+        os.makedirs(args.index_dir, exist_ok=True)
+        if os.path.exists(embeddings_path):
+            embeddings = np.load(embeddings_path)
+            print(f"Loaded {len(embeddings)} cached audio embeddings from {embeddings_path}")
+        else:
+            embedder = ClapEmbedder()
+            embeddings = embedder.embed_audio(list(data["file_path"]))
+            np.save(embeddings_path, embeddings)
+
+        index = IVFIndex(nlist=args.nlist, nprobe=args.nprobe, pq_subspaces=args.pq_subspaces)
+        index.train(embeddings).add(embeddings)
+        index.save(index_path)
+
+    elif args.command == "evaluate":
+        # Captions are natural text queries whose audio is known to be in the corpus
+        embeddings = np.load(embeddings_path)
+        index = IVFIndex.load(index_path)
+        queries = ClapEmbedder().embed_text(list(data["caption"]))
+        for nprobe in sorted({1, max(1, args.nprobe // 4), args.nprobe, min(index.nlist, args.nprobe * 4)}):
+            results = evaluate_index(index, embeddings, queries, k=args.k, nprobe=nprobe)
+            print(f"nprobe={nprobe}: " + ", ".join(f"{name}={value:.4f}" for name, value in results.items()))
+
+    elif args.command == "search":
+        if args.query is None:
+            raise ValueError("--query is required for the search command.")
+        index = IVFIndex.load(index_path)
+        query = ClapEmbedder().embed_text([args.query])
+        ids, scores = index.search(query, k=args.k)
+        for rank, (row, score) in enumerate(zip(ids[0], scores[0]), start=1):
+            if row < 0:
+                break
+            print(f"{rank:2d}. {data.iloc[row]['ytid']} ({score:.4f}) {data.iloc[row]['caption']}")
@@ -7,7 +7,7 @@ from models import ClapT5Model
 from models import MertT5Model
 from models import Wav2Vec2T5Model
 from transformers import T5Tokenizer, Wav2Vec2Processor, AutoProcessor, Wav2Vec2FeatureExtractor
-from utils import load_checkpoint, evaluate, parse_args, calculate_bert_similarity
+from utils import load_checkpoint, layer_suffix, evaluate, parse_args, calculate_bert_similarity
 from dataset import ClapAudioCaptionDataset, MertAudioCaptionDataset, Wav2Vec2AudioCaptionDataset  # Adjust if needed
 from tqdm import tqdm 
 
@@ -34,6 +34,8 @@ if __name__ == "__main__":
         model_save_path += "unfrozen"
 
     t5_tokenizer = T5Tokenizer.from_pretrained("t5-small")
+    if EMBED_MODEL == "clap" and args.num_layers is not None:
+        raise ValueError("--num_layers only applies to the mert and wav2vec2 encoders.")
     if EMBED_MODEL == "clap":
         BATCH_SIZE = 8
         audio_processor = AutoProcessor.from_pretrained("laion/larger_clap_music")
@@ -42,15 +44,16 @@ if __name__ == "__main__":
     elif EMBED_MODEL == "mert":
         BATCH_SIZE = 4
         audio_processor = Wav2Vec2FeatureExtractor.from_pretrained("m-a-p/MERT-v1-95M")
-        model = MertT5Model(DEVICE, frozen=FROZEN)
+        model = MertT5Model(DEVICE, frozen=FROZEN, num_layers=args.num_layers)
         AudioCaptionDataset = MertAudioCaptionDataset
     elif EMBED_MODEL == "wav2vec2":
         BATCH_SIZE = 8
         audio_processor = Wav2Vec2Processor.from_pretrained("facebook/wav2vec2-base-960h")
-        model = Wav2Vec2T5Model(DEVICE, frozen=FROZEN)
+        model = Wav2Vec2T5Model(DEVICE, frozen=FROZEN, num_layers=args.num_layers)
         AudioCaptionDataset = Wav2Vec2AudioCaptionDataset
     else:
         raise ValueError("Invalid embedding model specified.")
+    model_save_path += layer_suffix(model)
 
     # Load dataset
     test_dataset = AudioCaptionDataset(test_data_path, audio_processor, t5_tokenizer)
@@ -1,39 +1,61 @@
 # Run from caption_generation directory with:
 # python -m scripts.train
+# For N CPU data-parallel workers (gloo backend):
+# python -m scripts.train --world_size N
 
 import torch
+from torch.nn.parallel import DistributedDataParallel
 from torch.utils.data import DataLoader
+import glob
 import os
 from models import ClapT5Model
 from models import MertT5Model
 from models import Wav2Vec2T5Model
 from transformers import AutoProcessor, T5Tokenizer, Wav2Vec2FeatureExtractor, Wav2Vec2Processor
 from tqdm import tqdm
-from utils import parse_args, save_checkpoint, load_checkpoint, upload_to_gcs
+from utils import parse_args, save_checkpoint, load_checkpoint, layer_suffix, upload_to_gcs, get_rng_state, set_rng_state
 from google.cloud import storage
 from utils import evaluate
+from profiling import StageTimer, write_jsonl, make_torch_profiler, format_breakdown
+from metrics_logger import MetricsLogger, system_metrics
+from sampler import ResumableSampler, ShardSampler
+import distributed
+import time
 
-if __name__ == "__main__":
+def find_resume_checkpoint(model_save_path):
+    """Return the most recently written checkpoint (mid-epoch or end-of-epoch), or None."""
+    candidates = glob.glob(os.path.join(model_save_path, "checkpoint*.pth"))
+    return max(candidates, key=os.path.getmtime) if candidates else None
+
+def train(rank, world_size, args):
     # Setup & hyperparameters
-    DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+    # Multi-process training is CPU-only: every rank runs on its own slice of cores
+    DEVICE = "cuda" if torch.cuda.is_available() and world_size == 1 else "cpu"
     USE_GCP = False
     train_data_path = "../data/splits/train.csv"
     val_data_path = "../data/splits/val.csv"
+    is_main = distributed.is_main_process(rank)
+
+    distributed.setup(rank, world_size, args.master_port)
+    if world_size > 1:
+        rank_cpus = distributed.pin_threads(rank, world_size, args.threads_per_rank)
+        print(f"Rank {rank}/{world_size} pinned to CPUs {rank_cpus}")
 
-    print("Device:", DEVICE)
-    if USE_GCP:
+    if is_main:
+        print("Device:", DEVICE)
+    if USE_GCP and is_main:
         # Initialize Google Cloud Storage client
         gcs_bucket_name = "musiccaps-wav-16khz"
         storage_client = storage.Client()
         bucket = storage_client.bucket(gcs_bucket_name)
 
-    args = parse_args()
     EMBED_MODEL = args.embedding
     FROZEN = args.frozen
     EPOCHS = args.epochs
     LAST_EPOCH = args.last_epoch
     LEARNING_RATE = args.learning_rate
-    print(f"Training configuration: Embed Model = {EMBED_MODEL}, Frozen = {FROZEN}, Epochs = {EPOCHS}, Last Epoch = {LAST_EPOCH}, Learning Rate = {LEARNING_RATE}")
+    if is_main:
+        print(f"Training configuration: Embed Model = {EMBED_MODEL}, Frozen = {FROZEN}, Epochs = {EPOCHS}, Last Epoch = {LAST_EPOCH}, Learning Rate = {LEARNING_RATE}, Encoder Layers = {args.num_layers or 'all'}, World Size = {world_size}")
 
     model_save_path = f"checkpoints/{EMBED_MODEL}_t5_"
     gcloud_path = f"checkpoints/{EMBED_MODEL}_t5_"
@@ -43,9 +65,9 @@ if __name__ == "__main__":
     else:
         model_save_path += "unfrozen"
         gcloud_path += "unfrozen"
-    os.makedirs(model_save_path, exist_ok=True)
-
     t5_tokenizer = T5Tokenizer.from_pretrained("t5-small")
+    if EMBED_MODEL == "clap" and args.num_layers is not None:
+        raise ValueError("--num_layers only applies to the mert and wav2vec2 encoders.")
     if EMBED_MODEL == "clap":
         BATCH_SIZE = 8
         audio_processor = AutoProcessor.from_pretrained("laion/larger_clap_music")
@@ -54,48 +76,181 @@ if __name__ == "__main__":
     elif EMBED_MODEL == "mert":
         BATCH_SIZE = 4
         audio_processor = Wav2Vec2FeatureExtractor.from_pretrained("m-a-p/MERT-v1-95M")
-        model = MertT5Model(DEVICE, frozen=FROZEN)
+        model = MertT5Model(DEVICE, frozen=FROZEN, num_layers=args.num_layers)
         from dataset import MertAudioCaptionDataset as AudioCaptionDataset
     elif EMBED_MODEL == "wav2vec2":
         BATCH_SIZE = 8
         audio_processor = Wav2Vec2Processor.from_pretrained("facebook/wav2vec2-base-960h")
-        model = Wav2Vec2T5Model(DEVICE, frozen=FROZEN)
+        model = Wav2Vec2T5Model(DEVICE, frozen=FROZEN, num_layers=args.num_layers)
         from dataset import Wav2Vec2AudioCaptionDataset as AudioCaptionDataset
     else:
         raise ValueError("Invalid embedding model specified.")
 
+    # Layer-truncated encoders get their own checkpoints; --num_layers at full depth is the same model
+    model_save_path += layer_suffix(model)
+    gcloud_path += layer_suffix(model)
+    os.makedirs(model_save_path, exist_ok=True)
+
     # Load dataset
     train_dataset = AudioCaptionDataset(train_data_path, audio_processor, t5_tokenizer)
     val_dataset = AudioCaptionDataset(val_data_path, audio_processor, t5_tokenizer)
 
-    train_loader = DataLoader(train_dataset, batch_size=BATCH_SIZE, shuffle=True, drop_last=True)
-    val_loader = DataLoader(val_dataset, batch_size=BATCH_SIZE, shuffle=False, drop_last=False)
+    # Stage timers are no-ops unless --profile is set
+    timer = StageTimer(enabled=args.profile, synchronize=DEVICE == "cuda")
+    model.timer = timer
+    train_dataset.timer = timer
+    profile_log = args.profile_log or os.path.join(model_save_path, "profile.jsonl")
+
+    # Buffered scalar log for offline plotting (python -m scripts.plot); only rank 0 writes
+    metrics = MetricsLogger(os.path.join(model_save_path, "metrics.jsonl"), enabled=is_main)
+
+    # BATCH_SIZE is per rank; each rank sees a disjoint 1/world_size shard of every epoch.
+    # The train sampler's position is checkpointed so a resumed run skips batches it has already seen.
+    train_sampler = ResumableSampler(train_dataset, num_replicas=world_size, rank=rank, seed=args.seed)
+    train_loader = DataLoader(train_dataset, batch_size=BATCH_SIZE, sampler=train_sampler, drop_last=True)
+    if world_size > 1:
+        # Unpadded shards: DistributedSampler would repeat examples to even them out
+        val_sampler = ShardSampler(val_dataset, num_replicas=world_size, rank=rank)
+        val_loader = DataLoader(val_dataset, batch_size=BATCH_SIZE, sampler=val_sampler, drop_last=False)
+    else:
+        val_loader = DataLoader(val_dataset, batch_size=BATCH_SIZE, shuffle=False, drop_last=False)
 
     # Initialize optimizer
     optimizer = torch.optim.AdamW(model.parameters(), lr=LEARNING_RATE)
 
-    # Load checkpoint if available
-    if LAST_EPOCH != 0:
-        model, optimizer, start_epoch, _ = load_checkpoint(model, optimizer, model_save_path + f"/checkpoint{LAST_EPOCH}.pth")
+    # Load checkpoint if available (every rank loads, so optimizer state matches too)
+    start_epoch, final_epoch = LAST_EPOCH + 1, LAST_EPOCH + EPOCHS
+    start_step, resumed_train_loss, resumed_rng_state = 0, 0, None
+    resume_path = find_resume_checkpoint(model_save_path) if args.resume else None
+    if resume_path is not None:
+        model, optimizer, checkpoint_epoch, _, training_state = load_checkpoint(model, optimizer, resume_path, return_training_state=True)
+        if training_state is None:
+            # End-of-epoch checkpoint written before training state was recorded
+            start_epoch, final_epoch = checkpoint_epoch + 1, checkpoint_epoch + EPOCHS
+        else:
+            if len(training_state["per_rank"]) != world_size:
+                raise ValueError(f"Checkpoint was written with world size {len(training_state['per_rank'])}, not {world_size}.")
+            start_epoch, start_step = training_state["epoch"], training_state["step"]
+            if start_step > 0:
+                # Mid-epoch: finish the run that was interrupted
+                final_epoch = training_state["final_epoch"]
+            else:
+                # End-of-epoch: train --epochs more, like a legacy checkpoint
+                final_epoch = start_epoch - 1 + EPOCHS
+            resumed_train_loss = training_state["per_rank"][rank]["total_train_loss"]
+            resumed_rng_state = training_state["per_rank"][rank]["rng_state"]
+            train_sampler.load_state_dict(training_state["sampler"])
+        if is_main:
+            print(f"Resuming at epoch {start_epoch}, step {start_step}")
+            if start_epoch > final_epoch:
+                print(f"Nothing to train: {resume_path} already completed epoch {final_epoch}; pass --epochs to train further.")
+    elif LAST_EPOCH != 0:
+        model, optimizer, _, _ = load_checkpoint(model, optimizer, model_save_path + f"/checkpoint{LAST_EPOCH}.pth")
+
+    if world_size > 1:
+        # CLAP's text tower never receives gradients, so unused parameters must be tolerated
+        model = DistributedDataParallel(model, find_unused_parameters=True)
 
     # Training loop
-    for epoch in range(LAST_EPOCH + 1, LAST_EPOCH + EPOCHS + 1):
+    torch_profiler = None
+    if args.torch_profile_steps > 0 and is_main:
+        torch_profiler = make_torch_profiler(args.torch_profile_start, args.torch_profile_steps, os.path.join(model_save_path, "traces"))
+        torch_profiler.start()
+
+    def training_state(epoch, step, total_train_loss):
+        # Collective: every rank contributes its own RNG state and loss accumulator
+        per_rank = distributed.all_gather_objects({"rng_state": get_rng_state(), "total_train_loss": total_train_loss}, world_size)
+        return {
+            "epoch": epoch,
+            "step": step,
+            "final_epoch": final_epoch,
+            "sampler": {"epoch": epoch, "seed": train_sampler.seed, "start_index": step * BATCH_SIZE},
+            "per_rank": per_rank,
+        }
+
+    latest_checkpoint = model_save_path + "/checkpoint_latest.pth"
+    # Restore RNGs last, after model construction has consumed random numbers for initialization
+    if resumed_rng_state is not None:
+        set_rng_state(resumed_rng_state)
+
+    for epoch in range(start_epoch, final_epoch + 1):
         model.train()  # Ensure the model is in training mode
-        total_train_loss = 0
-        for batch in tqdm(train_loader, desc=f"Epoch {epoch}/{LAST_EPOCH + EPOCHS}"):
+        step = start_step if epoch == start_epoch else 0
+        total_train_loss = resumed_train_loss if epoch == start_epoch else 0
+        train_sampler.set_epoch(epoch, start_index=step * BATCH_SIZE)
+        timer.reset()
+        epoch_start = time.perf_counter()
+        step_start = time.perf_counter()
+        for batch in tqdm(timer.iterate(train_loader, "data"), total=len(train_loader), desc=f"Epoch {epoch}/{final_epoch}", disable=not is_main):
             optimizer.zero_grad()
             outputs = model(batch)
             loss = outputs.loss
-            loss.backward()
-            optimizer.step()
-            total_train_loss += loss.item()
-    
-        avg_train_loss = total_train_loss / len(train_loader)
-        avg_val_loss, _, _ = evaluate(model, val_loader)
-        print(f"Epoch {epoch}/{LAST_EPOCH + EPOCHS} Training Loss: {avg_train_loss:.4f} Validation Loss: {avg_val_loss:.4f}")
-
-        # Save the model checkpoint
-        checkpoint_name = f"/checkpoint{epoch}.pth"
-        save_checkpoint(model, optimizer, epoch, avg_val_loss, model_save_path + checkpoint_name)
-        if USE_GCP:
-            upload_to_gcs(model_save_path + checkpoint_name, gcloud_path + checkpoint_name, bucket, delete_locally=False)
\ No newline at end of file
+            with timer.section("backward"):
+                loss.backward()
+            with timer.section("step"):
+                optimizer.step()
+            loss_value = loss.item()
+            total_train_loss += loss_value
+            step += 1
+            step_end = time.perf_counter()
+            metrics.log_step(step, epoch=epoch, loss=loss_value, lr=optimizer.param_groups[0]["lr"],
+                             step_s=step_end - step_start, clips_per_sec=BATCH_SIZE * world_size / (step_end - step_start))
+            step_start = step_end
+            if torch_profiler is not None:
+                torch_profiler.step()
+
+            if args.checkpoint_every > 0 and step % args.checkpoint_every == 0:
+                state = training_state(epoch, step, total_train_loss)
+                if is_main:
+                    save_checkpoint(distributed.unwrap(model), optimizer, epoch, None, latest_checkpoint, training_state=state)
+                    if USE_GCP:
+                        upload_to_gcs(latest_checkpoint, gcloud_path + "/checkpoint_latest.pth", bucket, delete_locally=False)
+                distributed.barrier(world_size)
+        train_time = time.perf_counter() - epoch_start
+        stages = timer.summary()  # Before validation, which also runs the model's timed sections
+
+        # Validate on the unwrapped model; each rank evaluates its own shard
+        val_loss_sum, num_val_examples, _, _ = evaluate(distributed.unwrap(model), val_loader, return_sums=True)
+
+        # Training: mean of per-batch losses (every batch is full). Validation: mean over every example once
+        total_train_loss_all, num_train_batches, total_val_loss, num_val_examples = distributed.all_reduce_sum(
+            [total_train_loss, step, val_loss_sum, num_val_examples], world_size)
+        avg_train_loss = total_train_loss_all / num_train_batches
+        avg_val_loss = total_val_loss / num_val_examples
+
+        if is_main:
+            print(f"Epoch {epoch}/{final_epoch} Training Loss: {avg_train_loss:.4f} Validation Loss: {avg_val_loss:.4f}")
+        metrics.log_epoch(epoch, train_loss=avg_train_loss, val_loss=avg_val_loss, train_time_s=train_time,
+                          clips_per_sec=BATCH_SIZE * world_size * (step - (start_step if epoch == start_epoch else 0)) / train_time,
+                          **system_metrics(optimizer))
+        if args.profile and is_main:
+            write_jsonl(profile_log, {
+                "epoch": epoch,
+                "steps": step,
+                "train_time_s": train_time,
+                "train_loss": avg_train_loss,
+                "val_loss": avg_val_loss,
+                "stages": stages,
+            })
+            print("Stage breakdown: " + format_breakdown(stages, train_time))
+
+        # Save the model checkpoint; it resumes at the start of the next epoch
+        state = training_state(epoch + 1, 0, 0)
+        if is_main:
+            checkpoint_name = f"/checkpoint{epoch}.pth"
+            save_checkpoint(distributed.unwrap(model), optimizer, epoch, avg_val_loss, model_save_path + checkpoint_name, training_state=state)
+            if USE_GCP:
+                upload_to_gcs(model_save_path + checkpoint_name, gcloud_path + checkpoint_name, bucket, delete_locally=False)
+            # The mid-epoch checkpoint is now stale
+            if os.path.exists(latest_checkpoint):
+                os.remove(latest_checkpoint)
+        distributed.barrier(world_size)
+
+    if torch_profiler is not None:
+        torch_profiler.stop()
+    metrics.close()
+    distributed.cleanup(world_size)
+
+if __name__ == "__main__":
+    args = parse_args()
+    distributed.launch(train, args.world_size, args)
@@ -1,4 +1,6 @@
 import argparse
+import random
+import numpy as np
 import torch
 import shutil
 import os
@@ -9,9 +11,16 @@ from sklearn.metrics.pairwise import cosine_similarity
 # Evaluation function
 from tqdm import tqdm
 
-def evaluate(model, data_loader):
+def evaluate(model, data_loader, return_sums=False):
+    """
+    Loss over every example in `data_loader`, weighting each example equally
+    (outputs.loss is a per-batch mean, so it is scaled back up by the batch size).
+    With return_sums=True the summed loss and example count are returned instead
+    of the mean, so sharded evaluations can be added up across ranks.
+    """
     model.eval()
     total_loss = 0
+    num_examples = 0
     predictions = []
     true_labels = []
 
@@ -19,19 +28,23 @@ def evaluate(model, data_loader):
         for batch in tqdm(data_loader, desc="Evaluating"):
             # Forward pass through the model
             outputs = model(batch)
-            total_loss += outputs.loss.item()
+            batch_size = batch['labels'].shape[0]
+            total_loss += outputs.loss.item() * batch_size
+            num_examples += batch_size
             
             # Collect the predictions and true labels
             predictions.append(outputs.logits.argmax(dim=-1).cpu().numpy())
             true_labels.append(batch['labels'].cpu().numpy())
 
-    avg_loss = total_loss / len(data_loader)
+    avg_loss = total_loss / num_examples if num_examples else 0.0
     
     # Flatten the predictions and true_labels lists for easier comparison
     predictions = [item for sublist in predictions for item in sublist]
     true_labels = [item for sublist in true_labels for item in sublist]
 
     model.train()  # Set the model back to training mode
+    if return_sums:
+        return total_loss, num_examples, predictions, true_labels
     return avg_loss, predictions, true_labels
 
 
@@ -106,28 +119,73 @@ def parse_args():
     parser.add_argument('--frozen', type=bool, default=False, help="Set whether to freeze the embedding model (True/False).")
     parser.add_argument('--epochs', type=int, default=1, help="Number of epochs to train the model.")
     parser.add_argument('--last_epoch', type=int, default=0, help="The last epoch used for checkpointing.")
+    parser.add_argument('--num_layers', type=int, default=None, help="Run only the first K encoder transformer layers (mert and wav2vec2; default: all).")
     parser.add_argument('--learning_rate', type=float, default=1e-4, help="Learning rate for the optimizer.")
+    parser.add_argument('--checkpoint_every', type=int, default=0, help="Also write a resumable mid-epoch checkpoint every N steps (0 disables).")
+    parser.add_argument('--resume', action='store_true', help="Resume from the latest mid-epoch checkpoint, continuing at the next unseen batch.")
+    parser.add_argument('--seed', type=int, default=42, help="Seed for the per-epoch shuffling order.")
+    parser.add_argument('--world_size', type=int, default=1, help="Number of CPU DistributedDataParallel worker processes (gloo backend).")
+    parser.add_argument('--threads_per_rank', type=int, default=None, help="Intra-op threads per worker (default: available CPUs / world_size).")
+    parser.add_argument('--master_port', type=int, default=29500, help="Rendezvous port for multi-process training.")
+    parser.add_argument('--profile', action='store_true', help="Time data wait, encoder, decoder, backward and step; write per-epoch summaries.")
+    parser.add_argument('--profile_log', type=str, default=None, help="JSONL file for per-epoch profiling summaries (default: <checkpoint dir>/profile.jsonl).")
+    parser.add_argument('--torch_profile_steps', type=int, default=0, help="Record a torch.profiler trace for this many steps (0 disables).")
+    parser.add_argument('--torch_profile_start', type=int, default=10, help="Training step at which the torch.profiler window starts.")
     
     return parser.parse_args()
 
+def layer_suffix(model):
+    """Checkpoint directory suffix for layer-truncated encoders; empty at full depth."""
+    return f"_layers{model.num_layers}" if getattr(model, "layers_truncated", False) else ""
+
 # Saving model and optimizer checkpoint
-def save_checkpoint(model, optimizer, epoch, loss, filename):
+def save_checkpoint(model, optimizer, epoch, loss, filename, training_state=None):
     checkpoint = {
         'epoch': epoch,
         'model_state_dict': model.state_dict(),
         'optimizer_state_dict': optimizer.state_dict(),
         'loss': loss,
+        'num_layers': getattr(model, 'num_layers', None),  # Encoder depth of layer-truncated models
     }
-    torch.save(checkpoint, filename)
+    if training_state is not None:
+        checkpoint['training_state'] = training_state
+    # Write to a temporary file and rename so a kill mid-save never leaves a truncated checkpoint
+    tmp_filename = filename + ".tmp"
+    torch.save(checkpoint, tmp_filename)
+    os.replace(tmp_filename, filename)
     print(f"Checkpoint saved at {filename}")
 
 # Loading model and optimizer checkpoint
-def load_checkpoint(model, optimizer, filename):
-    checkpoint = torch.load(filename)
+def load_checkpoint(model, optimizer, filename, return_training_state=False):
+    # Our own checkpoints also hold RNG states, which are not plain tensors
+    checkpoint = torch.load(filename, map_location="cpu", weights_only=False)
+    saved_layers, model_layers = checkpoint.get('num_layers'), getattr(model, 'num_layers', None)
+    if saved_layers is not None and saved_layers != model_layers:
+        raise ValueError(f"{filename} was trained with num_layers={saved_layers}, but the model has {model_layers}")
     model.load_state_dict(checkpoint['model_state_dict'])
     if optimizer is not None:
         optimizer.load_state_dict(checkpoint['optimizer_state_dict'])
     epoch = checkpoint['epoch']
     loss = checkpoint['loss']
     print(f"Checkpoint loaded from {filename}")
-    return model, optimizer, epoch, loss
\ No newline at end of file
+    if return_training_state:
+        return model, optimizer, epoch, loss, checkpoint.get('training_state')
+    return model, optimizer, epoch, loss
+
+def get_rng_state():
+    """Capture every RNG that can affect training (shuffling, dropout, augmentation)."""
+    state = {
+        'python': random.getstate(),
+        'numpy': np.random.get_state(),
+        'torch': torch.get_rng_state(),
+    }
+    if torch.cuda.is_available():
+        state['cuda'] = torch.cuda.get_rng_state_all()
+    return state
+
+def set_rng_state(state):
+    random.setstate(state['python'])
+    np.random.set_state(state['numpy'])
+    torch.set_rng_state(state['torch'])
+    if 'cuda' in state and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state['cuda'])
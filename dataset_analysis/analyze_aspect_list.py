@@ -1,58 +1,49 @@
-import pandas as pd
-import ast
+import numpy as np
+from aspect_table import AspectTable
 
-def get_aspects():
-    file_path = '../data/musiccaps-train-data.csv'
+file_path = '../data/musiccaps-train-data.csv'
 
-    df = pd.read_csv(file_path)
+def get_aspects(table=None):
+    if table is None:
+        table = AspectTable.load(file_path)
+    return set(table.vocab.tolist())
 
-    aspects = set()
-    for aspect_list in df['aspect_list'].apply(ast.literal_eval):
-        for aspect in aspect_list:
-            aspects.add(aspect)
+def get_avg_num_aspects(table=None):
+    if table is None:
+        table = AspectTable.load(file_path)
+    return table.lengths.mean()
 
-    return aspects
+def get_min_aspects(table=None):
+    if table is None:
+        table = AspectTable.load(file_path)
+    return table.lengths.min()
 
-def get_avg_num_aspects():
-    file_path = '../data/musiccaps-train-data.csv'
+def get_max_aspects(table=None):
+    if table is None:
+        table = AspectTable.load(file_path)
+    return table.lengths.max()
 
-    df = pd.read_csv(file_path)
-
-    total = 0
-    for aspect_list in df['aspect_list'].apply(ast.literal_eval):
-        total += len(aspect_list)
-
-    return total / len(df['aspect_list'])
-
-def get_min_aspects():
-    file_path = '../data/musiccaps-train-data.csv'
-
-    df = pd.read_csv(file_path)
-
-    min = 11
-    for aspect_list in df['aspect_list'].apply(ast.literal_eval):
-        if len(aspect_list) < min:
-            min = len(aspect_list)
-
-    return min
-
-def get_max_aspects():
-    file_path = '../data/musiccaps-train-data.csv'
+def main():
+    # Parsed once (and cached next to the CSV); every statistic comes from the same arrays
+    table = AspectTable.load(file_path)
+    stats = table.statistics()
 
-    df = pd.read_csv(file_path)
+    print(f"Number of aspects: {stats['num_aspects']}")
+    print(f"Average number of aspects: {stats['mean_aspects']}")
+    print(f"Min number of aspects: {stats['min_aspects']}")
+    print(f"Max number of aspects: {stats['max_aspects']}")
 
-    max = 0
-    for aspect_list in df['aspect_list'].apply(ast.literal_eval):
-        if len(aspect_list) > max:
-            max = len(aspect_list)
+    print("\nNumber of aspects per caption:")
+    for length in np.nonzero(stats['length_histogram'])[0]:
+        print(f"{length:3d}: {stats['length_histogram'][length]}")
 
-    return max
+    print("\nMost frequent aspects:")
+    for aspect_id in np.argsort(stats['frequency'])[::-1][:20]:
+        print(f"{stats['frequency'][aspect_id]:5d}  {table.vocab[aspect_id]}")
 
-def main():
-    print(f"Number of aspects: {len(get_aspects())}")
-    print(f"Average number of aspects: {get_avg_num_aspects()}")
-    print(f"Min number of aspects: {get_min_aspects()}")
-    print(f"Max number of aspects: {get_max_aspects()}")
+    print("\nMost frequent aspect pairs:")
+    for first, second, count in table.top_pairs(stats['cooccurrence']):
+        print(f"{count:5d}  {first} + {second}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,202 @@
+import re
+import numpy as np
+import torch
+from torch.utils.data import Sampler
+from aspect_table import AspectTable
+
+class AspectIndex:
+    """
+    Inverted index over an AspectTable: for every aspect id, the sorted array of
+    rows (clips) that carry it. Boolean queries are answered by intersecting,
+    merging and subtracting posting lists instead of scanning the DataFrame.
+
+        index = AspectIndex(AspectTable.load('../data/musiccaps-train-data.csv'))
+        index.ytids('"rock" AND ("male vocal" OR "female vocal") AND NOT "low quality"')
+    """
+
+    def __init__(self, table):
+        self.table = table
+        self.aspect_to_id = {aspect: i for i, aspect in enumerate(table.vocab.tolist())}
+        self.lowercase_to_id = {}
+        for aspect, aspect_id in self.aspect_to_id.items():
+            self.lowercase_to_id.setdefault(aspect.lower(), aspect_id)
+
+        # Sort entries by (aspect id, row) and drop repeats to get CSR-style posting lists
+        ids, rows = table.ids.astype(np.int64), table.row_ids()
+        order = np.lexsort((rows, ids))
+        ids, rows = ids[order], rows[order]
+        first = np.ones(len(ids), dtype=bool)
+        first[1:] = (ids[1:] != ids[:-1]) | (rows[1:] != rows[:-1])
+        self.postings = rows[first]
+        self.posting_offsets = np.concatenate([[0], np.cumsum(np.bincount(ids[first], minlength=len(table.vocab)))])
+        self.all_rows = np.arange(len(table))
+
+    @classmethod
+    def load(cls, csv_path):
+        return cls(AspectTable.load(csv_path))
+
+    def aspect_id(self, aspect):
+        """Exact match first, then case-insensitive; None for unknown aspects."""
+        aspect_id = self.aspect_to_id.get(aspect)
+        return aspect_id if aspect_id is not None else self.lowercase_to_id.get(aspect.lower())
+
+    def posting(self, aspect):
+        """Sorted rows carrying `aspect` (empty for unknown aspects)."""
+        aspect_id = self.aspect_id(aspect)
+        if aspect_id is None:
+            return self.all_rows[:0]
+        return self.postings[self.posting_offsets[aspect_id]:self.posting_offsets[aspect_id + 1]]
+
+    def frequency(self, aspect):
+        aspect_id = self.aspect_id(aspect)
+        return 0 if aspect_id is None else int(self.posting_offsets[aspect_id + 1] - self.posting_offsets[aspect_id])
+
+    def query(self, expression):
+        """Sorted rows matching a boolean expression (see parse_query)."""
+        return self.evaluate(parse_query(expression))
+
+    def evaluate(self, node):
+        op = node[0]
+        if op == "term":
+            return self.posting(node[1])
+        if op == "not":
+            return np.setdiff1d(self.all_rows, self.evaluate(node[1]), assume_unique=True)
+        if op == "and":
+            # Intersect the shortest posting lists first so intermediate results stay small
+            operands = sorted((self.evaluate(child) for child in node[1:]), key=len)
+            rows = operands[0]
+            for operand in operands[1:]:
+                rows = np.intersect1d(rows, operand, assume_unique=True)
+            return rows
+        if op == "or":
+            rows = self.evaluate(node[1])
+            for child in node[2:]:
+                rows = np.union1d(rows, self.evaluate(child))
+            return rows
+        raise ValueError(f"Unknown query node: {op}")
+
+    def ytids(self, expression):
+        return self.table.ytids[self.query(expression)]
+
+    def split_rows(self, split_ytids, expression):
+        """Positions in a split (given by its ytid column) whose clip matches the query."""
+        return np.flatnonzero(np.isin(np.asarray(split_ytids, dtype=str), self.ytids(expression)))
+
+_TOKEN = re.compile(r'\s*(?:"([^"]*)"|\'([^\']*)\'|(\()|(\))|([^\s()"\']+))')
+
+def tokenize_query(expression):
+    tokens = []
+    position = 0
+    expression = expression.strip()
+    while position < len(expression):
+        match = _TOKEN.match(expression, position)
+        if match is None:
+            raise ValueError(f"Cannot parse query at: {expression[position:]!r}")
+        double, single, open_paren, close_paren, word = match.groups()
+        if open_paren or close_paren:
+            tokens.append(("paren", open_paren or close_paren))
+        elif word is not None and word.upper() in ("AND", "OR", "NOT"):
+            tokens.append(("op", word.upper()))
+        elif word is not None:
+            # Consecutive bare words form one aspect, so `male vocal AND rock` works unquoted
+            if tokens and tokens[-1][0] == "bare":
+                tokens[-1] = ("bare", tokens[-1][1] + " " + word)
+            else:
+                tokens.append(("bare", word))
+        else:
+            tokens.append(("term", double if double is not None else single))
+        position = match.end()
+    return [("term", value) if kind == "bare" else (kind, value) for kind, value in tokens]
+
+def parse_query(expression):
+    """
+    Parse a boolean aspect query into a tree of ("term", aspect), ("not", node),
+    ("and", *nodes) and ("or", *nodes). Precedence is NOT > AND > OR; aspects
+    may be quoted, and parentheses group.
+    """
+    tokens = tokenize_query(expression)
+    position = 0
+
+    def peek():
+        return tokens[position] if position < len(tokens) else (None, None)
+
+    def take(kind, value=None):
+        nonlocal position
+        token = peek()
+        if token[0] != kind or (value is not None and token[1] != value):
+            raise ValueError(f"Expected {value or kind} in query {expression!r}, got {token[1]!r}")
+        position += 1
+        return token
+
+    def parse_or():
+        nodes = [parse_and()]
+        while peek() == ("op", "OR"):
+            take("op", "OR")
+            nodes.append(parse_and())
+        return nodes[0] if len(nodes) == 1 else ("or", *nodes)
+
+    def parse_and():
+        nodes = [parse_not()]
+        while peek() == ("op", "AND"):
+            take("op", "AND")
+            nodes.append(parse_not())
+        return nodes[0] if len(nodes) == 1 else ("and", *nodes)
+
+    def parse_not():
+        if peek() == ("op", "NOT"):
+            take("op", "NOT")
+            return ("not", parse_not())
+        if peek() == ("paren", "("):
+            take("paren", "(")
+            node = parse_or()
+            take("paren", ")")
+            return node
+        return ("term", take("term")[1])
+
+    if not tokens:
+        raise ValueError("Empty query")
+    node = parse_or()
+    if position != len(tokens):
+        raise ValueError(f"Unexpected {tokens[position][1]!r} in query {expression!r}")
+    return node
+
+class BalancedAspectSampler(Sampler):
+    """
+    Draws rows so that each group (an aspect or query, e.g. one per genre)
+    appears equally often regardless of how common it is, cycling through the
+    groups and sampling uniformly with replacement within each one.
+
+    Yields table rows; pass `rows` (e.g. the rows of a split) to restrict the
+    draw to them, in which case positions within `rows` are yielded instead.
+    """
+
+    def __init__(self, index, groups, num_samples, rows=None, seed=0):
+        self.num_samples = num_samples
+        self.seed = seed
+        self.epoch = 0
+        rows = None if rows is None else np.asarray(rows)
+        self.members = []
+        for group in groups:
+            matches = index.query(group)
+            if rows is not None:
+                matches = np.flatnonzero(np.isin(rows, matches))
+            if len(matches) > 0:
+                self.members.append(torch.from_numpy(matches))
+        if not self.members:
+            raise ValueError("No group matches any row")
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def __iter__(self):
+        generator = torch.Generator().manual_seed(self.seed + self.epoch)
+        group_order = torch.arange(self.num_samples) % len(self.members)
+        group_order = group_order[torch.randperm(self.num_samples, generator=generator)]
+        samples = torch.empty(self.num_samples, dtype=torch.long)
+        for group, members in enumerate(self.members):
+            slots = (group_order == group).nonzero(as_tuple=True)[0]
+            samples[slots] = members[torch.randint(len(members), (len(slots),), generator=generator)]
+        return iter(samples.tolist())
+
+    def __len__(self):
+        return self.num_samples
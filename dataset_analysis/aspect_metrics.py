@@ -0,0 +1,115 @@
+import torch
+
+def collate_sparse_labels(label_ids, num_labels):
+    """
+    Expand a batch of per-example label id tensors into a dense [B, num_labels]
+    float target. Only the batch is ever dense.
+    Returns:
+        tuple: (targets, rows, cols) where (rows, cols) index the positive entries.
+    """
+    lengths = torch.tensor([len(ids) for ids in label_ids])
+    rows = torch.repeat_interleave(torch.arange(len(label_ids)), lengths)
+    cols = torch.cat(list(label_ids)) if len(rows) else torch.zeros(0, dtype=torch.long)
+    targets = torch.zeros(len(label_ids), num_labels)
+    targets[rows, cols] = 1.0
+    return targets, rows, cols
+
+class StreamingF1:
+    """
+    Per-class true positive, predicted and actual counts accumulated batch by
+    batch, so memory is O(num_labels) rather than examples x num_labels.
+    macro() matches sklearn's f1_score(average='macro') with zero_division=0.
+    """
+
+    def __init__(self, num_labels, threshold=0.0):
+        self.num_labels = num_labels
+        self.threshold = threshold  # On logits; 0.0 is probability 0.5
+        self.reset()
+
+    def reset(self):
+        self.true_positives = torch.zeros(self.num_labels, dtype=torch.long)
+        self.predicted = torch.zeros(self.num_labels, dtype=torch.long)
+        self.actual = torch.zeros(self.num_labels, dtype=torch.long)
+
+    def update(self, logits, rows, cols):
+        """
+        Args:
+            logits (torch.Tensor): [B, num_labels] scores.
+            rows, cols (torch.Tensor): Positions of the positive labels in the batch.
+        """
+        logits = logits.detach()
+        predicted = logits > self.threshold
+        rows, cols = rows.to(logits.device), cols.to(logits.device)
+        hits = predicted[rows, cols]
+        self.true_positives += torch.bincount(cols[hits], minlength=self.num_labels).cpu()
+        self.predicted += predicted.sum(dim=0).cpu()
+        self.actual += torch.bincount(cols, minlength=self.num_labels).cpu()
+
+    def precision_recall_f1(self, average="macro"):
+        tp, predicted, actual = self.true_positives.double(), self.predicted.double(), self.actual.double()
+        if average == "micro":
+            tp, predicted, actual = tp.sum(), predicted.sum(), actual.sum()
+        precision = torch.where(predicted > 0, tp / predicted.clamp(min=1), torch.zeros_like(tp))
+        recall = torch.where(actual > 0, tp / actual.clamp(min=1), torch.zeros_like(tp))
+        denominator = predicted + actual
+        f1 = torch.where(denominator > 0, 2 * tp / denominator.clamp(min=1), torch.zeros_like(tp))
+        return precision.mean().item(), recall.mean().item(), f1.mean().item()
+
+    def macro(self):
+        return self.precision_recall_f1("macro")[2]
+
+class TopKAccuracy:
+    """
+    Top-n match accuracy plus precision@k / recall@k, accumulated per batch with
+    a single topk over the largest k needed instead of a per-example argsort.
+
+    Top-n match: for each example, n is its number of true aspects; the score is
+    the number of true aspects among its top-n predictions, summed over examples
+    and divided by the total number of true aspects.
+    """
+
+    def __init__(self, ks=(1, 5, 10)):
+        self.ks = tuple(ks)
+        self.reset()
+
+    def reset(self):
+        self.matches = 0
+        self.total = 0
+        self.examples = 0
+        self._precision_sums = {k: 0.0 for k in self.ks}
+        self._recall_sums = {k: 0.0 for k in self.ks}
+
+    def update(self, logits, targets):
+        """
+        Args:
+            logits (torch.Tensor): [B, num_labels] scores.
+            targets (torch.Tensor): [B, num_labels] 0/1 targets.
+        """
+        logits = logits.detach()
+        targets = targets.to(logits.device)
+        n_true = targets.sum(dim=1).long()  # Per-row k for top-n match
+        k_max = min(max(int(n_true.max()), *self.ks), logits.shape[1])
+        top_indices = logits.topk(k_max, dim=1).indices  # Sorted by score
+        top_hits = targets.gather(1, top_indices)  # [B, k_max], 1 where the ranked label is true
+
+        # Variable k: keep the first n_true[i] ranks of each row
+        rank = torch.arange(k_max, device=logits.device)
+        self.matches += int((top_hits * (rank < n_true.unsqueeze(1))).sum())
+        self.total += int(n_true.sum())
+
+        # Fixed k, averaged over examples with at least one true aspect
+        has_labels = n_true > 0
+        self.examples += int(has_labels.sum())
+        for k in self.ks:
+            hits = top_hits[:, :k].sum(dim=1)[has_labels]
+            self._precision_sums[k] += float((hits / k).sum())
+            self._recall_sums[k] += float((hits / n_true[has_labels]).sum())
+
+    def top_n_match_accuracy(self):
+        return self.matches / self.total if self.total > 0 else 0
+
+    def precision_at_k(self, k):
+        return self._precision_sums[k] / self.examples if self.examples > 0 else 0
+
+    def recall_at_k(self, k):
+        return self._recall_sums[k] / self.examples if self.examples > 0 else 0
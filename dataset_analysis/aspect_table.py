@@ -0,0 +1,117 @@
+import ast
+import os
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+CACHE_VERSION = 1
+
+class AspectTable:
+    """
+    The aspect_list column of a MusicCaps CSV parsed once into columnar arrays:
+    an aspect vocabulary, the flat aspect ids of every row and the row offsets
+    into them (row i is ids[offsets[i]:offsets[i + 1]]).
+
+    load() caches the parse as <csv>.aspects.npz next to the CSV; the cache is
+    rebuilt whenever the CSV's size or modification time changes.
+    """
+
+    def __init__(self, vocab, ids, offsets, ytids):
+        self.vocab = vocab
+        self.ids = ids
+        self.offsets = offsets
+        self.ytids = ytids
+
+    @classmethod
+    def parse(cls, csv_path):
+        df = pd.read_csv(csv_path, usecols=["ytid", "aspect_list"])
+        aspect_lists = [ast.literal_eval(aspects) for aspects in df["aspect_list"]]
+        lengths = np.fromiter((len(aspects) for aspects in aspect_lists), dtype=np.int64, count=len(aspect_lists))
+        offsets = np.concatenate([[0], np.cumsum(lengths)])
+        flat = np.array([aspect for aspects in aspect_lists for aspect in aspects], dtype=object)
+        vocab, ids = np.unique(flat.astype(str), return_inverse=True)
+        return cls(vocab, ids.astype(np.int32), offsets, df["ytid"].to_numpy(dtype=str))
+
+    @classmethod
+    def load(cls, csv_path, cache_path=None):
+        cache_path = cache_path or os.path.splitext(csv_path)[0] + ".aspects.npz"
+        stat = os.stat(csv_path)
+        source = np.array([CACHE_VERSION, stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+
+        if os.path.exists(cache_path):
+            with np.load(cache_path) as cached:
+                if np.array_equal(cached["source"], source):
+                    return cls(cached["vocab"], cached["ids"], cached["offsets"], cached["ytids"])
+
+        table = cls.parse(csv_path)
+        tmp_path = cache_path + ".tmp.npz"
+        np.savez(tmp_path, source=source, vocab=table.vocab, ids=table.ids, offsets=table.offsets, ytids=table.ytids)
+        os.replace(tmp_path, cache_path)  # Never leave a half-written cache behind
+        return table
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    @property
+    def lengths(self):
+        return np.diff(self.offsets)
+
+    def row_ids(self):
+        """Row index of every entry of ids."""
+        return np.repeat(np.arange(len(self)), self.lengths)
+
+    def aspects(self, row):
+        return self.vocab[self.ids[self.offsets[row]:self.offsets[row + 1]]].tolist()
+
+    def matrix(self):
+        """Binary [rows, vocab] CSR matrix; repeated aspects within a row count once."""
+        X = sparse.csr_matrix((np.ones(len(self.ids), dtype=np.int32), self.ids, self.offsets), shape=(len(self), len(self.vocab)))
+        X.sum_duplicates()
+        X.data[:] = 1
+        return X
+
+    def encode(self, aspect_to_id):
+        """
+        Map rows onto another vocabulary (e.g. the train split's), dropping
+        unknown and repeated aspects.
+        Returns:
+            tuple: (indptr, indices) in CSR form; row i's label ids are indices[indptr[i]:indptr[i + 1]]
+        """
+        remap = np.array([aspect_to_id.get(aspect, -1) for aspect in self.vocab], dtype=np.int64)
+        ids, rows = remap[self.ids], self.row_ids()
+        keep = ids >= 0
+        ids, rows = ids[keep], rows[keep]
+        order = np.lexsort((ids, rows))
+        ids, rows = ids[order], rows[order]
+        first = np.ones(len(ids), dtype=bool)
+        first[1:] = (ids[1:] != ids[:-1]) | (rows[1:] != rows[:-1])
+        ids, rows = ids[first], rows[first]
+        indptr = np.concatenate([[0], np.cumsum(np.bincount(rows, minlength=len(self)))])
+        return indptr, ids
+
+    def statistics(self):
+        """
+        Every statistic from one pass over the arrays.
+        Returns:
+            dict: num_rows, num_aspects, mean/min/max aspects per row, the
+            histogram of list lengths, per-aspect frequency and the sparse
+            aspect co-occurrence matrix (diagonal = number of rows with the aspect).
+        """
+        lengths = self.lengths
+        X = self.matrix()
+        return {
+            "num_rows": len(self),
+            "num_aspects": len(self.vocab),
+            "mean_aspects": float(lengths.mean()) if len(lengths) else 0.0,
+            "min_aspects": int(lengths.min()) if len(lengths) else 0,
+            "max_aspects": int(lengths.max()) if len(lengths) else 0,
+            "length_histogram": np.bincount(lengths),
+            "frequency": np.bincount(self.ids, minlength=len(self.vocab)),
+            "cooccurrence": (X.T @ X).tocsr(),
+        }
+
+    def top_pairs(self, cooccurrence, n=20):
+        """The n most frequent pairs of distinct aspects as (aspect, aspect, count)."""
+        upper = sparse.triu(cooccurrence, k=1).tocoo()
+        top = np.argsort(upper.data)[::-1][:n]
+        return [(self.vocab[upper.row[i]], self.vocab[upper.col[i]], int(upper.data[i])) for i in top]
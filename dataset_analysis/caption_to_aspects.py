@@ -1,176 +1,207 @@
+import os
+import numpy as np
 import pandas as pd
-import ast
-from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import MultiLabelBinarizer
 from transformers import BertTokenizer
 import torch
 from torch.utils.data import Dataset, DataLoader
-from transformers import BertModel, BertConfig
-import torch.nn as nn
+from transformers import BertModel
 from torch.optim import Adam
-from sklearn.metrics import f1_score
 from torch import nn
 from tqdm import tqdm  # For progress bars
-import numpy as np
+from aspect_table import AspectTable
+from aspect_metrics import collate_sparse_labels, StreamingF1, TopKAccuracy
+
+# Frozen-BERT probe: encode every caption once, cache the pooled outputs and train only the linear head
+FROZEN_BERT = False
+FEATURE_CACHE_DIR = '../data/aspect_features'
+BATCH_SIZE = 32
 
 # Load data
 train_df = pd.read_csv('../data/splits/train.csv')
 val_df = pd.read_csv('../data/splits/val.csv')
 test_df = pd.read_csv('../data/splits/test.csv')
 
-# Convert aspect_list column to actual lists
-train_df['aspect_list'] = train_df['aspect_list'].apply(ast.literal_eval)
-
-# Create and fit the MultiLabelBinarizer on the training data
-mlb = MultiLabelBinarizer()
-y_train = mlb.fit_transform(train_df['aspect_list'])
+# Parsed aspect lists, cached next to each split CSV (rows line up with the DataFrames)
+train_aspects = AspectTable.load('../data/splits/train.csv')
+val_aspects = AspectTable.load('../data/splits/val.csv')
+test_aspects = AspectTable.load('../data/splits/test.csv')
 
-# Transform validation and test data using the same mlb
-val_df['aspect_list'] = val_df['aspect_list'].apply(ast.literal_eval)
-val_df['aspect_list'] = val_df['aspect_list'].apply(
-    lambda aspects: [aspect for aspect in aspects if aspect in mlb.classes_]
-)
-y_val = mlb.transform(val_df['aspect_list'])
+# Aspect vocabulary from the training data; val/test aspects never seen in training are dropped
+aspect_classes = train_aspects.vocab.tolist()
+aspect_to_id = {aspect: i for i, aspect in enumerate(aspect_classes)}
+num_labels = len(aspect_classes)  # 13219 aspects
 
-test_df['aspect_list'] = test_df['aspect_list'].apply(ast.literal_eval)
-test_df['aspect_list'] = test_df['aspect_list'].apply(
-    lambda aspects: [aspect for aspect in aspects if aspect in mlb.classes_]
-)
-y_test = mlb.transform(test_df['aspect_list'])
+# Sparse (CSR) labels: memory scales with the number of positive labels, not examples x aspects
+y_train = train_aspects.encode(aspect_to_id)
+y_val = val_aspects.encode(aspect_to_id)
+y_test = test_aspects.encode(aspect_to_id)
 
 # Define tokenizer
 tokenizer = BertTokenizer.from_pretrained('bert-base-uncased')
 
 class AudioCaptionDataset(Dataset):
     def __init__(self, texts, labels, tokenizer, max_len=128):
-        self.texts = texts
-        self.labels = labels
-        self.tokenizer = tokenizer
-        self.max_len = max_len
+        self.indptr, self.indices = labels
+        # Tokenize every caption once, unpadded; collate_batch pads to the longest caption in the batch
+        self.input_ids = tokenizer(list(texts), add_special_tokens=True, max_length=max_len, truncation=True)['input_ids']
+        self.features = None
 
     def __len__(self):
-        return len(self.texts)
+        return len(self.input_ids)
 
     def __getitem__(self, item):
-        text = self.texts[item]
-        label = self.labels[item]
-        
-        encoding = self.tokenizer.encode_plus(
-            text,
-            add_special_tokens=True,
-            max_length=self.max_len,
-            padding='max_length',
-            truncation=True,
-            return_attention_mask=True,
-            return_tensors='pt'
-        )
-        
-        return {
-            'input_ids': encoding['input_ids'].flatten(),
-            'attention_mask': encoding['attention_mask'].flatten(),
-            'labels': torch.tensor(label, dtype=torch.float)
-        }
+        label_ids = self.indices[self.indptr[item]:self.indptr[item + 1]]
+        if self.features is not None:
+            return {'features': torch.from_numpy(self.features[item]), 'label_ids': torch.from_numpy(label_ids)}
+        return {'input_ids': torch.tensor(self.input_ids[item]), 'label_ids': torch.from_numpy(label_ids)}
+
+def pad_input_ids(input_ids):
+    """Pad a list of token id tensors to the longest one and build the attention mask."""
+    lengths = torch.tensor([len(ids) for ids in input_ids])
+    padded = torch.full((len(input_ids), int(lengths.max())), tokenizer.pad_token_id, dtype=torch.long)
+    for i, ids in enumerate(input_ids):
+        padded[i, :len(ids)] = ids
+    attention_mask = (torch.arange(padded.shape[1]) < lengths.unsqueeze(1)).long()
+    return padded, attention_mask
+
+def collate_batch(items):
+    """Pad the token ids (or stack cached features) and expand the sparse labels of this batch only."""
+    targets, rows, cols = collate_sparse_labels([item['label_ids'] for item in items], num_labels)
+    batch = {'labels': targets, 'label_rows': rows, 'label_cols': cols}
+    if 'features' in items[0]:
+        batch['features'] = torch.stack([item['features'] for item in items])
+    else:
+        batch['input_ids'], batch['attention_mask'] = pad_input_ids([item['input_ids'] for item in items])
+    return batch
 
 # Prepare DataLoaders
 train_dataset = AudioCaptionDataset(train_df['caption'], y_train, tokenizer)
 val_dataset = AudioCaptionDataset(val_df['caption'], y_val, tokenizer)
 test_dataset = AudioCaptionDataset(test_df['caption'], y_test, tokenizer)
 
-train_loader = DataLoader(train_dataset, batch_size=32, shuffle=True)
-val_loader = DataLoader(val_dataset, batch_size=32)
-test_loader = DataLoader(test_dataset, batch_size=32)
+train_loader = DataLoader(train_dataset, batch_size=BATCH_SIZE, shuffle=True, collate_fn=collate_batch)
+val_loader = DataLoader(val_dataset, batch_size=BATCH_SIZE, collate_fn=collate_batch)
+test_loader = DataLoader(test_dataset, batch_size=BATCH_SIZE, collate_fn=collate_batch)
 
 class AspectPredictionModel(nn.Module):
     def __init__(self, num_labels):
         super(AspectPredictionModel, self).__init__()
         self.bert = BertModel.from_pretrained('bert-base-uncased')
         self.fc = nn.Linear(self.bert.config.hidden_size, num_labels)
-        self.sigmoid = nn.Sigmoid()  # Output probabilities for each label
 
-    def forward(self, input_ids, attention_mask):
-        outputs = self.bert(input_ids=input_ids, attention_mask=attention_mask)
-        pooled_output = outputs.pooler_output
-        logits = self.fc(pooled_output)
-        probs = self.sigmoid(logits)
-        return probs
+    def forward(self, input_ids=None, attention_mask=None, features=None):
+        # Returns logits; BCEWithLogitsLoss applies the sigmoid in a numerically stable way
+        # `features` are cached pooled outputs (frozen-BERT mode), which skip the encoder entirely
+        if features is None:
+            outputs = self.bert(input_ids=input_ids, attention_mask=attention_mask)
+            features = outputs.pooler_output
+        logits = self.fc(features)
+        return logits
+
+def cached_pooled_features(bert, dataset, name, csv_path, batch_size=128):
+    """
+    Pooled BERT outputs of every caption in `dataset`, computed once and saved to
+    FEATURE_CACHE_DIR/<name>_pooled.npz; recomputed if the split CSV changes.
+    """
+    cache_path = os.path.join(FEATURE_CACHE_DIR, f"{name}_pooled.npz")
+    stat = os.stat(csv_path)
+    source = np.array([stat.st_size, stat.st_mtime_ns, len(dataset)], dtype=np.int64)
+    if os.path.exists(cache_path):
+        with np.load(cache_path) as cached:
+            if np.array_equal(cached['source'], source):
+                return cached['features']
+
+    # Encode in length-sorted batches so each one pads to similar lengths
+    order = np.argsort([len(ids) for ids in dataset.input_ids])
+    features = np.empty((len(dataset), bert.config.hidden_size), dtype=np.float32)
+    bert.eval()
+    with torch.no_grad():
+        for start in tqdm(range(0, len(order), batch_size), desc=f"Encoding {name}"):
+            rows = order[start:start + batch_size]
+            input_ids, attention_mask = pad_input_ids([torch.tensor(dataset.input_ids[row]) for row in rows])
+            outputs = bert(input_ids=input_ids.to(device), attention_mask=attention_mask.to(device))
+            features[rows] = outputs.pooler_output.cpu().numpy()
+
+    os.makedirs(FEATURE_CACHE_DIR, exist_ok=True)
+    tmp_path = cache_path + ".tmp.npz"
+    np.savez(tmp_path, source=source, features=features)
+    os.replace(tmp_path, cache_path)
+    return features
 
 # Define the device at the start of the script
 device = torch.device('cuda') if torch.cuda.is_available() else torch.device('cpu')
 
 # Model initialization
-model = AspectPredictionModel(num_labels=y_train.shape[1])  # 13219 aspects
+model = AspectPredictionModel(num_labels=num_labels)
 model = model.to(device)  # Move the model to the device
 
+if FROZEN_BERT:
+    # Datasets now serve cached features; BERT is only used here and then released
+    for dataset, name in ((train_dataset, 'train'), (val_dataset, 'val'), (test_dataset, 'test')):
+        dataset.features = cached_pooled_features(model.bert, dataset, name, f'../data/splits/{name}.csv')
+    model.bert = None
+
 # Training loop
 # Training loop with progress updates
+def model_inputs(data):
+    """The model inputs present in a batch, moved to the device."""
+    return {key: data[key].to(device) for key in ('input_ids', 'attention_mask', 'features') if key in data}
+
 def train_epoch(model, data_loader, optimizer, criterion):
     model = model.train()
     losses = []
-    all_preds = []
-    all_labels = []
+    f1 = StreamingF1(num_labels)
     
     # Create a progress bar
     loop = tqdm(data_loader, leave=True)
     loop.set_description("Training")
     
     for data in loop:
-        input_ids = data['input_ids'].to(device)  # Move to device
-        attention_mask = data['attention_mask'].to(device)  # Move to device
         labels = data['labels'].to(device)  # Move to device
 
         optimizer.zero_grad()
-        outputs = model(input_ids, attention_mask)
+        outputs = model(**model_inputs(data))
         
         loss = criterion(outputs, labels)
         loss.backward()
         optimizer.step()
         
         losses.append(loss.item())
-        all_preds.append(outputs.detach().cpu().numpy())  # Move back to CPU for evaluation
-        all_labels.append(labels.detach().cpu().numpy())  # Move back to CPU for evaluation
+        f1.update(outputs, data['label_rows'], data['label_cols'])  # Per-class counts only
 
         # Update progress bar with current loss
         loop.set_postfix(loss=loss.item())
     
     avg_loss = sum(losses) / len(losses)
     
-    # Calculate F1 score (for evaluation)
-    all_preds = np.vstack(all_preds)
-    all_labels = np.vstack(all_labels)
-    f1 = f1_score(all_labels, (all_preds > 0.5), average='macro')
-    
-    return avg_loss, f1
+    # Macro F1 from the accumulated counts (for evaluation)
+    return avg_loss, f1.macro()
 
 # Validation loop
 def eval_epoch(model, data_loader, criterion):
     model = model.eval()
     losses = []
-    all_preds = []
-    all_labels = []
+    f1 = StreamingF1(num_labels)
     
     with torch.no_grad():
         for data in data_loader:
-            input_ids = data['input_ids'].to(device)  # Move to device
-            attention_mask = data['attention_mask'].to(device)  # Move to device
             labels = data['labels'].to(device)  # Move to device
 
-            outputs = model(input_ids, attention_mask)
+            outputs = model(**model_inputs(data))
             
             loss = criterion(outputs, labels)
             losses.append(loss.item())
-            all_preds.append(outputs.detach().cpu().numpy())  # Move back to CPU for evaluation
-            all_labels.append(labels.detach().cpu().numpy())  # Move back to CPU for evaluation
+            f1.update(outputs, data['label_rows'], data['label_cols'])
 
     avg_loss = sum(losses) / len(losses)
-
-    all_preds = np.vstack(all_preds)
-    all_labels = np.vstack(all_labels)
-    f1 = f1_score(all_labels, (all_preds > 0.5), average='macro')
     
-    return avg_loss, f1
+    return avg_loss, f1.macro()
 
-optimizer = Adam(model.parameters(), lr=2e-5)  # Adam optimizer with learning rate 2e-5
-criterion = nn.BCELoss()  # Binary Cross-Entropy for multi-label classification
+if FROZEN_BERT:
+    optimizer = Adam(model.fc.parameters(), lr=1e-3)  # Only the linear head trains, so a much larger step
+else:
+    optimizer = Adam(model.parameters(), lr=2e-5)  # Adam optimizer with learning rate 2e-5
+criterion = nn.BCEWithLogitsLoss()  # Binary Cross-Entropy on logits for multi-label classification
 
 # Training process
 epochs = 3
@@ -187,40 +218,20 @@ for epoch in range(epochs):
 # test_loss, test_f1 = eval_epoch(model, test_loader, criterion)
 # print(f"Test Loss: {test_loss:.4f}, Test F1: {test_f1:.4f}")
 
-def top_n_match_accuracy(model, data_loader):
+def evaluate_top_k(model, data_loader, ks=(1, 5, 10)):
     model.eval()
-    total_matches = 0
-    total_samples = 0
+    top_k = TopKAccuracy(ks)
     
     with torch.no_grad():
         for data in tqdm(data_loader, desc="Evaluating"):
-            input_ids = data['input_ids'].to(device)
-            attention_mask = data['attention_mask'].to(device)
-            true_labels = data['labels'].cpu().numpy()  # Move true labels to CPU
-            
-            # Get model predictions
-            outputs = model(input_ids, attention_mask)
-            predictions = outputs.detach().cpu().numpy()  # Move predictions to CPU
-            
-            for i in range(len(true_labels)):
-                true_aspects = np.where(true_labels[i] > 0)[0]  # Indices of true aspects
-                n = len(true_aspects)
-                
-                if n == 0:
-                    continue  # Skip if there are no true aspects
-                
-                # Get the top-n predicted aspect indices
-                top_n_predictions = predictions[i].argsort()[-n:][::-1]
-                
-                # Count matches
-                matches = len(set(true_aspects) & set(top_n_predictions))
-                total_matches += matches  # Match percentage for this example
-                total_samples += n
+            # Get model predictions; top-k is computed on the device for the whole batch
+            outputs = model(**model_inputs(data))
+            top_k.update(outputs, data['labels'])
     
-    # Average match percentage over all samples
-    accuracy = total_matches / total_samples if total_samples > 0 else 0
-    return accuracy
+    return top_k
 
 # Evaluate on the test dataset
-test_accuracy = top_n_match_accuracy(model, test_loader)
-print(f"Top-n Match Accuracy: {test_accuracy * 100:.2f}%")
+test_top_k = evaluate_top_k(model, test_loader)
+print(f"Top-n Match Accuracy: {test_top_k.top_n_match_accuracy() * 100:.2f}%")
+for k in test_top_k.ks:
+    print(f"Precision@{k}: {test_top_k.precision_at_k(k) * 100:.2f}%, Recall@{k}: {test_top_k.recall_at_k(k) * 100:.2f}%")
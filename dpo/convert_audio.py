@@ -1,43 +1,110 @@
+import argparse
 import os
 import subprocess
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from scipy.io import wavfile
 from generate_pairs import audio_dir
 
+# The shared resampler lives in caption_generation
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "caption_generation"))
+from resampling import load_audio
+
 # Define the directories
 converted_audio_dir = audio_dir + "-converted"
 
-def convert_audio_files(audio_dir, converted_audio_dir, target_sample_rate=44100, target_channels=2):
+def convert_with_ffmpeg(input_file_path, output_file_path, target_sample_rate, target_channels):
+    command = [
+        "ffmpeg",
+        "-nostdin", "-v", "error", "-y",
+        "-i", input_file_path,
+        "-ar", str(target_sample_rate),
+        "-ac", str(target_channels),
+        "-f", "wav",  # The temporary output name does not end in .wav
+        output_file_path
+    ]
+    subprocess.run(command, check=True)
+
+def convert_in_process(input_file_path, output_file_path, target_sample_rate, target_channels):
+    """Read, resample each channel with the shared polyphase resampler and write 16-bit PCM without spawning ffmpeg."""
+    audio, _ = load_audio(input_file_path, target_sample_rate, mono=False)
+    if audio.ndim == 1:
+        audio = audio[:, None]
+    # Remix only when the channel count differs, like ffmpeg -ac
+    if audio.shape[1] != target_channels:
+        if target_channels == 1:
+            audio = audio.mean(axis=1, keepdims=True)
+        elif audio.shape[1] == 1:
+            audio = np.repeat(audio, target_channels, axis=1)
+        else:
+            audio = np.repeat(audio.mean(axis=1, keepdims=True), target_channels, axis=1)
+    pcm = (np.clip(audio, -1.0, 1.0) * np.iinfo(np.int16).max).astype(np.int16)
+    wavfile.write(output_file_path, target_sample_rate, pcm[:, 0] if target_channels == 1 else pcm)
+
+def is_up_to_date(input_file_path, output_file_path):
+    return os.path.exists(output_file_path) and os.path.getmtime(output_file_path) >= os.path.getmtime(input_file_path)
+
+def convert_file(input_file_path, output_file_path, target_sample_rate, target_channels, use_ffmpeg):
+    """Convert one file through a temporary file so a partial output never looks complete."""
+    tmp_path = output_file_path + ".tmp"
+    convert = convert_with_ffmpeg if use_ffmpeg else convert_in_process
+    try:
+        convert(input_file_path, tmp_path, target_sample_rate, target_channels)
+        os.replace(tmp_path, output_file_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def convert_audio_files(audio_dir, converted_audio_dir, target_sample_rate=44100, target_channels=2, use_ffmpeg=True, num_workers=None, force=False):
     """
     Converts all audio files in a directory to a specified sample rate and channel configuration.
+    Files whose converted output is newer than the input are skipped; the rest are
+    converted in parallel across a process pool.
     
     Args:
         audio_dir (str): Path to the input directory containing audio files.
         converted_audio_dir (str): Path to the output directory to save converted files.
         target_sample_rate (int): Desired sample rate (default is 44100 Hz).
         target_channels (int): Desired number of audio channels (default is 2).
+        use_ffmpeg (bool): Convert with an ffmpeg subprocess (default); False converts in-process.
+        num_workers (int): Conversion processes (default: CPU count).
+        force (bool): Reconvert files even if their output is up to date.
+    Returns:
+        dict: Counts of converted, skipped and failed files.
     """
     if not os.path.exists(converted_audio_dir):
         os.makedirs(converted_audio_dir)
-    
-    for file_name in os.listdir(audio_dir):
+
+    counts = {"converted": 0, "skipped": 0, "failed": 0}
+    jobs = []
+    for file_name in sorted(os.listdir(audio_dir)):
         if file_name.endswith(".wav"):  # Process only .wav files
             input_file_path = os.path.join(audio_dir, file_name)
             output_file_path = os.path.join(converted_audio_dir, file_name)
-            
-            # FFmpeg command for conversion
-            command = [
-                "ffmpeg",
-                "-i", input_file_path,
-                "-ar", str(target_sample_rate),
-                "-ac", str(target_channels),
-                output_file_path
-            ]
-            
+            if not force and is_up_to_date(input_file_path, output_file_path):
+                counts["skipped"] += 1
+            else:
+                jobs.append((input_file_path, output_file_path))
+
+    with ProcessPoolExecutor(num_workers) as pool:
+        futures = {pool.submit(convert_file, input_file_path, output_file_path, target_sample_rate, target_channels, use_ffmpeg): output_file_path
+                   for input_file_path, output_file_path in jobs}
+        for future in as_completed(futures):
+            output_file_path = futures[future]
             try:
-                subprocess.run(command, check=True)
-                print(f"Converted: {file_name} -> {output_file_path}")
-            except subprocess.CalledProcessError as e:
-                print(f"Error converting {file_name}: {e}")
-    print("Audio conversion completed.")
+                future.result()
+                counts["converted"] += 1
+            except Exception as e:  # Includes BrokenProcessPool; one bad file must not abort the batch
+                print(f"Error converting {os.path.basename(output_file_path)}: {e}")
+                counts["failed"] += 1
+    print(f"Audio conversion completed: {counts['converted']} converted, {counts['skipped']} up to date, {counts['failed']} failed.")
+    return counts
 
 if __name__ == "__main__":
-    convert_audio_files(audio_dir, converted_audio_dir)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Convert generated clips for playback in the feedback tool.")
+    parser.add_argument('--num_workers', type=int, default=None, help="Conversion processes (default: CPU count).")
+    parser.add_argument('--in_process', action='store_true', help="Convert with the in-process resampler instead of ffmpeg subprocesses.")
+    parser.add_argument('--force', action='store_true', help="Reconvert files even if their output is up to date.")
+    args = parser.parse_args()
+    convert_audio_files(audio_dir, converted_audio_dir, use_ffmpeg=not args.in_process, num_workers=args.num_workers, force=args.force)
@@ -1,95 +1,187 @@
-import json
+import gc
+import os
+import time
+import numpy as np
+import pandas as pd
 import torch
+import torch.nn.functional as F
 from transformers import MusicgenForConditionalGeneration, AutoProcessor
 from torch.utils.data import DataLoader, Dataset
-from dpo.generate_pairs import SAMPLE_RATE
-from scipy.io.wavfile import read
-import numpy as np
-from generate_human_feedback import feedback_file
-from generate_pairs import reference_model_name, policy_model_name, logprobs_dir, REF_IDX, POL_IDX, iteration_number
+from generate_human_feedback import feedback_file, legacy_feedback_file
+from generate_pairs import (reference_model_name, policy_model_name, store_dir, caption_file, REF_IDX, POL_IDX,
+                            iteration_number, encode_captions, select_prompts, sequence_logprobs)
+from pair_store import PairStore
+from label_store import LabelStore
 
 output_dir = f"../models/musicgen-{iteration_number + 1}"
 
-batch_size = 16
+batch_size = 2  # Preference pairs per forward pass
+grad_accum_steps = 8  # Effective batch of batch_size * grad_accum_steps pairs per optimizer step
+reference_batch_size = 8  # Sequences per forward pass when caching reference logprobs
 learning_rate = 5e-5
 num_epochs = 3
 BETA = 0.1
 
 # Prepare Dataset
 class HumanFeedbackDataset(Dataset):
-    def __init__(self, feedback_data):
-        self.data = feedback_data
-        self.logprobs_dir = logprobs_dir
+    """
+    One item per labeled pair: the preferred (chosen) and other (rejected) token
+    sequences, the row of their caption in the encoded prompts, and the cached
+    reference-model logprobs of both sequences.
+    """
+
+    def __init__(self, feedback_data, store, caption_rows, ref_logprobs):
+        self.data = [item for item in feedback_data if item["preference"] in (REF_IDX, POL_IDX)]
+        self.store = store
+        self.caption_rows = caption_rows
+        self.ref_logprobs = ref_logprobs
 
     def __len__(self):
         return len(self.data)
 
     def __getitem__(self, idx):
         item = self.data[idx]
-        
-        # Load the logprobs for the ref and pol models
-        ref_logprob = np.load(f"{self.logprobs_dir}/{item['ytid']}-temp{item['temp']}-pair{item['pair_idx']}-{REF_IDX}.npy")
-        pol_logprob = np.load(f"{self.logprobs_dir}/{item['ytid']}-temp{item['temp']}-pair{item['pair_idx']}-{POL_IDX}.npy")
-        
+        chosen_idx = item["preference"]
+        rejected_idx = POL_IDX if chosen_idx == REF_IDX else REF_IDX
+
+        # Views into the memory-mapped store
+        chosen_row = self.store.row(item["ytid"], item["temp"], item["pair_idx"], chosen_idx)
+        rejected_row = self.store.row(item["ytid"], item["temp"], item["pair_idx"], rejected_idx)
+        chosen_codes, _ = self.store.get(item["ytid"], item["temp"], item["pair_idx"], chosen_idx)
+        rejected_codes, _ = self.store.get(item["ytid"], item["temp"], item["pair_idx"], rejected_idx)
+
         return {
-            # "ytid": item["ytid"],
-            # "temp": item["temp"],
-            "preference": item["preference"],
-            "ref_logprob": torch.tensor(ref_logprob, dtype=torch.float32),
-            "pol_logprob": torch.tensor(pol_logprob, dtype=torch.float32),
+            "caption_row": self.caption_rows[item["ytid"]],
+            "chosen_codes": torch.from_numpy(chosen_codes),
+            "rejected_codes": torch.from_numpy(rejected_codes),
+            "ref_chosen_logprob": torch.tensor(self.ref_logprobs[chosen_row], dtype=torch.float32),
+            "ref_rejected_logprob": torch.tensor(self.ref_logprobs[rejected_row], dtype=torch.float32),
         }
 
-# Define DPO Loss
-import torch.nn.functional as F
-
-def dpo_loss(pol_logps, ref_logps, prefs, beta=BETA):
+def dpo_loss(pol_chosen_logps, pol_rejected_logps, ref_chosen_logps, ref_rejected_logps, beta=BETA):
     """
-    pol_logps: policy logprobs, shape (B,)
-    ref_logps: reference model logprobs, shape (B,)
-    prefs: human preferences, either POL_IDX or REF_IDX, shape (B,)
+    pol_*_logps: policy sequence logprobs of the chosen/rejected clips, shape (B,)
+    ref_*_logps: reference model sequence logprobs of the same clips, shape (B,)
     beta: temperature controlling strength of KL penalty
     """
     # Compute the log ratio between policy and reference model logprobs directly
-    pol_logratios = pol_logps[prefs == POL_IDX] - pol_logps[prefs != POL_IDX]
-    ref_logratios = ref_logps[prefs == REF_IDX] - ref_logps[prefs != REF_IDX]
-    
+    pol_logratios = pol_chosen_logps - pol_rejected_logps
+    ref_logratios = ref_chosen_logps - ref_rejected_logps
+
     # Compute the DPO loss as a sigmoid cross-entropy of the logratios, scaled by beta
     losses = -F.logsigmoid(beta * (pol_logratios - ref_logratios)).mean()
-    
-    # Calculate the reward term, which is the log difference between policy and reference model logprobs
-    rewards = beta * (pol_logps - ref_logps).detach()
-    
-    return losses, rewards
+
+    # Implicit rewards: beta times the log difference between policy and reference model logprobs
+    chosen_rewards = beta * (pol_chosen_logps - ref_chosen_logps).detach()
+    rejected_rewards = beta * (pol_rejected_logps - ref_rejected_logps).detach()
+
+    return losses, chosen_rewards, rejected_rewards
+
+def cached_reference_logprobs(store, encoded, caption_rows, device):
+    """
+    Reference-model logprob of every sequence in the store, cached next to it.
+    Every row, including those the reference model generated, is scored through
+    the same teacher-forced, no-CFG pass as the policy (sequence_logprobs), so
+    the DPO reference and policy terms are the same quantity. The logprob stored
+    at generation time is not reused: clips are sampled with classifier-free
+    guidance and a temperature, so it is not the sampling likelihood anyway.
+    Only rows appended since the cache was written are scored, in batches, and
+    the reference model is freed before returning.
+    Returns:
+        np.ndarray: float32 logprob per store row.
+    """
+    cache_path = os.path.join(store.store_dir, f"reference_logprobs-nocfg-{reference_model_name.replace('/', '--')}.npy")
+    cached = np.load(cache_path) if os.path.exists(cache_path) else np.zeros(0, dtype=np.float32)
+    if len(cached) == len(store):
+        return cached
+
+    keys = store.keys_by_row()
+    logprobs = np.concatenate([cached, np.zeros(len(store) - len(cached), dtype=np.float32)])
+    to_score = [row for row in range(len(cached), len(store)) if keys[row] is not None]
+
+    if to_score:
+        print(f"Scoring {len(to_score)} sequences with the reference model")
+        reference_model = MusicgenForConditionalGeneration.from_pretrained(reference_model_name).to(device)
+        reference_model.eval()
+        with torch.no_grad():
+            for start in range(0, len(to_score), reference_batch_size):
+                rows = to_score[start:start + reference_batch_size]
+                codes, _ = store.read(rows)
+                prompt_rows = torch.tensor([caption_rows[keys[row][0]] for row in rows], device=device)
+                input_ids, attention_mask = select_prompts(encoded, prompt_rows)
+                sequences = torch.from_numpy(codes).long().to(device)
+                logprobs[rows] = sequence_logprobs(reference_model, input_ids, attention_mask, sequences).cpu().numpy()
+        del reference_model
+        gc.collect()
+
+    tmp_path = cache_path + ".tmp.npy"
+    np.save(tmp_path, logprobs)
+    os.replace(tmp_path, cache_path)
+    return logprobs
 
 def finetune():
     device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
     print(f"Device: {device}")
 
     # Load Human Feedback Data
-    with open(feedback_file, "r") as f:
-        feedback_data = json.load(f)
+    feedback_data = LabelStore(feedback_file, legacy_json_path=legacy_feedback_file).labels()
+    if not feedback_data:
+        raise ValueError(f"No human labels in {feedback_file} or {legacy_feedback_file}; run generate_human_feedback.py first.")
 
-    dataset = HumanFeedbackDataset(feedback_data)
+    # Encode the caption of every generated clip once
+    store = PairStore(store_dir)
+    policy_processor = AutoProcessor.from_pretrained(policy_model_name)
+    captions = pd.read_csv(caption_file).drop_duplicates("ytid").set_index("ytid")["caption"]
+    ytids = sorted({ytid for ytid, _, _, _ in store.index})
+    caption_rows = {ytid: i for i, ytid in enumerate(ytids)}
+    encoded = encode_captions(policy_processor, [captions[ytid] for ytid in ytids], device)
+
+    ref_logprobs = cached_reference_logprobs(store, encoded, caption_rows, device)
+    dataset = HumanFeedbackDataset(feedback_data, store, caption_rows, ref_logprobs)
+    if len(dataset) == 0:
+        raise ValueError("Every human label is a tie or skip; there are no preference pairs to train on.")
     dataloader = DataLoader(dataset, batch_size=batch_size, shuffle=True)
+    print(f"{len(dataset)} labeled pairs")
 
-    # Load MusicGen Model and Tokenizer
+    # Load MusicGen Model
     policy_model = MusicgenForConditionalGeneration.from_pretrained(policy_model_name).to(device)
-    policy_processor = AutoProcessor.from_pretrained(policy_model_name)
 
     # Training Loop
     optimizer = torch.optim.AdamW(policy_model.parameters(), lr=learning_rate)
 
     policy_model.train()
+    step = 0
     for epoch in range(num_epochs):
-        for batch in dataloader:
-            optimizer.zero_grad()
+        optimizer.zero_grad()
+        step_start = time.perf_counter()
+        step_pairs, step_loss, step_correct = 0, 0.0, 0
+        for micro_step, batch in enumerate(dataloader, start=1):
+            # Chosen and rejected sequences go through the policy in one teacher-forced pass
+            rows = batch["caption_row"].to(device)
+            input_ids, attention_mask = select_prompts(encoded, torch.cat([rows, rows]))
+            sequences = torch.cat([batch["chosen_codes"], batch["rejected_codes"]]).long().to(device)
+            pol_chosen_logps, pol_rejected_logps = sequence_logprobs(policy_model, input_ids, attention_mask, sequences).chunk(2)
 
             # Compute DPO Loss
-            loss, _ = dpo_loss(batch["pol_logprob"], batch["ref_logprob"], batch["preference"])
-
-            # Backpropagation
-            loss.backward()
-            optimizer.step()
+            loss, chosen_rewards, rejected_rewards = dpo_loss(pol_chosen_logps, pol_rejected_logps,
+                                                              batch["ref_chosen_logprob"].to(device), batch["ref_rejected_logprob"].to(device))
+
+            # Backpropagation, averaged over the accumulated micro-batches
+            (loss / grad_accum_steps).backward()
+            step_pairs += len(rows)
+            step_loss += loss.item() * len(rows)
+            step_correct += (chosen_rewards > rejected_rewards).sum().item()
+
+            if micro_step % grad_accum_steps == 0 or micro_step == len(dataloader):
+                optimizer.step()
+                optimizer.zero_grad()
+                step += 1
+                elapsed = time.perf_counter() - step_start
+                num_tokens = 2 * step_pairs * sequences[0].numel()
+                print(f"Epoch {epoch + 1} step {step}: loss {step_loss / step_pairs:.4f}, reward accuracy {step_correct / step_pairs:.2f}, "
+                      f"{step_pairs / elapsed:.2f} pairs/s, {num_tokens / elapsed:.0f} tokens/s")
+                step_start = time.perf_counter()
+                step_pairs, step_loss, step_correct = 0, 0.0, 0
 
         print(f"Epoch {epoch + 1}/{num_epochs} completed. Loss: {loss.item()}")
 
@@ -100,4 +192,4 @@ def finetune():
     print(f"Model fine-tuned and saved to {output_dir}")
 
 if __name__ == "__main__":
-    finetune()
\ No newline at end of file
+    finetune()
@@ -1,45 +1,32 @@
 import os
 import pandas as pd
-import simpleaudio as sa
-import json
 from generate_pairs import NUM_PAIRS_PER_CAPTION_PER_TEMP, TEMPS, caption_file, REF_IDX, POL_IDX
 from convert_audio import converted_audio_dir
+from label_store import LabelStore
+from playback import PcmCache, play
 
 # Configurations
-feedback_file = "../data/dpo-gen/human_labels_temp.json"
+feedback_file = "../data/dpo-gen/human_labels.jsonl"
+legacy_feedback_file = "../data/dpo-gen/human_labels_temp.json"  # Imported once if the log does not exist yet
+PREFETCH_PAIRS = 4  # Pairs after the current one decoded in the background
 
-# Helper function to find the label index for a given ytid and pair_idx
-def find_label_index(ytid, pair_idx, temp, labels):
-    for i, label in enumerate(labels):
-        if label["ytid"] == ytid and label["pair_idx"] == pair_idx and label["temp"] == temp:
-            return i
-    return -1
+def pair_files(ytid, temp, pair_idx):
+    ref_file = os.path.join(converted_audio_dir, f"{ytid}-temp{temp}-pair{pair_idx}-{REF_IDX}.wav")
+    pol_file = os.path.join(converted_audio_dir, f"{ytid}-temp{temp}-pair{pair_idx}-{POL_IDX}.wav")
+    return ref_file, pol_file
 
-# Helper function to play an audio file
-def play_audio(file_path):
+# Helper function to play an audio file (from the prefetched PCM cache)
+def play_audio(file_path, cache):
     try:
-        wave_obj = sa.WaveObject.from_wave_file(file_path)
-        play_obj = wave_obj.play()
-        play_obj.wait_done()
+        play(cache.get(file_path))
     except Exception as e:
         print(f"Error playing audio: {e}")
 
-def collect_input_for_pair(ytid, pair_idx, temp, labels, captions_df, stop_early=False):
-    # Skip if label already exists and preference is set
-    existing_label_idx = find_label_index(ytid, pair_idx, temp, labels)
-    if existing_label_idx != -1 and labels[existing_label_idx]["preference"] != -1:
-        return
-    
-    ref_file = os.path.join(converted_audio_dir, f"{ytid}-temp{temp}-pair{pair_idx}-{REF_IDX}.wav")
-    pol_file = os.path.join(converted_audio_dir, f"{ytid}-temp{temp}-pair{pair_idx}-{POL_IDX}.wav")
-    
-    # Skip if files are missing
-    if not os.path.exists(ref_file) or not os.path.exists(pol_file):
-        print(f"Missing files for {ytid} pair {pair_idx}. Skipping.")
-        return
+def collect_input_for_pair(ytid, pair_idx, temp, labels, captions, cache, stop_early=False):
+    ref_file, pol_file = pair_files(ytid, temp, pair_idx)
 
     # Display caption
-    caption = captions_df[captions_df["ytid"] == ytid]["caption"].values[0]
+    caption = captions[ytid]
     print(f"\nCaption: {caption}\n")
     print(f"1. {ref_file}")
     print(f"2. {pol_file}\n")
@@ -49,9 +36,9 @@ def collect_input_for_pair(ytid, pair_idx, temp, labels, captions_df, stop_early
         print("Type '1' to play first audio, '2' to play second audio, or 'n' to move to rating.")
         choice = input("Play option (1/2/n): ").strip()
         if choice == "1":
-            play_audio(ref_file)
+            play_audio(ref_file, cache)
         elif choice == "2":
-            play_audio(pol_file)
+            play_audio(pol_file, cache)
         elif choice == "n":
             break
         else:
@@ -68,7 +55,7 @@ def collect_input_for_pair(ytid, pair_idx, temp, labels, captions_df, stop_early
             else:
                 p = POL_IDX # 2
             
-            labels.append({"ytid": ytid, "pair_idx": pair_idx, "temp": temp, "preference": p})
+            labels.record(ytid, temp, pair_idx, p)
             break
         elif preference == "q":
             stop_early = True
@@ -82,16 +69,15 @@ def main():
     print("Note that this must be run locally for the sound to work.")
     # print("You can click 'c' while a song is playing to stop it.")
 
-    # Load captions
+    # Build the caption lookup once
     captions_df = pd.read_csv(caption_file)
+    captions = dict(zip(captions_df["ytid"], captions_df["caption"]))
 
-    # Initialize labels
-    if os.path.exists(feedback_file):
-        with open(feedback_file, "r") as f:
-            labels = json.load(f)
-    else:
-        labels = []
+    # Replay the label log; every new label is appended and fsynced as it is entered
+    labels = LabelStore(feedback_file, legacy_json_path=legacy_feedback_file)
 
+    # Each ytid has one converted file per (temp, pair, model); visit each ytid once
+    ytids = set()
     for f in os.listdir(converted_audio_dir):
         # Extract ytid and check if it's valid
         if not f.endswith(".wav"):
@@ -100,25 +86,35 @@ def main():
         if ytid == "":
             # print(f"Invalid file name: {f}")
             continue
+        ytids.add(ytid)
 
+    # Pairs still to label whose files both exist, in presentation order
+    pending = []
+    for ytid in sorted(ytids):
         for temp in TEMPS:
             for pair_idx in range(NUM_PAIRS_PER_CAPTION_PER_TEMP):
-                stop_early = collect_input_for_pair(ytid, pair_idx, temp, labels, captions_df)
-                
-                if stop_early:
-                    break
-            
+                # Skip if label already exists and preference is set
+                existing_label = labels.get(ytid, temp, pair_idx)
+                if existing_label is not None and existing_label["preference"] != -1:
+                    continue
+                # Skip if files are missing
+                if not all(os.path.exists(f) for f in pair_files(ytid, temp, pair_idx)):
+                    print(f"Missing files for {ytid} pair {pair_idx}. Skipping.")
+                    continue
+                pending.append((ytid, temp, pair_idx))
+
+    # Decode the current and next PREFETCH_PAIRS pairs in the background while the labeler listens
+    cache = PcmCache(capacity=2 * (PREFETCH_PAIRS + 2))
+    try:
+        for i, (ytid, temp, pair_idx) in enumerate(pending):
+            cache.prefetch([f for pair in pending[i:i + PREFETCH_PAIRS + 1] for f in pair_files(*pair)])
+            stop_early = collect_input_for_pair(ytid, pair_idx, temp, labels, captions, cache)
             if stop_early:
                 break
-        
-        if stop_early:
-            break
-
-    # Save labeled data
-    with open(feedback_file, "w") as f:
-        json.dump(labels, f, indent=2)
+    finally:
+        cache.close()
 
-    print(f"Human labels saved to {feedback_file}")
+    print(f"{len(labels)} human labels saved to {feedback_file}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
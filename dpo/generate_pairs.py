@@ -1,9 +1,13 @@
 import pandas as pd
 import torch
-from transformers import MusicgenForConditionalGeneration, AutoProcessor
+from transformers import MusicgenForConditionalGeneration, AutoProcessor, StoppingCriteria, StoppingCriteriaList
 import os
+import sys
 from scipy.io.wavfile import write
-import numpy as np
+from pair_store import PairStore
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "dataset_analysis"))
+from aspect_index import AspectIndex
 
 # Constants
 iteration_number = 0
@@ -11,12 +15,14 @@ iteration_number = 0
 NUM_CAPTIONS = 1  # Set the number of captions to select
 NUM_PAIRS_PER_CAPTION_PER_TEMP = 1  # Set the number of pairs per caption
 TEMPS = [0.7, 1.0]
+BATCH_SIZE = 16  # Prompts per generate call
 
 audio_dir = f"../data/dpo-gen-{iteration_number}/wavs"
-logprobs_dir = f"../data/dpo-gen-{iteration_number}/logprobs"
+store_dir = f"../data/dpo-gen-{iteration_number}/store"  # Token sequences and logprobs (see pair_store.py)
 caption_file = "../data/musiccaps-train-data.csv"  # Path to the captions CSV
 
 FAILED_YTID_PATH = "../data/failed_ytids.txt"  # Path to failed ytids
+ASPECT_QUERY = None  # Optional aspect filter, e.g. '"rock" AND NOT "low quality"' (see aspect_index.py)
 
 SAMPLE_RATE = 32000  # Sample rate for the audio clips
 COMPRESSION_RATIO = 50
@@ -35,68 +41,112 @@ def logits_to_logprobs(logits):
     logprobs = torch.log(probs)  # Take log of the probabilities
     return logprobs
 
-# Function to generate 10 second audio for a caption
-def generate_audio_for_caption(caption, ytid, processor_name, model, device, num_pairs=NUM_PAIRS_PER_CAPTION_PER_TEMP, temps=TEMPS):
-    # Load the processor
-    if processor_name == "reference":
-        processor = AutoProcessor.from_pretrained(reference_model_name)
-        idx = REF_IDX
-    elif processor_name == "policy":
-        processor = AutoProcessor.from_pretrained(policy_model_name)
-        idx = POL_IDX
-    else:
-        raise ValueError(f"Invalid processor name: {processor_name}")
-    
-    # Prepare the prompt for MusicGen
-    inputs = processor(text=caption, return_tensors="pt", truncation=True, padding=True).to(device)
-
-    # Generate the required number of pairs
-    print(f"\nGenerating audio for caption: {caption}\n")
-    for i in range(num_pairs):
-        for temp in temps:
-            # Generate music using MusicGen
-            generated_audio = model.generate(**inputs, max_new_tokens=COMPRESSION_RATIO * SECONDS, temperature=temp)
-
-            # Extract logits (model output before softmax)
-            logit = generated_audio.logit()
-            print(f"Logit: {logit}")
-            logprob = model.log_prob(**inputs, generated_audio=generated_audio, return_dict=True).logprobs
-
-            # Convert output tokens back to audio
-            audio_array = generated_audio.cpu().numpy()
-
-            # Save the audio as a WAV file
-            output_path = os.path.join(audio_dir, f"{ytid}-temp{temp}-pair{i}-{idx}.wav")
-            write(output_path, SAMPLE_RATE, audio_array)
-
-            # prob = torch.softmax(logit, dim=-1)
-            # logprob = torch.log(prob)
-            print(f"Logprobs: {logprob}")
-            print(f"Logprobs: {logprob.shape}")
-
-            # Save logits as a numpy array
-            logprobs_path = os.path.join(logprobs_dir, f"{ytid}-temp{temp}-pair{i}-{idx}.npy")
-            np.save(logprobs_path, logprob.cpu().numpy())
-
-            print(f"Saved as {output_path}")
-
-def gen(model, processor_name, sampled_data):
+class SequenceRecorder(StoppingCriteria):
+    """
+    Never stops generation; keeps the latest decoder token ids so the sampled
+    MusicGen codes survive `generate`, which only returns decoded audio.
+    """
+
+    def __init__(self):
+        self.sequences = None
+
+    def __call__(self, input_ids, scores, **kwargs):
+        self.sequences = input_ids
+        return torch.zeros(input_ids.shape[0], dtype=torch.bool, device=input_ids.device)
+
+def encode_captions(processor, captions, device):
+    """Tokenize every caption once; generation batches index into the result."""
+    return processor(text=list(captions), return_tensors="pt", truncation=True, padding=True).to(device)
+
+def select_prompts(encoded, rows):
+    """Gather prompt rows and drop padding columns no prompt in the batch uses."""
+    attention_mask = encoded["attention_mask"][rows]
+    width = int(attention_mask.sum(dim=1).max())
+    return encoded["input_ids"][rows, :width], attention_mask[:, :width]
+
+def generate_batch(model, input_ids, attention_mask, temperature, max_new_tokens=COMPRESSION_RATIO * SECONDS):
+    """
+    Sample one clip per prompt row.
+    Returns:
+        tuple: (audio [B, samples] float32 array, sequences [B, K, L] decoder tokens in delay-pattern layout)
+    """
+    recorder = SequenceRecorder()
+    audio = model.generate(input_ids=input_ids, attention_mask=attention_mask, do_sample=True, temperature=temperature,
+                           max_new_tokens=max_new_tokens, stopping_criteria=StoppingCriteriaList([recorder]))
+
+    # Positions the delay pattern forces to padding are overwritten before every forward pass; do the same here
+    sequences = recorder.sequences
+    num_codebooks = model.decoder.num_codebooks
+    pad_token_id = model.generation_config.pad_token_id
+    _, delay_pattern_mask = model.decoder.build_delay_pattern_mask(sequences[:, :1], pad_token_id, max_length=sequences.shape[-1])
+    sequences = model.decoder.apply_delay_pattern_mask(sequences, delay_pattern_mask)
+    return audio[:, 0].cpu().numpy(), sequences.reshape(input_ids.shape[0], num_codebooks, -1)
+
+def sequence_logprobs(model, input_ids, attention_mask, sequences):
+    """
+    Teacher-forced log-likelihood of MusicGen token sequences at temperature 1
+    and without classifier-free guidance. generate() samples with MusicGen's
+    default guidance (and the round's temperature), so this is not the sampling
+    likelihood; it is the one quantity DPO compares, and finetuning rescores
+    every row through this same function for the reference term.
+    Args:
+        sequences (torch.Tensor): Decoder tokens in delay-pattern layout, shape [B, K, L],
+            starting with the decoder start token.
+    Returns:
+        torch.Tensor: Sum of the log-probabilities of every sampled token, shape [B].
+    """
+    batch_size, num_codebooks, length = sequences.shape
+    decoder_input_ids = sequences[:, :, :-1].reshape(batch_size * num_codebooks, length - 1)
+    logits = model(input_ids=input_ids, attention_mask=attention_mask, decoder_input_ids=decoder_input_ids).logits
+    logits = logits.reshape(batch_size, num_codebooks, length - 1, -1)
+
+    # Padding from the delay pattern is forced, not sampled, and lies outside the vocabulary
+    targets = sequences[:, :, 1:]
+    mask = targets != model.generation_config.pad_token_id
+    token_logprobs = torch.log_softmax(logits.float(), dim=-1).gather(-1, targets.masked_fill(~mask, 0).unsqueeze(-1)).squeeze(-1)
+    return (token_logprobs * mask).sum(dim=(1, 2))
+
+def generate_round(model, processor, model_idx, sampled_data, device, store, num_pairs=NUM_PAIRS_PER_CAPTION_PER_TEMP, temps=TEMPS, batch_size=BATCH_SIZE):
+    """
+    Generate every (caption, pair, temperature) clip for one model in large batches.
+    `generate` takes a single temperature, so rows are grouped by temperature and
+    each group is split into batches of up to `batch_size` prompts. Token sequences
+    and logprobs are appended to `store` one batch at a time; rows already in the
+    store are skipped, so an interrupted round can be resumed.
+    """
+    ytids = list(sampled_data["ytid"])
+    encoded = encode_captions(processor, sampled_data["caption"], device)
+    sample_rate = model.config.audio_encoder.sampling_rate
+
+    for temp in temps:
+        jobs = [(caption_idx, pair_idx) for pair_idx in range(num_pairs) for caption_idx in range(len(ytids))
+                if (ytids[caption_idx], temp, pair_idx, model_idx) not in store]
+        for start in range(0, len(jobs), batch_size):
+            batch_jobs = jobs[start:start + batch_size]
+            rows = torch.tensor([caption_idx for caption_idx, _ in batch_jobs], device=device)
+            input_ids, attention_mask = select_prompts(encoded, rows)
+            print(f"Generating {len(batch_jobs)} clips at temperature {temp} ({start + len(batch_jobs)}/{len(jobs)})")
+            with torch.no_grad():
+                audio, sequences = generate_batch(model, input_ids, attention_mask, temp)
+                logprobs = sequence_logprobs(model, input_ids, attention_mask, sequences).cpu().numpy()
+
+            keys = [(ytids[caption_idx], temp, pair_idx, model_idx) for caption_idx, pair_idx in batch_jobs]
+            for (ytid, _, pair_idx, _), clip in zip(keys, audio):
+                write(os.path.join(audio_dir, f"{ytid}-temp{temp}-pair{pair_idx}-{model_idx}.wav"), sample_rate, clip)
+            store.append(keys, sequences.cpu().numpy(), logprobs)
+
+def gen(model, processor, model_idx, sampled_data, store):
     # Move models to GPU if available
     device = torch.device("cuda" if torch.cuda.is_available() else "cpu")  # Check if GPU is available
     model.to(device)
+    model.eval()
     print(f"Device: {device}")
 
-    # Generate audio for each sampled caption
-    for _, row in sampled_data.iterrows():
-        caption = row['caption']
-        ytid = row['ytid']
-        
-        # Generate pairs of audio for the caption
-        generate_audio_for_caption(caption, ytid, processor_name, model, device)
+    # Generate audio for all sampled captions
+    generate_round(model, processor, model_idx, sampled_data, device, store)
 
 def main():
     os.makedirs(audio_dir, exist_ok=True)
-    os.makedirs(logprobs_dir, exist_ok=True)
 
     # Load the failed ytids
     with open(FAILED_YTID_PATH, "r") as f:
@@ -108,6 +158,12 @@ def main():
     # Filter captions based on failed ytids
     filtered_data = data[data["ytid"].isin(failed_ytids)]
 
+    # Optionally restrict to captions whose aspects match a boolean query
+    if ASPECT_QUERY is not None:
+        matching_ytids = AspectIndex.load(caption_file).ytids(ASPECT_QUERY)
+        filtered_data = filtered_data[filtered_data["ytid"].isin(matching_ytids)]
+        print(f"{len(filtered_data)} captions match {ASPECT_QUERY!r}")
+
     # Sample NUM_CAPTIONS captions randomly
     sampled_data = filtered_data.sample(NUM_CAPTIONS, random_state=42)
 
@@ -118,9 +174,12 @@ def main():
     policy_processor = AutoProcessor.from_pretrained(policy_model_name)
     policy_model = MusicgenForConditionalGeneration.from_pretrained(policy_model_name)
 
+    # One store per iteration; sequences are the decoder start token plus every generated token
+    store = PairStore(store_dir, num_codebooks=reference_model.decoder.num_codebooks, sequence_length=COMPRESSION_RATIO * SECONDS + 1)
+
     # Generate audio for the sampled captions
-    gen(reference_model, "reference", sampled_data)
-    gen(policy_model, "policy", sampled_data)
+    gen(reference_model, reference_processor, REF_IDX, sampled_data, store)
+    gen(policy_model, policy_processor, POL_IDX, sampled_data, store)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
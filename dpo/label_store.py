@@ -0,0 +1,59 @@
+import json
+import os
+
+class LabelStore:
+    """
+    Human preference labels in an append-only JSONL log with an in-memory index
+    keyed by (ytid, temp, pair_idx). Every label is fsynced as it is recorded, so
+    a crash loses at most the label being typed; relabeling a pair appends a new
+    record and the last record wins on replay.
+    """
+
+    def __init__(self, path, legacy_json_path=None):
+        self.path = path
+        self.index = {}
+        if os.path.exists(path):
+            complete_bytes = 0
+            with open(path, "rb") as f:
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break  # Partial record from an interrupted write
+                    complete_bytes += len(line)
+                    if line.strip():
+                        self._index(json.loads(line))
+            if os.path.getsize(path) > complete_bytes:
+                os.truncate(path, complete_bytes)
+        elif legacy_json_path is not None and os.path.exists(legacy_json_path):
+            # One-time import of labels written by the old whole-file JSON format
+            with open(legacy_json_path, "r") as f:
+                legacy_labels = json.load(f)
+            for label in legacy_labels:
+                self.record(label["ytid"], label["temp"], label["pair_idx"], label["preference"])
+            print(f"Imported {len(legacy_labels)} labels from {legacy_json_path}")
+
+    @staticmethod
+    def key(ytid, temp, pair_idx):
+        return (str(ytid), float(temp), int(pair_idx))
+
+    def _index(self, label):
+        self.index[self.key(label["ytid"], label["temp"], label["pair_idx"])] = label
+
+    def __len__(self):
+        return len(self.index)
+
+    def get(self, ytid, temp, pair_idx):
+        """The latest label for a pair, or None."""
+        return self.index.get(self.key(ytid, temp, pair_idx))
+
+    def record(self, ytid, temp, pair_idx, preference):
+        label = {"ytid": str(ytid), "pair_idx": int(pair_idx), "temp": float(temp), "preference": preference}
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "a") as f:
+            f.write(json.dumps(label) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self._index(label)
+
+    def labels(self):
+        """The latest label of every pair, in the format of the old JSON file."""
+        return list(self.index.values())
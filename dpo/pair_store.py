@@ -0,0 +1,148 @@
+import json
+import os
+import numpy as np
+
+class PairStore:
+    """
+    Append-only store of generated MusicGen token sequences and their logprobs for
+    one DPO iteration, keyed by (ytid, temp, pair_idx, model_idx).
+
+    Layout of `store_dir`:
+        meta.json     - sequence shape and dtypes, fixed when the store is created
+        codes.bin     - int16 tokens, one [num_codebooks, sequence_length] row per clip
+        logprobs.bin  - float32 teacher-forced, no-CFG logprob of each row under the model that generated it
+        index.jsonl   - one {"ytid", "temp", "pair_idx", "model_idx", "row"} record per row
+
+    Rows are appended to the data files before their index records, so the index
+    never points past the data; on open, data beyond the last indexed row (left by
+    an interrupted append) is truncated away. Readers memory-map the data files,
+    so items are views into the page cache rather than per-item file reads.
+    """
+
+    CODES_DTYPE = np.int16
+    LOGPROBS_DTYPE = np.float32
+
+    def __init__(self, store_dir, num_codebooks=None, sequence_length=None):
+        self.store_dir = store_dir
+        self.codes_path = os.path.join(store_dir, "codes.bin")
+        self.logprobs_path = os.path.join(store_dir, "logprobs.bin")
+        self.index_path = os.path.join(store_dir, "index.jsonl")
+        meta_path = os.path.join(store_dir, "meta.json")
+
+        if os.path.exists(meta_path):
+            with open(meta_path, "r") as f:
+                meta = json.load(f)
+            self.shape = (meta["num_codebooks"], meta["sequence_length"])
+        elif num_codebooks is None or sequence_length is None:
+            raise FileNotFoundError(f"No pair store in {store_dir}; pass num_codebooks and sequence_length to create one.")
+        else:
+            os.makedirs(store_dir, exist_ok=True)
+            self.shape = (num_codebooks, sequence_length)
+            with open(meta_path, "w") as f:
+                json.dump({"num_codebooks": num_codebooks, "sequence_length": sequence_length}, f)
+        self.row_bytes = int(np.prod(self.shape)) * np.dtype(self.CODES_DTYPE).itemsize
+
+        self.index = {}
+        self.num_rows = 0
+        if os.path.exists(self.index_path):
+            complete_bytes = 0
+            with open(self.index_path, "rb") as f:
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break  # Partial record from an interrupted append
+                    complete_bytes += len(line)
+                    record = json.loads(line)
+                    self.index[self.key(record["ytid"], record["temp"], record["pair_idx"], record["model_idx"])] = record["row"]
+                    self.num_rows = max(self.num_rows, record["row"] + 1)
+            if os.path.getsize(self.index_path) > complete_bytes:
+                os.truncate(self.index_path, complete_bytes)
+        self._truncate_to(self.num_rows)
+        self._codes = None
+        self._logprobs = None
+
+    @staticmethod
+    def key(ytid, temp, pair_idx, model_idx):
+        return (str(ytid), float(temp), int(pair_idx), int(model_idx))
+
+    def _truncate_to(self, num_rows):
+        for path, row_bytes in ((self.codes_path, self.row_bytes), (self.logprobs_path, np.dtype(self.LOGPROBS_DTYPE).itemsize)):
+            if os.path.exists(path) and os.path.getsize(path) > num_rows * row_bytes:
+                os.truncate(path, num_rows * row_bytes)
+
+    def __len__(self):
+        return self.num_rows
+
+    def __contains__(self, key):
+        return self.key(*key) in self.index
+
+    def append(self, keys, codes, logprobs):
+        """
+        Append a batch of rows.
+        Args:
+            keys (list): (ytid, temp, pair_idx, model_idx) per row.
+            codes (np.ndarray): Tokens of shape [B, num_codebooks, sequence_length].
+            logprobs (np.ndarray): Sequence logprobs of shape [B].
+        """
+        codes = np.ascontiguousarray(codes, dtype=self.CODES_DTYPE)
+        logprobs = np.ascontiguousarray(logprobs, dtype=self.LOGPROBS_DTYPE)
+        if codes.shape[1:] != self.shape or len(codes) != len(keys) or len(logprobs) != len(keys):
+            raise ValueError(f"Expected {len(keys)} rows of shape {self.shape}, got codes {codes.shape} and logprobs {logprobs.shape}.")
+
+        for path, data in ((self.codes_path, codes), (self.logprobs_path, logprobs)):
+            with open(path, "ab") as f:
+                f.write(data.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+
+        records = []
+        for offset, key in enumerate(keys):
+            ytid, temp, pair_idx, model_idx = self.key(*key)
+            row = self.num_rows + offset
+            self.index[(ytid, temp, pair_idx, model_idx)] = row
+            records.append(json.dumps({"ytid": ytid, "temp": temp, "pair_idx": pair_idx, "model_idx": model_idx, "row": row}))
+        with open(self.index_path, "a") as f:
+            f.write("\n".join(records) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.num_rows += len(keys)
+        self._codes = self._logprobs = None  # Remap on the next read
+
+    def _map(self):
+        if self._codes is None or len(self._codes) != self.num_rows:
+            # Copy-on-write maps are writable views (no torch warnings) that never modify the files
+            self._codes = np.memmap(self.codes_path, dtype=self.CODES_DTYPE, mode="c", shape=(self.num_rows, *self.shape))
+            self._logprobs = np.memmap(self.logprobs_path, dtype=self.LOGPROBS_DTYPE, mode="c", shape=(self.num_rows,))
+
+    def row(self, ytid, temp, pair_idx, model_idx):
+        return self.index[self.key(ytid, temp, pair_idx, model_idx)]
+
+    def get(self, ytid, temp, pair_idx, model_idx):
+        """
+        Returns:
+            tuple: (codes view of shape [num_codebooks, sequence_length], logprob)
+        """
+        row = self.row(ytid, temp, pair_idx, model_idx)
+        self._map()
+        return self._codes[row], float(self._logprobs[row])
+
+    def read(self, rows):
+        """
+        Returns:
+            tuple: (codes [len(rows), num_codebooks, sequence_length], logprobs [len(rows)]) copies.
+        """
+        self._map()
+        rows = np.asarray(rows, dtype=np.int64)
+        return np.array(self._codes[rows]), np.array(self._logprobs[rows])
+
+    def keys_by_row(self):
+        """(ytid, temp, pair_idx, model_idx) of every row; None for rows superseded by a later append."""
+        keys = [None] * self.num_rows
+        for key, row in self.index.items():
+            keys[row] = key
+        return keys
+
+    def __getstate__(self):
+        # DataLoader workers re-map the files instead of pickling the maps
+        state = self.__dict__.copy()
+        state["_codes"] = state["_logprobs"] = None
+        return state
@@ -0,0 +1,113 @@
+import queue
+import threading
+from collections import OrderedDict
+import numpy as np
+from scipy.io import wavfile
+
+class PcmClip:
+    """Decoded 16-bit PCM ready for `simpleaudio.play_buffer`."""
+
+    def __init__(self, pcm, sample_rate):
+        self.pcm = np.ascontiguousarray(pcm)
+        self.sample_rate = sample_rate
+        self.num_channels = 1 if pcm.ndim == 1 else pcm.shape[1]
+        self.bytes_per_sample = pcm.dtype.itemsize
+
+    @property
+    def nbytes(self):
+        return self.pcm.nbytes
+
+def decode_wav(path):
+    """Read a WAV file into int16 PCM (float files are scaled from [-1, 1])."""
+    sample_rate, audio = wavfile.read(path)
+    if np.issubdtype(audio.dtype, np.floating):
+        audio = (np.clip(audio, -1.0, 1.0) * np.iinfo(np.int16).max).astype(np.int16)
+    elif audio.dtype == np.uint8:
+        # 8-bit WAV is offset-binary: 128 is silence
+        audio = (audio.astype(np.int16) - 128) << 8
+    elif audio.dtype != np.int16:
+        # Signed PCM wider than 16 bits
+        audio = (audio.astype(np.float32) / -np.iinfo(audio.dtype).min * np.iinfo(np.int16).max).astype(np.int16)
+    return PcmClip(audio, sample_rate)
+
+class PcmCache:
+    """
+    Thread-safe LRU of decoded clips keyed by path. A background thread decodes
+    paths passed to prefetch(); get() returns a cached clip immediately, waits for
+    one that is being decoded, or decodes synchronously on a miss. Nothing here
+    touches an audio device, so it can be exercised headless.
+    """
+
+    def __init__(self, capacity=16, decode=decode_wav):
+        self.capacity = capacity
+        self.decode = decode
+        self._clips = OrderedDict()
+        self._pending = set()
+        self._errors = {}
+        self._condition = threading.Condition()
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def _run(self):
+        while True:
+            path = self._queue.get()
+            if path is None:
+                return
+            try:
+                clip, error = self.decode(path), None
+            except Exception as e:
+                clip, error = None, e
+            with self._condition:
+                self._pending.discard(path)
+                if error is None:
+                    self._store(path, clip)
+                else:
+                    self._errors[path] = error
+                self._condition.notify_all()
+
+    def _store(self, path, clip):
+        self._clips[path] = clip
+        self._clips.move_to_end(path)
+        while len(self._clips) > self.capacity:
+            self._clips.popitem(last=False)
+
+    def prefetch(self, paths):
+        """Queue paths for background decoding, skipping ones cached or already queued."""
+        with self._condition:
+            for path in paths:
+                if path in self._clips:
+                    self._clips.move_to_end(path)  # Keep upcoming clips from being evicted
+                elif path not in self._pending:
+                    self._pending.add(path)
+                    self._errors.pop(path, None)
+                    self._queue.put(path)
+
+    def __contains__(self, path):
+        with self._condition:
+            return path in self._clips
+
+    def get(self, path):
+        with self._condition:
+            while path in self._pending:
+                self._condition.wait()
+            if path in self._errors:
+                raise self._errors.pop(path)
+            if path in self._clips:
+                self._clips.move_to_end(path)
+                return self._clips[path]
+        clip = self.decode(path)
+        with self._condition:
+            self._store(path, clip)
+        return clip
+
+    def close(self):
+        self._queue.put(None)
+        self._worker.join()
+
+def play(clip):
+    """Play a decoded clip and block until it finishes."""
+    import simpleaudio as sa
+
+    play_obj = sa.play_buffer(clip.pcm, clip.num_channels, clip.bytes_per_sample, clip.sample_rate)
+    play_obj.wait_done()
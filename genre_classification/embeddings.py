@@ -0,0 +1,156 @@
+import hashlib
+import os
+import time
+import librosa
+import numpy as np
+import torch
+from transformers import AutoModel, AutoProcessor, ClapModel, Wav2Vec2FeatureExtractor, Wav2Vec2Model, Wav2Vec2Processor
+
+# Each encoder sees a 30 s GTZAN clip as a sequence of non-overlapping windows
+# of its native input length; window embeddings are mean-pooled per clip.
+ENCODERS = {
+    "clap": {"model_name": "laion/larger_clap_music", "sample_rate": 48000, "window_s": 10.0},
+    "mert": {"model_name": "m-a-p/MERT-v1-95M", "sample_rate": 24000, "window_s": 5.0},
+    "wav2vec2": {"model_name": "facebook/wav2vec2-base-960h", "sample_rate": 16000, "window_s": 10.0},
+}
+
+# Attribute holding each encoder inside the caption_generation *T5Model checkpoints
+CHECKPOINT_PREFIXES = {"clap": "clap_model.", "mert": "mert_model.", "wav2vec2": "wav2vec2_model."}
+
+CACHE_VERSION = 2  # Bumped when the windowing or pooling changes
+
+def load_encoder(encoder_name, device="cpu"):
+    """
+    Load the pretrained encoder and its feature extractor.
+    Returns:
+        tuple: (model, processor)
+    """
+    model_name = ENCODERS[encoder_name]["model_name"]
+    if encoder_name == "clap":
+        model = ClapModel.from_pretrained(model_name)
+        processor = AutoProcessor.from_pretrained(model_name)
+    elif encoder_name == "mert":
+        model = AutoModel.from_pretrained(model_name, trust_remote_code=True)
+        processor = Wav2Vec2FeatureExtractor.from_pretrained(model_name, trust_remote_code=True)
+    elif encoder_name == "wav2vec2":
+        model = Wav2Vec2Model.from_pretrained(model_name)
+        processor = Wav2Vec2Processor.from_pretrained(model_name)
+    else:
+        raise ValueError(f"Invalid encoder: {encoder_name}")
+    return model.to(device).eval(), processor
+
+def encoder_fingerprint(encoder_name, checkpoint_path=None):
+    """
+    Cache key for an encoder. Changes whenever the model name or the
+    fine-tuned checkpoint (path or mtime) changes, so only that encoder is re-extracted.
+    """
+    key = f"{ENCODERS[encoder_name]['model_name']}|v{CACHE_VERSION}"
+    if checkpoint_path is not None:
+        key += f"|{os.path.abspath(checkpoint_path)}|{os.path.getmtime(checkpoint_path)}"
+    return hashlib.sha1(key.encode()).hexdigest()[:10]
+
+def chunk_audio(audio, sample_rate, window_s):
+    """
+    Split a 1-D waveform into non-overlapping windows, zero-padding the last one.
+    A tail shorter than half a window (e.g. the extra 0.01 s of a 30.01 s clip)
+    is dropped so a nearly silent window does not enter the mean pool.
+    Returns:
+        np.ndarray: Array of shape [num_windows, window_length].
+    """
+    window = int(sample_rate * window_s)
+    full_windows, tail = divmod(len(audio), window)
+    num_windows = max(1, full_windows + (tail >= window // 2))
+    padded = np.zeros(num_windows * window, dtype=np.float32)
+    padded[:min(len(audio), num_windows * window)] = audio[:num_windows * window]
+    return padded.reshape(num_windows, window)
+
+def load_encoder_checkpoint(encoder_name, model, checkpoint_path, device="cpu"):
+    """
+    Load the encoder weights out of a caption_generation training checkpoint
+    ({'model_state_dict': ...} for the whole *T5Model), keeping only the keys
+    under the encoder's attribute and stripping that prefix.
+    """
+    checkpoint = torch.load(checkpoint_path, map_location=device, weights_only=False)
+    state_dict = checkpoint.get("model_state_dict", checkpoint) if isinstance(checkpoint, dict) else checkpoint
+    prefix = CHECKPOINT_PREFIXES[encoder_name]
+    if any(key.startswith(prefix) for key in state_dict):
+        state_dict = {key[len(prefix):]: value for key, value in state_dict.items() if key.startswith(prefix)}
+
+    # Layer-truncated checkpoints (train.py --num_layers) hold only the first K layers
+    num_layers = checkpoint.get("num_layers") if isinstance(checkpoint, dict) else None
+    if num_layers is not None and num_layers < model.config.num_hidden_layers:
+        model.encoder.layers = torch.nn.ModuleList(list(model.encoder.layers)[:num_layers])
+        model.config.num_hidden_layers = num_layers
+    model.load_state_dict(state_dict)
+
+def embed_windows(encoder_name, model, processor, windows, device="cpu"):
+    """
+    Embed a batch of equal-length windows.
+    Returns:
+        np.ndarray: Array of shape [num_windows, dim].
+    """
+    sample_rate = ENCODERS[encoder_name]["sample_rate"]
+    with torch.no_grad():
+        if encoder_name == "clap":
+            inputs = processor(audios=list(windows), sampling_rate=sample_rate, return_tensors="pt").to(device)
+            features = model.get_audio_features(**inputs)
+        elif encoder_name == "mert":
+            inputs = processor(list(windows), sampling_rate=sample_rate, return_tensors="pt").to(device)
+            outputs = model(inputs["input_values"], output_hidden_states=True)
+            # Average the time-pooled representation of every layer
+            features = torch.stack(outputs.hidden_states).mean(dim=2).mean(dim=0)
+        else:
+            inputs = processor(list(windows), sampling_rate=sample_rate, return_tensors="pt").to(device)
+            features = model(inputs["input_values"]).last_hidden_state.mean(dim=1)
+    return features.cpu().numpy()
+
+def extract_embeddings(encoder_name, clip_paths, cache_dir, device="cpu", checkpoint_path=None, batch_size=16):
+    """
+    Return one embedding per clip, extracting only clips missing from the on-disk cache.
+    Args:
+        encoder_name (str): clap, mert, or wav2vec2.
+        clip_paths (list): Paths to the audio clips.
+        cache_dir (str): Directory holding `<encoder>-<fingerprint>.npz` caches.
+        checkpoint_path (str): Optional caption_generation checkpoint (or bare encoder state dict) to load.
+    Returns:
+        tuple: (clip paths that decoded, embeddings [num_clips, dim], seconds spent extracting)
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    cache_path = os.path.join(cache_dir, f"{encoder_name}-{encoder_fingerprint(encoder_name, checkpoint_path)}.npz")
+    cached = {}
+    if os.path.exists(cache_path):
+        data = np.load(cache_path)
+        cached = dict(zip(data["paths"], data["embeddings"]))
+
+    missing = [path for path in clip_paths if path not in cached]
+    start = time.perf_counter()
+    if missing:
+        print(f"Extracting {encoder_name} embeddings for {len(missing)} clips ({len(cached)} cached)")
+        model, processor = load_encoder(encoder_name, device)
+        if checkpoint_path is not None:
+            load_encoder_checkpoint(encoder_name, model, checkpoint_path, device)
+        spec = ENCODERS[encoder_name]
+
+        for path in missing:
+            try:
+                audio, _ = librosa.load(path, sr=spec["sample_rate"], mono=True)
+            except Exception as e:
+                print(f"Error loading {path}: {e}")
+                continue
+            windows = chunk_audio(audio, spec["sample_rate"], spec["window_s"])
+            window_embeddings = np.concatenate([
+                embed_windows(encoder_name, model, processor, windows[i:i + batch_size], device)
+                for i in range(0, len(windows), batch_size)
+            ])
+            cached[path] = window_embeddings.mean(axis=0)
+
+        paths = np.array(list(cached.keys()))
+        tmp_path = cache_path + ".tmp.npz"
+        np.savez(tmp_path, paths=paths, embeddings=np.stack([cached[p] for p in paths]))
+        os.replace(tmp_path, cache_path)  # An interrupted run never leaves a corrupt cache behind
+    elapsed = time.perf_counter() - start
+
+    present = [path for path in clip_paths if path in cached]
+    if len(present) != len(clip_paths):
+        print(f"Skipping {len(clip_paths) - len(present)} clips that could not be decoded")
+    return present, np.stack([cached[path] for path in present]).astype(np.float32), elapsed
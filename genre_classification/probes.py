@@ -0,0 +1,63 @@
+import time
+import torch
+import torch.nn as nn
+
+class LinearProbe(nn.Module):
+    """Multinomial logistic regression on frozen embeddings."""
+
+    def __init__(self, input_dim, num_classes):
+        super(LinearProbe, self).__init__()
+        self.fc = nn.Linear(input_dim, num_classes)
+
+    def forward(self, x):
+        return self.fc(x)
+
+class MLPProbe(nn.Module):
+    """One-hidden-layer MLP classifier on frozen embeddings."""
+
+    def __init__(self, input_dim, num_classes, hidden_dim=512, dropout=0.2):
+        super(MLPProbe, self).__init__()
+        self.net = nn.Sequential(
+            nn.Linear(input_dim, hidden_dim),
+            nn.ReLU(),
+            nn.Dropout(dropout),
+            nn.Linear(hidden_dim, num_classes),
+        )
+
+    def forward(self, x):
+        return self.net(x)
+
+def standardize(train_x, test_x):
+    """Z-score both splits with statistics from the training split."""
+    mean = train_x.mean(dim=0, keepdim=True)
+    std = train_x.std(dim=0, keepdim=True).clamp_min(1e-6)
+    return (train_x - mean) / std, (test_x - mean) / std
+
+def train_probe(probe, train_x, train_y, epochs=200, batch_size=64, learning_rate=1e-3, weight_decay=1e-4, seed=0):
+    """
+    Train a probe with minibatch AdamW. The whole training set stays in one
+    tensor and minibatches are views selected by a random permutation, so
+    there is no per-example Python work or DataLoader collation.
+    Returns:
+        float: Wall time in seconds.
+    """
+    generator = torch.Generator().manual_seed(seed)
+    optimizer = torch.optim.AdamW(probe.parameters(), lr=learning_rate, weight_decay=weight_decay)
+    criterion = nn.CrossEntropyLoss()
+
+    start = time.perf_counter()
+    probe.train()
+    for _ in range(epochs):
+        permutation = torch.randperm(len(train_x), generator=generator)
+        for i in range(0, len(train_x), batch_size):
+            idx = permutation[i:i + batch_size]
+            optimizer.zero_grad()
+            loss = criterion(probe(train_x[idx]), train_y[idx])
+            loss.backward()
+            optimizer.step()
+    return time.perf_counter() - start
+
+def accuracy(probe, x, y):
+    probe.eval()
+    with torch.no_grad():
+        return (probe(x).argmax(dim=-1) == y).float().mean().item()
@@ -0,0 +1,72 @@
+# Run from genre_classification directory with:
+# python run_probe.py --gtzan_dir ../data/gtzan/genres_original
+
+import argparse
+import os
+import torch
+from sklearn.model_selection import train_test_split
+from embeddings import ENCODERS, extract_embeddings
+from probes import LinearProbe, MLPProbe, standardize, train_probe, accuracy
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="GTZAN genre classification probes on cached encoder embeddings.")
+    parser.add_argument('--gtzan_dir', type=str, default="../data/gtzan/genres_original", help="Directory with one sub-directory of clips per genre.")
+    parser.add_argument('--cache_dir', type=str, default="../data/gtzan/embeddings", help="Where per-encoder embedding caches are stored.")
+    parser.add_argument('--encoders', type=str, default="clap,mert,wav2vec2", help="Comma-separated encoders to compare.")
+    parser.add_argument('--checkpoint', action='append', default=[], help="encoder=path to a caption_generation checkpoint (e.g. mert=../caption_generation/checkpoints/mert_t5_unfrozen/checkpoint3.pth); may be repeated.")
+    parser.add_argument('--epochs', type=int, default=200, help="Training epochs per probe.")
+    return parser.parse_args()
+
+def list_gtzan_clips(gtzan_dir):
+    """
+    Returns:
+        tuple: (clip paths, integer labels, genre names)
+    """
+    genres = sorted(d for d in os.listdir(gtzan_dir) if os.path.isdir(os.path.join(gtzan_dir, d)))
+    paths, labels = [], []
+    for label, genre in enumerate(genres):
+        for file_name in sorted(os.listdir(os.path.join(gtzan_dir, genre))):
+            if file_name.endswith(".wav"):
+                paths.append(os.path.join(gtzan_dir, genre, file_name))
+                labels.append(label)
+    return paths, labels, genres
+
+if __name__ == "__main__":
+    args = parse_args()
+    DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+    checkpoints = dict(item.split("=", 1) for item in args.checkpoint)
+
+    paths, labels, genres = list_gtzan_clips(args.gtzan_dir)
+    label_of = dict(zip(paths, labels))
+    # 800/200 split, stratified by genre
+    train_paths, test_paths = train_test_split(paths, test_size=0.2, random_state=42, stratify=labels)
+    print(f"{len(genres)} genres, {len(train_paths)} train clips, {len(test_paths)} test clips")
+
+    results = []
+    for encoder_name in args.encoders.split(","):
+        if encoder_name not in ENCODERS:
+            raise ValueError(f"Invalid encoder: {encoder_name}")
+        checkpoint_path = checkpoints.get(encoder_name)
+        train_kept, train_x, train_extract_s = extract_embeddings(encoder_name, train_paths, args.cache_dir, DEVICE, checkpoint_path)
+        test_kept, test_x, test_extract_s = extract_embeddings(encoder_name, test_paths, args.cache_dir, DEVICE, checkpoint_path)
+
+        train_x, test_x = standardize(torch.from_numpy(train_x), torch.from_numpy(test_x))
+        train_y = torch.tensor([label_of[p] for p in train_kept])
+        test_y = torch.tensor([label_of[p] for p in test_kept])
+
+        for probe_name, probe in [("logreg", LinearProbe(train_x.shape[1], len(genres))),
+                                  ("mlp", MLPProbe(train_x.shape[1], len(genres)))]:
+            train_s = train_probe(probe, train_x, train_y, epochs=args.epochs)
+            results.append({
+                "encoder": encoder_name,
+                "probe": probe_name,
+                "train_acc": accuracy(probe, train_x, train_y),
+                "test_acc": accuracy(probe, test_x, test_y),
+                "extract_s": train_extract_s + test_extract_s,
+                "train_s": train_s,
+            })
+
+    print(f"\n{'Encoder':<10} {'Probe':<7} {'Train Acc':>9} {'Test Acc':>9} {'Extract (s)':>12} {'Train (s)':>10}")
+    for r in results:
+        print(f"{r['encoder']:<10} {r['probe']:<7} {100 * r['train_acc']:>8.2f}% {100 * r['test_acc']:>8.2f}% "
+              f"{r['extract_s']:>12.1f} {r['train_s']:>10.1f}")
@@ -0,0 +1,192 @@
+import glob
+import json
+import os
+import subprocess
+import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+import numpy as np
+from scipy.io import wavfile
+from scipy.signal import resample_poly
+
+# CLAP needs 48 kHz, MERT 24 kHz and wav2vec2 16 kHz. Each window is decoded once at
+# 48 kHz and decimated by integer factors to the other two rates.
+DECODE_RATE = 48000
+OUTPUT_RATES = (48000, 24000, 16000)
+
+class YoutubeFetcher:
+    """Downloads the best audio stream for a ytid without re-encoding it."""
+
+    def __init__(self, work_dir):
+        self.work_dir = work_dir
+        os.makedirs(work_dir, exist_ok=True)
+
+    def fetch(self, ytid):
+        from yt_dlp import YoutubeDL
+
+        ydl_opts = {
+            'format': 'bestaudio/best',
+            'outtmpl': os.path.join(self.work_dir, f"{ytid}.%(ext)s"),
+            'noplaylist': True,  # Don't download playlists
+            'quiet': True,
+        }
+        with YoutubeDL(ydl_opts) as ydl:
+            info = ydl.extract_info(f'https://www.youtube.com/watch?v={ytid}', download=True)
+            return ydl.prepare_filename(info)
+
+    def cleanup(self, path):
+        if path is not None and os.path.exists(path):
+            os.remove(path)
+
+class LocalFileFetcher:
+    """Serves `<source_dir>/<ytid>.<ext>` from disk; used for tests and re-runs on local copies."""
+
+    def __init__(self, source_dir):
+        self.source_dir = source_dir
+
+    def fetch(self, ytid):
+        matches = glob.glob(os.path.join(glob.escape(self.source_dir), f"{glob.escape(ytid)}.*"))
+        if not matches:
+            raise FileNotFoundError(f"No local audio for {ytid} in {self.source_dir}")
+        return matches[0]
+
+    def cleanup(self, path):
+        pass  # Never delete the source files
+
+class Manifest:
+    """
+    Append-only JSONL record of every processed ytid. The last record for a
+    ytid wins, so a failure followed by a successful retry reads as a success.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.status = {}
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                for line in f:
+                    if line.strip():
+                        record = json.loads(line)
+                        self.status[record["ytid"]] = record
+        self._lock = threading.Lock()
+
+    def succeeded(self, ytid):
+        return self.status.get(ytid, {}).get("status") == "ok"
+
+    def failed_ytids(self):
+        return [ytid for ytid, record in self.status.items() if record["status"] != "ok"]
+
+    def record(self, ytid, ok, error=None):
+        record = {"ytid": ytid, "status": "ok" if ok else "failed"}
+        if error is not None:
+            record["error"] = error
+        with self._lock:
+            self.status[ytid] = record
+            with open(self.path, "a") as f:
+                f.write(json.dumps(record) + "\n")
+
+def decode_window(input_file, start_s, end_s, sample_rate=DECODE_RATE):
+    """
+    Decode only [start_s, end_s) of a file to mono float32. Putting -ss before
+    -i makes ffmpeg seek in the container instead of decoding from the start,
+    and the resampler only ever sees the window.
+    """
+    command = [
+        "ffmpeg", "-nostdin", "-v", "error",
+        "-ss", str(start_s), "-t", str(end_s - start_s),
+        "-i", input_file,
+        "-ac", "1", "-ar", str(sample_rate), "-f", "f32le", "-",
+    ]
+    result = subprocess.run(command, check=True, capture_output=True)
+    audio = np.frombuffer(result.stdout, dtype=np.float32)
+    if len(audio) == 0:
+        raise ValueError(f"No audio decoded from {input_file} between {start_s}s and {end_s}s")
+    return audio
+
+def write_wav_atomic(path, sample_rate, audio):
+    """Write 16-bit PCM through a temporary file so partial outputs never look complete."""
+    pcm = (np.clip(audio, -1.0, 1.0) * np.iinfo(np.int16).max).astype(np.int16)
+    tmp_path = path + ".tmp"
+    wavfile.write(tmp_path, sample_rate, pcm)
+    os.replace(tmp_path, path)
+
+def process_clip(input_file, ytid, start_s, end_s, output_dirs):
+    """
+    Decode one window and write it at every output rate.
+    Args:
+        output_dirs (dict): Output directory per sample rate.
+    Returns:
+        dict: Written file path per sample rate.
+    """
+    audio = decode_window(input_file, start_s, end_s)
+    outputs = {}
+    for rate, output_dir in output_dirs.items():
+        resampled = audio if rate == DECODE_RATE else resample_poly(audio, rate, DECODE_RATE).astype(np.float32)
+        outputs[rate] = os.path.join(output_dir, f"{ytid}.wav")
+        write_wav_atomic(outputs[rate], rate, resampled)
+    return outputs
+
+def run_pipeline(rows, fetcher, output_dirs, manifest, num_fetchers=8, num_decoders=None, max_pending=None):
+    """
+    Fetch and segment clips with a bounded pool of concurrent fetchers feeding a
+    separate process pool for CPU-bound decoding.
+    Args:
+        rows (iterable): (ytid, start_s, end_s) tuples.
+        fetcher: Object with fetch(ytid) -> path and cleanup(path).
+        output_dirs (dict): Output directory per sample rate.
+        manifest (Manifest): Successes and failures; ytids already marked ok (or with every
+            output already on disk) are skipped.
+        max_pending (int): Cap on downloaded-but-undecoded clips, which bounds scratch disk use.
+    Returns:
+        dict: Counts of successes, failures and skipped clips.
+    """
+    for output_dir in output_dirs.values():
+        os.makedirs(output_dir, exist_ok=True)
+    num_decoders = num_decoders or os.cpu_count()
+    max_pending = max_pending or num_fetchers + 2 * num_decoders
+    counts = {"success": 0, "failure": 0, "skipped": 0}
+    rows = iter(rows)
+    pending = {}
+
+    with ThreadPoolExecutor(num_fetchers) as fetch_pool, ProcessPoolExecutor(num_decoders) as decode_pool:
+        def refill():
+            while len(pending) < max_pending:
+                row = next(rows, None)
+                if row is None:
+                    return
+                ytid = row[0]
+                already_written = all(os.path.exists(os.path.join(d, f"{ytid}.wav")) for d in output_dirs.values())
+                if manifest.succeeded(ytid) or already_written:
+                    counts["skipped"] += 1
+                    continue
+                pending[fetch_pool.submit(fetcher.fetch, ytid)] = ("fetch", row, None)
+
+        refill()
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, row, path = pending.pop(future)
+                ytid, start_s, end_s = row
+                if stage == "fetch":
+                    try:
+                        path = future.result()
+                    except Exception as e:
+                        print(f"Error downloading audio for {ytid}: {e}")
+                        manifest.record(ytid, False, f"fetch: {e}")
+                        counts["failure"] += 1
+                        continue
+                    decode = decode_pool.submit(process_clip, path, ytid, start_s, end_s, output_dirs)
+                    pending[decode] = ("decode", row, path)
+                else:
+                    try:
+                        future.result()
+                        manifest.record(ytid, True)
+                        counts["success"] += 1
+                    except Exception as e:
+                        print(f"Error decoding audio file {path}: {e}")
+                        manifest.record(ytid, False, f"decode: {e}")
+                        counts["failure"] += 1
+                    finally:
+                        fetcher.cleanup(path)
+            refill()
+
+    return counts
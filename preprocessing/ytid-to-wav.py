@@ -1,107 +1,51 @@
-import pandas as pd
-from yt_dlp import YoutubeDL
-from pydub import AudioSegment
+import argparse
 import os
+import pandas as pd
+from musiccaps_pipeline import OUTPUT_RATES, YoutubeFetcher, LocalFileFetcher, Manifest, run_pipeline
 
 # Run from preprocessing folder
-# Note the resampling to 16 khz
-# Actually, resampling to 48 khz; required by CLAP
-
-def download_youtube_audio(ytid):
-    try:
-        # Set options to download as best audio quality and convert to WAV
-        ydl_opts = {
-            'format': 'bestaudio/best',
-            'outtmpl': f"{ytid}.%(ext)s",
-            'postprocessors': [{
-                'key': 'FFmpegExtractAudio',
-                'preferredcodec': 'wav',
-                'preferredquality': '192',
-            }],
-            'noplaylist': True,  # Don't download playlists
-        }
-        with YoutubeDL(ydl_opts) as ydl:
-            ydl.download([f'https://www.youtube.com/watch?v={ytid}'])
-        return f"{ytid}.wav"  # Return the WAV filename directly
-    except Exception as e:
-        print(f"Error downloading audio for {ytid}: {e}")
-        return None
-
-def extract_audio_segment(input_file, start_s, end_s, target_sample_rate=48000):
-    try:
-        # Load the webm file and extract the segment
-        audio = AudioSegment.from_file(input_file, format="webm")  # Specify format as webm
-        audio = audio.set_frame_rate(target_sample_rate)  # Resample to 48 kHz
-        segment = audio[start_s * 1000:end_s * 1000]  # Convert seconds to milliseconds
-        return segment
-    except Exception as e:
-        print(f"Error decoding audio file {input_file}: {e}")
-        return None
-
-def save_audio_segment(segment, ytid, start_s, end_s, output_dir):
-    if segment is not None:
-        output_file = f"{ytid}.wav"  # Define output WAV filename
-        segment.export(output_dir + output_file, format="wav")  # Export as WAV
-        return output_file
-    return None
-
-def single_download(ytid, start_s, end_s, output_dir):
-    audio_file = download_youtube_audio(ytid)
-    if audio_file is None:
-        return
-    audio_segment = extract_audio_segment(audio_file, start_s, end_s)
-    output_file = save_audio_segment(audio_segment, ytid, start_s, end_s, output_dir)
-    os.remove(audio_file)  # Remove the original webm file after processing
-    return output_file
+# Each clip is decoded once and written at 48 kHz (CLAP), 24 kHz (MERT) and 16 kHz (wav2vec2)
+# into ../data/musiccaps/wav-48/, wav-24/ and wav-16/.
+# Re-running skips ytids already marked ok in the manifest and retries failures.
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Download and segment MusicCaps clips.")
+    parser.add_argument('--csv_file', type=str, default="../data/musiccaps/musiccaps-train-data.csv")
+    parser.add_argument('--output_root', type=str, default="../data/musiccaps/", help="wav-48/, wav-24/ and wav-16/ are created here.")
+    parser.add_argument('--source_dir', type=str, default=None, help="Read <ytid>.<ext> files from this directory instead of downloading.")
+    parser.add_argument('--num_fetchers', type=int, default=8, help="Concurrent downloads.")
+    parser.add_argument('--num_decoders', type=int, default=None, help="Decode processes (default: CPU count).")
+    return parser.parse_args()
 
 def main():
-    # Load the CSV file
-    csv_file = "../data/musiccaps/musiccaps-train-data.csv"
-    data = pd.read_csv(csv_file)
-
-    # Initialize counters and lists for success and failure
-    success_count = 0
-    failure_count = 0
-    already_exists_count = 0
-    failed_ytids = []
-
-    # Specify the output directory
-    output_dir = "../data/musiccaps/wav-48/"
-    os.makedirs(output_dir, exist_ok=True)  # Create the output directory if it doesn't exist
+    args = parse_args()
 
-    # Loop through the first 10 rows in the CSV and process each one
-    for index, row in data.iterrows():
-        # if index >= 11:  # Break after processing 10 examples
-        #     break
-
-        ytid = row['ytid']
-        start_s = row['start_s']
-        end_s = row['end_s']
+    # Load the CSV file
+    data = pd.read_csv(args.csv_file)
+    rows = zip(data['ytid'], data['start_s'], data['end_s'])
 
-        if not os.path.exists(output_dir + str(ytid) + ".wav"):
-            output_wav = single_download(ytid, start_s, end_s, output_dir)
+    output_dirs = {rate: os.path.join(args.output_root, f"wav-{rate // 1000}") for rate in OUTPUT_RATES}
+    manifest = Manifest(os.path.join(args.output_root, "manifest.jsonl"))
+    if args.source_dir is not None:
+        fetcher = LocalFileFetcher(args.source_dir)
+    else:
+        fetcher = YoutubeFetcher(os.path.join(args.output_root, "downloads"))
 
-            if output_wav:
-                print(f"Successfully created WAV file: {output_wav}")
-                success_count += 1
-            else:
-                print(f"Failed to create WAV file for ytid: {ytid}")
-                failure_count += 1
-                failed_ytids.append(ytid)
-        else:
-            already_exists_count += 1
+    counts = run_pipeline(rows, fetcher, output_dirs, manifest, num_fetchers=args.num_fetchers, num_decoders=args.num_decoders)
 
     # Report the results
-    print(f"\nTotal successes: {success_count}")
-    print(f"Total failures: {failure_count}")
-    print(f"Already existed: {already_exists_count}")
+    print(f"\nTotal successes: {counts['success']}")
+    print(f"Total failures: {counts['failure']}")
+    print(f"Already existed: {counts['skipped']}")
 
     # Write failed ytids to a file
+    failed_ytids = manifest.failed_ytids()
     if failed_ytids:
-        failed_ids_file = "../data/musiccaps/failed_ytids.txt"
+        failed_ids_file = os.path.join(args.output_root, "failed_ytids.txt")
         with open(failed_ids_file, 'w') as f:
             for failed_ytid in failed_ytids:
                 f.write(f"{failed_ytid}\n")
         print(f"Failed ytids written to {failed_ids_file}")
 
-main()
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import os
+import struct
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+
+# Columns of the cached manifest; one row per .wav file
+MANIFEST_COLUMNS = ["ytid", "file_path", "mtime", "file_size", "sample_rate", "channels",
+                    "bits_per_sample", "num_frames", "duration_s", "truncated", "error"]
+
+def read_wav_header(file_path):
+    """
+    Read the RIFF/WAVE header of a file without touching the sample data.
+    Walks the chunk list up to the `data` chunk and compares its declared size
+    with the bytes actually present in the file.
+    Returns:
+        dict: One manifest row (without mtime/file_size).
+    """
+    row = {"ytid": os.path.splitext(os.path.basename(file_path))[0], "file_path": file_path,
+           "sample_rate": 0, "channels": 0, "bits_per_sample": 0, "num_frames": 0,
+           "duration_s": 0.0, "truncated": False, "error": None}
+    try:
+        with open(file_path, "rb") as f:
+            file_size = os.fstat(f.fileno()).st_size
+            riff, _, wave = struct.unpack("<4sI4s", f.read(12))
+            if riff != b"RIFF" or wave != b"WAVE":
+                raise ValueError("Not a RIFF/WAVE file")
+
+            block_align = None
+            while True:
+                chunk_header = f.read(8)
+                if len(chunk_header) < 8:
+                    raise ValueError("No data chunk")
+                chunk_id, chunk_size = struct.unpack("<4sI", chunk_header)
+                if chunk_id == b"fmt ":
+                    fmt = f.read(chunk_size)
+                    _, channels, sample_rate, _, block_align, bits_per_sample = struct.unpack("<HHIIHH", fmt[:16])
+                    row.update(channels=channels, sample_rate=sample_rate, bits_per_sample=bits_per_sample)
+                    if chunk_size & 1:
+                        f.seek(1, os.SEEK_CUR)
+                elif chunk_id == b"data":
+                    if block_align is None:
+                        raise ValueError("data chunk before fmt chunk")
+                    data_offset = f.tell()
+                    available = file_size - data_offset
+                    # 0xFFFFFFFF marks a streamed file whose size was never patched in
+                    declared = available if chunk_size == 0xFFFFFFFF else chunk_size
+                    # A file shorter than its header claims is flagged and keeps the frames present
+                    data_size = min(declared, available)
+                    row["truncated"] = declared > available
+                    row["num_frames"] = data_size // block_align
+                    row["duration_s"] = row["num_frames"] / row["sample_rate"] if row["sample_rate"] else 0.0
+                    break
+                else:
+                    f.seek(chunk_size + (chunk_size & 1), os.SEEK_CUR)
+    except Exception as e:
+        row["error"] = str(e) or type(e).__name__
+    return row
+
+def build_manifest(audio_dir, cache_path=None, num_workers=None):
+    """
+    Return a manifest of every .wav file in `audio_dir`, re-reading headers only
+    for files that are new or whose mtime/size changed since the cached manifest.
+    Args:
+        audio_dir (str): Directory containing the audio files.
+        cache_path (str): Parquet file to load and update (default: <audio_dir>/manifest.parquet).
+        num_workers (int): Processes used to read headers.
+    Returns:
+        pd.DataFrame: One row per file with the columns in MANIFEST_COLUMNS.
+    """
+    cache_path = cache_path or os.path.join(audio_dir, "manifest.parquet")
+    stats = {}
+    with os.scandir(audio_dir) as entries:
+        for entry in entries:
+            if entry.name.endswith(".wav") and entry.is_file():
+                stat = entry.stat()
+                stats[entry.path] = (stat.st_mtime, stat.st_size)
+
+    cached = pd.DataFrame(columns=MANIFEST_COLUMNS)
+    num_stale = 0
+    if os.path.exists(cache_path):
+        cached = pd.read_parquet(cache_path)
+        unchanged = [stats.get(path) == (mtime, size)
+                     for path, mtime, size in zip(cached["file_path"], cached["mtime"], cached["file_size"])]
+        num_stale = len(unchanged) - sum(unchanged)
+        cached = cached[unchanged]
+
+    to_scan = sorted(set(stats) - set(cached["file_path"]))
+    if to_scan:
+        print(f"Reading headers of {len(to_scan)} files ({len(cached)} unchanged)")
+        with ProcessPoolExecutor(num_workers) as pool:
+            rows = list(pool.map(read_wav_header, to_scan, chunksize=256))
+        for row in rows:
+            row["mtime"], row["file_size"] = stats[row["file_path"]]
+        scanned = pd.DataFrame(rows, columns=MANIFEST_COLUMNS)
+        manifest = pd.concat([cached, scanned], ignore_index=True) if len(cached) else scanned
+    else:
+        manifest = cached.reset_index(drop=True)
+
+    if to_scan or num_stale or not os.path.exists(cache_path):
+        tmp_path = cache_path + ".tmp"
+        manifest.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, cache_path)
+    return manifest
+
+def valid_files(manifest, min_sample_rate=0, min_frames=0):
+    """Boolean mask of manifest rows that parsed, are not truncated and meet the minimums."""
+    return (manifest["error"].isna() & ~manifest["truncated"].astype(bool)
+            & (manifest["sample_rate"] >= min_sample_rate) & (manifest["num_frames"] >= min_frames))
@@ -1,28 +1,16 @@
 import os
 import pandas as pd
-from scipy.io import wavfile
+from audio_manifest import build_manifest, valid_files
 
 # Paths
 split_dir = "../data/splits"  # directory containing train.csv, val.csv, test.csv
 audio_dir = "../data/wav"     # directory containing the audio files
 
-# Function to load audio and check for errors (including length check)
-def check_audio_file(file_path):
-    try:
-        # Try loading the audio file
-        sample_rate, audio_data = wavfile.read(file_path)
-        
-        # Check if file is empty or has a length < 160000 samples
-        if len(audio_data) == 0 or len(audio_data) < 160000:
-            print(len(audio_data))
-            return False
-        return True
-    except Exception as e:
-        # If any error occurs (e.g., file not found, corrupted file), return False
-        return False
-
-# Function to load CSV and check all files
-def check_split_files(split_file):
+# A file passes if its header parses, it is not truncated and it has at least 160000 samples
+MIN_FRAMES = 160000
+
+# Function to load CSV and check all files against the manifest
+def check_split_files(split_file, manifest):
     # Read metadata CSV
     metadata = pd.read_csv(split_file)
     
@@ -30,32 +18,32 @@ def check_split_files(split_file):
     if "ytid" not in metadata.columns:
         print(f"Missing 'ytid' column in {split_file}")
         return []
-    
-    failed_files = []
-    for _, row in metadata.iterrows():
-        file_path = os.path.join(audio_dir, f"{row['ytid']}.wav")
-        if not check_audio_file(file_path):
-            failed_files.append(row['ytid'])
-    
-    return failed_files
-
-# Check all splits
-failed_train_files = check_split_files(os.path.join(split_dir, "train.csv"))
-failed_val_files = check_split_files(os.path.join(split_dir, "val.csv"))
-failed_test_files = check_split_files(os.path.join(split_dir, "test.csv"))
-
-# Output results
-if failed_train_files:
-    print(f"Failed files in train split: {failed_train_files}")
-else:
-    print("All files in train split loaded successfully.")
-
-if failed_val_files:
-    print(f"Failed files in validation split: {failed_val_files}")
-else:
-    print("All files in validation split loaded successfully.")
-
-if failed_test_files:
-    print(f"Failed files in test split: {failed_test_files}")
-else:
-    print("All files in test split loaded successfully.")
+
+    # Files missing from the manifest (i.e. from disk) fail as well
+    passing = set(manifest.loc[valid_files(manifest, min_frames=MIN_FRAMES), "ytid"])
+    return [ytid for ytid in metadata["ytid"] if ytid not in passing]
+
+if __name__ == "__main__":
+    # Headers are read once for all splits and cached between runs
+    manifest = build_manifest(audio_dir)
+
+    # Check all splits
+    failed_train_files = check_split_files(os.path.join(split_dir, "train.csv"), manifest)
+    failed_val_files = check_split_files(os.path.join(split_dir, "val.csv"), manifest)
+    failed_test_files = check_split_files(os.path.join(split_dir, "test.csv"), manifest)
+
+    # Output results
+    if failed_train_files:
+        print(f"Failed files in train split: {failed_train_files}")
+    else:
+        print("All files in train split loaded successfully.")
+
+    if failed_val_files:
+        print(f"Failed files in validation split: {failed_val_files}")
+    else:
+        print("All files in validation split loaded successfully.")
+
+    if failed_test_files:
+        print(f"Failed files in test split: {failed_test_files}")
+    else:
+        print("All files in test split loaded successfully.")
@@ -1,7 +1,7 @@
 import os
 import pandas as pd
 from sklearn.model_selection import train_test_split
-from scipy.io import wavfile
+from audio_manifest import build_manifest, valid_files
 
 # Paths
 audio_dir = "../data/wav"
@@ -27,33 +27,30 @@ ytids_to_ignore = [
     'PRzBkZSSyY0', '-SWaCArvQug'
 ]
 
-# Function to get the sample rate of an audio file
-def get_sample_rate(file_path):
-    try:
-        sample_rate, _ = wavfile.read(file_path)
-        return sample_rate
-    except Exception as e:
-        print(f"Error reading {file_path}: {e}")
-        return None
-
-# Filter out entries where the corresponding .wav file doesn't exist or has a sample rate < 16000, 
-# except for the ytids in ytids_to_ignore
-metadata = metadata[metadata["ytid"].apply(lambda x: x not in ytids_to_ignore)]  # Exclude ytids to ignore
-metadata = metadata[metadata["file_path"].apply(lambda x: os.path.exists(x) and get_sample_rate(x) >= 16000)]
-
-# Split data into train, validation, and test sets
-train_data, test_data = train_test_split(metadata, test_size=0.2, random_state=42)
-train_data, val_data = train_test_split(train_data, test_size=0.1, random_state=42)
-
-# Save splits to CSV files
-os.makedirs(split_save_path, exist_ok=True)
-train_data.to_csv(os.path.join(split_save_path, "train.csv"), index=False)
-val_data.to_csv(os.path.join(split_save_path, "val.csv"), index=False)
-test_data.to_csv(os.path.join(split_save_path, "test.csv"), index=False)
-
-# Print the number of items in each split
-print(f"Number of items in train split: {len(train_data)}")
-print(f"Number of items in validation split: {len(val_data)}")
-print(f"Number of items in test split: {len(test_data)}")
-
-print("Data splits saved!")
+if __name__ == "__main__":
+    # Sample rates come from the cached header-only manifest instead of decoding every file
+    manifest = build_manifest(audio_dir)
+    readable_ytids = set(manifest.loc[valid_files(manifest, min_sample_rate=16000), "ytid"])
+
+    # Filter out entries where the corresponding .wav file doesn't exist or has a sample rate < 16000, 
+    # except for the ytids in ytids_to_ignore
+    metadata = metadata[metadata["ytid"].apply(lambda x: x not in ytids_to_ignore)]  # Exclude ytids to ignore
+    metadata = metadata[metadata["ytid"].isin(readable_ytids)]
+
+    # Split data into train, validation, and test sets
+    train_data, test_data = train_test_split(metadata, test_size=0.2, random_state=42)
+    train_data, val_data = train_test_split(train_data, test_size=0.1, random_state=42)
+
+    # Save splits to CSV files
+    os.makedirs(split_save_path, exist_ok=True)
+    train_data.to_csv(os.path.join(split_save_path, "train.csv"), index=False)
+    val_data.to_csv(os.path.join(split_save_path, "val.csv"), index=False)
+    test_data.to_csv(os.path.join(split_save_path, "test.csv"), index=False)
+
+    # Print the number of items in each split
+    print(f"Number of items in train split: {len(train_data)}")
+    print(f"Number of items in validation split: {len(val_data)}")
+    print(f"Number of items in test split: {len(test_data)}")
+
+    print("Data splits saved!")
+
@@ -1,40 +1,38 @@
-import random
+import argparse
+import json
+import time
 from transformers import SpeechT5Processor, SpeechT5ForSpeechToText
 import torch
-from scipy.io import wavfile
 import os
 import pandas as pd
 import evaluate
 from tqdm import tqdm
-import numpy as np
-from torch.utils.data import Dataset
-from speecht5_train import SAMPLE_RATE, SpeechDataset, NORMALIZING_INPUT
-
-wer = evaluate.load("wer")
+from torch.utils.data import DataLoader
+from speecht5_train import SpeechDataset, collate_speech_batch
 
 # Paths
 split_save_path = "../data/splits"
 model_path = "../models/speecht5-model-e15"  # Path to the saved model
 
-# Load the preprocessed data splits
-train_data = pd.read_csv(os.path.join(split_save_path, "train.csv"))
-val_data = pd.read_csv(os.path.join(split_save_path, "val.csv"))
-test_data = pd.read_csv(os.path.join(split_save_path, "test.csv"))
-
-# Print the number of examples in each dataset
-print(f"Number of training examples: {len(train_data)}")
-print(f"Number of validation examples: {len(val_data)}")
-print(f"Number of test examples: {len(test_data)}")
+def parse_args():
+    parser = argparse.ArgumentParser(description="Batched SpeechT5 evaluation with corpus-level WER.")
+    parser.add_argument('--split', type=str, default="test", choices=["train", "val", "test"], help="Split to evaluate.")
+    parser.add_argument('--model_path', type=str, default=model_path)
+    parser.add_argument('--batch_size', type=int, default=16)
+    parser.add_argument('--num_workers', type=int, default=4, help="DataLoader workers decoding audio in parallel.")
+    parser.add_argument('--max_samples', type=int, default=None, help="Only evaluate the first N examples.")
+    parser.add_argument('--output', type=str, default=None, help="Predictions CSV (default: <split>_predictions.csv next to the model).")
+    return parser.parse_args()
 
 def check_overlap(train_data, val_data, test_data):
     """
     Check if there are overlapping datapoints between train, val, and test datasets.
-    
+
     Args:
         train_data (pd.DataFrame): Training dataset.
         val_data (pd.DataFrame): Validation dataset.
         test_data (pd.DataFrame): Test dataset.
-    
+
     Returns:
         None. Prints the results of the overlap check.
     """
@@ -42,83 +40,103 @@ def check_overlap(train_data, val_data, test_data):
     train_set = set(train_data["file_path"])
     val_set = set(val_data["file_path"])
     test_set = set(test_data["file_path"])
-    
+
     # Check for overlaps
     train_val_overlap = train_set.intersection(val_set)
     train_test_overlap = train_set.intersection(test_set)
     val_test_overlap = val_set.intersection(test_set)
-    
+
     # Print results
     if train_val_overlap:
         print(f"Overlap found between train and val: {len(train_val_overlap)} examples")
     else:
         print("No overlap between train and val.")
-    
+
     if train_test_overlap:
         print(f"Overlap found between train and test: {len(train_test_overlap)} examples")
     else:
         print("No overlap between train and test.")
-    
+
     if val_test_overlap:
         print(f"Overlap found between val and test: {len(val_test_overlap)} examples")
     else:
         print("No overlap between val and test.")
 
-check_overlap(train_data, val_data, test_data)
-
-# Load the processor and model
-processor = SpeechT5Processor.from_pretrained(model_path)
-model = SpeechT5ForSpeechToText.from_pretrained(model_path)
-
-# Move the model to GPU (if available)
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-model.to(device)
-print(f"Device: {device}")
-
-# Prepare DataLoader (though not needed for inference, but we'll use it to sample random examples)
-train_dataset = SpeechDataset(train_data, processor)
-val_dataset = SpeechDataset(val_data, processor)
-test_dataset = SpeechDataset(test_data, processor)
-
-def run_inference(dataset, dataset_name, n_samples=3):
+def run_inference(model, processor, dataset, dataset_name, device, batch_size=16, num_workers=4):
+    """
+    Caption every example of a split in padded batches.
+    Returns:
+        tuple: (predictions, references, stats) where stats holds corpus WER and throughput.
+    """
     model.eval()  # Set model to evaluation mode
-    total_wer = 0
-    random_indices = random.sample(range(len(dataset)), n_samples)
-    s = ""
+    data_loader = DataLoader(dataset, batch_size=batch_size, shuffle=False, num_workers=num_workers, collate_fn=collate_speech_batch)
+    predictions, references = [], []
+    generate_time = 0.0
 
-    for idx in tqdm(random_indices, desc=f"Processing {dataset_name}"):
-        sample = dataset[idx]
-        input_values = sample["input_values"].unsqueeze(0).to(device)
-        true_caption = sample["labels"]
+    start = time.perf_counter()
+    for batch in tqdm(data_loader, desc=f"Processing {dataset_name}"):
+        input_values = batch["input_values"].to(device)
+        attention_mask = batch["attention_mask"].to(device)
 
-        # Generate predictions
+        # Generate predictions for the whole batch
+        generate_start = time.perf_counter()
         with torch.no_grad():
-            generated_ids = model.generate(input_values=input_values)
-            predicted_texts = processor.batch_decode(generated_ids, skip_special_tokens=True)
-
-        # Compute WER
-        decoded_references = [true_caption]
-        total_wer += wer.compute(predictions=predicted_texts, references=decoded_references)
-
-        # Log random samples
-        s += f"\nSample {idx + 1} from {dataset_name}:\n"
-        s += f"True Caption: {true_caption}\n"
-        s += f"Generated Caption: {predicted_texts[0]}\n"
-        s += "-" * 50
-        s += "\n"
-
-    print(s)
-
-    # Calculate average WER for sampled data
-    avg_wer = total_wer / n_samples
-    print(f"\nAverage WER for {dataset_name}: {avg_wer:.4f}")
-
-# Compute WER for train, val, and test datasets
-# print("Processing Train Dataset:")
-# run_inference(train_dataset, "Train")
-
-# print("\nProcessing Validation Dataset:")
-# run_inference(val_dataset, "Validation")
-
-print("\nProcessing Test Dataset:")
-run_inference(test_dataset, "Test")
\ No newline at end of file
+            generated_ids = model.generate(input_values=input_values, attention_mask=attention_mask)
+        generate_time += time.perf_counter() - generate_start
+
+        predictions.extend(processor.batch_decode(generated_ids, skip_special_tokens=True))
+        references.extend(batch["labels"])
+    total_time = time.perf_counter() - start
+
+    # Corpus-level WER: total word errors over total reference words, not a mean of per-sample rates
+    wer = evaluate.load("wer")
+    stats = {
+        "split": dataset_name,
+        "num_examples": len(predictions),
+        "wer": wer.compute(predictions=predictions, references=references),
+        "total_s": total_time,
+        "generate_s": generate_time,
+        "examples_per_sec": len(predictions) / total_time,
+    }
+    return predictions, references, stats
+
+def main():
+    args = parse_args()
+
+    # Load the preprocessed data splits
+    splits = {name: pd.read_csv(os.path.join(split_save_path, f"{name}.csv")) for name in ["train", "val", "test"]}
+
+    # Print the number of examples in each dataset
+    print(f"Number of training examples: {len(splits['train'])}")
+    print(f"Number of validation examples: {len(splits['val'])}")
+    print(f"Number of test examples: {len(splits['test'])}")
+    check_overlap(splits["train"], splits["val"], splits["test"])
+
+    # Load the processor and model
+    processor = SpeechT5Processor.from_pretrained(args.model_path)
+    model = SpeechT5ForSpeechToText.from_pretrained(args.model_path)
+
+    # Move the model to GPU (if available)
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    model.to(device)
+    print(f"Device: {device}")
+
+    data = splits[args.split]
+    if args.max_samples is not None:
+        data = data.iloc[:args.max_samples]
+    dataset = SpeechDataset(data, processor)
+
+    predictions, references, stats = run_inference(model, processor, dataset, args.split, device, args.batch_size, args.num_workers)
+
+    output_path = args.output or os.path.join(args.model_path, f"{args.split}_predictions.csv")
+    pd.DataFrame({"file_path": data["file_path"].values, "caption": references, "prediction": predictions}).to_csv(output_path, index=False)
+    with open(os.path.splitext(output_path)[0] + "_stats.json", "w") as f:
+        json.dump(stats, f, indent=2)
+    print(f"Predictions saved to {output_path}")
+
+    print(f"\nCorpus WER for {args.split}: {stats['wer']:.4f}")
+    print(f"{stats['num_examples']} examples in {stats['total_s']:.1f}s ({stats['examples_per_sec']:.2f} examples/s, "
+          f"{stats['generate_s']:.1f}s in generate)")
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,25 @@
-import evaluate
 from transformers import SpeechT5Processor, SpeechT5ForSpeechToText
 from torch.utils.data import DataLoader, Dataset
 from tqdm import tqdm
 import os
+import sys
+import time
 import pandas as pd
 import torch
-import matplotlib.pyplot as plt
 from scipy.io import wavfile
 import numpy as np
+from wer_worker import WerWorker
+
+# The shared metrics logger lives in caption_generation
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "caption_generation"))
+from metrics_logger import MetricsLogger, system_metrics
 
 SAMPLE_RATE = 16000
 BATCH_SIZE = 8
 NUM_EPOCHS = 5
 NORMALIZING_INPUT = True
+METRIC_EVERY = 20  # Train WER is sampled from every N-th step; loss is still logged every step
+NUM_WORKERS = 4  # DataLoader workers decode audio and tokenize captions off the training loop
 
 class SpeechDataset(Dataset):
     def __init__(self, data, processor, audio_dir="../data/wav"):
@@ -47,6 +54,30 @@ class SpeechDataset(Dataset):
         # Return processed audio and corresponding caption (label)
         return {"input_values": audio_input["input_values"].squeeze(), "labels": caption}
 
+def collate_speech_batch(batch):
+    """
+    Pad input_values to the longest clip in the batch and build the matching attention mask.
+    Captions stay a list of strings.
+    """
+    lengths = [len(item["input_values"]) for item in batch]
+    input_values = torch.zeros(len(batch), max(lengths), dtype=batch[0]["input_values"].dtype)
+    attention_mask = torch.zeros(len(batch), max(lengths), dtype=torch.long)
+    for i, (item, length) in enumerate(zip(batch, lengths)):
+        input_values[i, :length] = item["input_values"]
+        attention_mask[i, :length] = 1
+    return {"input_values": input_values, "attention_mask": attention_mask, "labels": [item["labels"] for item in batch]}
+
+class TrainingCollator:
+    """Pads audio like collate_speech_batch and tokenizes the captions in the DataLoader workers."""
+
+    def __init__(self, processor):
+        self.processor = processor
+
+    def __call__(self, batch):
+        batch = collate_speech_batch(batch)
+        batch["label_ids"] = self.processor(text_target=batch["labels"], padding=True, truncation=True, return_tensors="pt").input_ids
+        return batch
+
 def train():
     # Paths
     split_save_path = "../data/splits"
@@ -72,116 +103,83 @@ def train():
     train_dataset = SpeechDataset(train_data, processor)
     val_dataset = SpeechDataset(val_data, processor)
 
-    train_dataloader = DataLoader(train_dataset, batch_size=BATCH_SIZE, shuffle=True)
-    val_dataloader = DataLoader(val_dataset, batch_size=BATCH_SIZE, shuffle=False)
+    collator = TrainingCollator(processor)
+    train_dataloader = DataLoader(train_dataset, batch_size=BATCH_SIZE, shuffle=True, num_workers=NUM_WORKERS, collate_fn=collator)
+    val_dataloader = DataLoader(val_dataset, batch_size=BATCH_SIZE, shuffle=False, num_workers=NUM_WORKERS, collate_fn=collator)
 
     # 5. Training loop
     optimizer = torch.optim.AdamW(model.parameters(), lr=5e-5)
 
-    # Use WER (Word Error Rate) metric
-    wer = evaluate.load("wer")
+    # Use WER (Word Error Rate) metric, decoded and scored on a background thread
+    wer_worker = WerWorker(processor)
 
-    # Store loss values for plotting
-    # Store metrics for plotting
-    train_losses, val_losses = [], []
-    train_wer_scores, val_wer_scores = [], []
+    # Scalars for offline plotting (python -m scripts.plot from caption_generation)
+    metrics = MetricsLogger(os.path.join(checkpoint_dir, "metrics.jsonl"), run_name="speecht5" + ("_norm" if NORMALIZING_INPUT else ""))
 
     for epoch in range(NUM_EPOCHS):
         model.train()
         total_train_loss = 0
-        total_train_wer = 0
-        for batch in tqdm(train_dataloader, desc=f"Epoch {epoch + 1}/{NUM_EPOCHS}"):
+        progress = tqdm(train_dataloader, desc=f"Epoch {epoch + 1}/{NUM_EPOCHS}")
+        epoch_start = step_start = time.perf_counter()
+        for step, batch in enumerate(progress):
             input_values = batch["input_values"].to(device)  # Move input values to GPU
-            labels = batch["labels"]
-
-            # Tokenize the labels (captions) into IDs
-            labels = processor(text_target=labels, padding=True, truncation=True, return_tensors="pt").input_ids.to(device)
+            labels = batch["label_ids"].to(device)  # Tokenized by the DataLoader workers
 
             # Forward pass
-            outputs = model(input_values, labels=labels)
+            outputs = model(input_values, attention_mask=batch["attention_mask"].to(device), labels=labels)
             loss = outputs.loss
-            total_train_loss += loss.item()
+            loss_value = loss.item()
+            total_train_loss += loss_value
+            progress.set_postfix(loss=f"{loss_value:.4f}")
 
             # Backward pass
             optimizer.zero_grad()
             loss.backward()
             optimizer.step()
 
-            # Calculate train WER
-            with torch.no_grad():
-                predictions = outputs.logits.argmax(dim=-1)
-                predicted_texts = processor.batch_decode(predictions, skip_special_tokens=True)
-                decoded_references = processor.batch_decode(labels, skip_special_tokens=True)
-                total_train_wer += wer.compute(predictions=predicted_texts, references=decoded_references)
+            # Sample train WER every METRIC_EVERY steps; decoding happens off this loop
+            if step % METRIC_EVERY == 0:
+                wer_worker.submit(("train", epoch), outputs.logits.argmax(dim=-1).detach().cpu(), batch["label_ids"])
+
+            step_end = time.perf_counter()
+            metrics.log_step(step + 1, epoch=epoch + 1, loss=loss_value, lr=optimizer.param_groups[0]["lr"],
+                             step_s=step_end - step_start, clips_per_sec=len(input_values) / (step_end - step_start))
+            step_start = step_end
+        train_time = time.perf_counter() - epoch_start
 
         avg_train_loss = total_train_loss / len(train_dataloader)
-        avg_train_wer = total_train_wer / len(train_dataloader)
-        train_losses.append(avg_train_loss)
-        train_wer_scores.append(avg_train_wer)
-        print(f"Epoch {epoch + 1} - Train Loss: {avg_train_loss}, Train WER: {avg_train_wer}")
+        avg_train_wer = wer_worker.compute(("train", epoch))
+        print(f"Epoch {epoch + 1} - Train Loss: {avg_train_loss}, Train WER (every {METRIC_EVERY} steps): {avg_train_wer}")
 
         # Validation
         model.eval()
         total_val_loss = 0
-        total_val_wer = 0
         for batch in tqdm(val_dataloader, desc="Validation"):
             input_values = batch["input_values"].to(device)
-            labels = batch["labels"]
-
-            # Tokenize the labels (captions) for validation
-            labels = processor(text_target=labels, padding=True, truncation=True, return_tensors="pt").input_ids.to(device)
+            labels = batch["label_ids"].to(device)
 
             with torch.no_grad():
-                outputs = model(input_values, labels=labels)
+                outputs = model(input_values, attention_mask=batch["attention_mask"].to(device), labels=labels)
                 total_val_loss += outputs.loss.item()
 
-                # Calculate WER
-                predictions = outputs.logits.argmax(dim=-1)
-                predicted_texts = processor.batch_decode(predictions, skip_special_tokens=True)
-                decoded_references = processor.batch_decode(labels, skip_special_tokens=True)
-                total_val_wer += wer.compute(predictions=predicted_texts, references=decoded_references)
+                # Calculate WER on every validation batch
+                wer_worker.submit(("val", epoch), outputs.logits.argmax(dim=-1).cpu(), batch["label_ids"])
 
         avg_val_loss = total_val_loss / len(val_dataloader)
-        avg_val_wer = total_val_wer / len(val_dataloader)
-        val_losses.append(avg_val_loss)
-        val_wer_scores.append(avg_val_wer)
+        avg_val_wer = wer_worker.compute(("val", epoch))
         print(f"Epoch {epoch + 1} - Validation Loss: {avg_val_loss}, Validation WER: {avg_val_wer}")
 
-        # Plot Train vs Validation Loss
-        plt.figure(figsize=(10, 6))
-        plt.plot(range(1, epoch + 2), train_losses, marker='o', label="Train Loss")
-        plt.plot(range(1, epoch + 2), val_losses, marker='o', label="Validation Loss")
-        plt.xlabel("Epoch")
-        plt.ylabel("Loss")
-        plt.title("Train and Validation Loss Over Epochs")
-        plt.legend()
-        plt.grid(True)
-        if NORMALIZING_INPUT:
-            plt.savefig("loss_plot" + str(NUM_EPOCHS) + "_norm.jpg")
-        else:
-            plt.savefig("loss_plot_e" + str(NUM_EPOCHS) + ".jpg")
-        plt.close()
-
-        # Plot Train vs Validation WER
-        plt.figure(figsize=(10, 6))
-        plt.plot(range(1, epoch + 2), train_wer_scores, marker='o', label="Train WER")
-        plt.plot(range(1, epoch + 2), val_wer_scores, marker='o', label="Validation WER")
-        plt.xlabel("Epoch")
-        plt.ylabel("WER")
-        plt.title("Train and Validation WER Over Epochs")
-        plt.legend()
-        plt.grid(True)
-        if NORMALIZING_INPUT:
-            plt.savefig("wer_plot_e" + str(NUM_EPOCHS) + "_norm.jpg")
-        else:
-            plt.savefig("wer_plot_e" + str(NUM_EPOCHS) + ".jpg")
-        plt.close()
+        metrics.log_epoch(epoch + 1, train_loss=avg_train_loss, val_loss=avg_val_loss, train_wer=avg_train_wer, val_wer=avg_val_wer,
+                          train_time_s=train_time, clips_per_sec=len(train_dataset) / train_time, **system_metrics(optimizer))
 
         # Save checkpoint after each epoch
         checkpoint_path = os.path.join(checkpoint_dir, f"checkpoint_epoch_{epoch + 1}")
         model.save_pretrained(checkpoint_path)
         processor.save_pretrained(checkpoint_path)
 
+    wer_worker.close()
+    metrics.close()
+
     # 8. Save the final model and processor
     final_model_path = os.path.join(checkpoint_dir, f"final_model_epoch_{NUM_EPOCHS}")
     if NORMALIZING_INPUT:
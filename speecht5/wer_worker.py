@@ -0,0 +1,55 @@
+import queue
+import threading
+import evaluate
+
+class WerWorker:
+    """
+    Decodes predicted and reference token ids and accumulates them per key
+    (e.g. ("train", epoch)) on a background thread, so batch_decode never runs
+    on the training loop. Submit detached CPU tensors; compute() waits for the
+    queued batches of a key and returns their corpus-level WER.
+    """
+
+    def __init__(self, processor, max_pending=64):
+        self.processor = processor
+        self.wer = evaluate.load("wer")
+        self._texts = {}
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._error = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            try:
+                if job is None:
+                    return
+                key, prediction_ids, label_ids = job
+                predictions = self.processor.batch_decode(prediction_ids, skip_special_tokens=True)
+                references = self.processor.batch_decode(label_ids, skip_special_tokens=True)
+                texts = self._texts.setdefault(key, ([], []))
+                texts[0].extend(predictions)
+                texts[1].extend(references)
+            except Exception as e:
+                self._error = e
+            finally:
+                self._queue.task_done()
+
+    def submit(self, key, prediction_ids, label_ids):
+        """Queue one batch; blocks only if the worker is max_pending batches behind."""
+        self._queue.put((key, prediction_ids, label_ids))
+
+    def compute(self, key):
+        """Corpus WER over every batch submitted under `key` (None if there were none)."""
+        self._queue.join()
+        if self._error is not None:
+            raise self._error
+        predictions, references = self._texts.pop(key, ([], []))
+        if not predictions:
+            return None
+        return self.wer.compute(predictions=predictions, references=references)
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()